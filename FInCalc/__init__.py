@@ -1,14 +1,71 @@
-# Imports.
-from .utils import update_plot_layout, get_plotly_colors, display_palette_as_gradient, format_number
-from .calculators import compound_interest, simple_interest
-from .plot_compound_interest import plot_compound_interest
-from .plot_simple_interest import plot_simple_interest
-
-__all__ = ["update_plot_layout",
-           "simple_interest",
-           "compound_interest",
-           "plot_compound_interest",
-           "plot_simple_interest",
-           "get_plotly_colors",
-           "display_palette_as_gradient",
-           "format_number"]
\ No newline at end of file
+import importlib
+
+# Public names and the submodule defining them. Submodules are imported on first access, so the
+# computational core (calculators, simulation) loads without Streamlit or Plotly.
+_EXPORTS = {"update_plot_layout": "utils",
+            "get_plotly_colors": "utils",
+            "display_palette_as_gradient": "utils",
+            "format_number": "utils",
+            "simple_interest": "calculators",
+            "compound_interest": "calculators",
+            "compound_interest_grid": "calculators",
+            "compound_interest_batch": "calculators",
+            "simple_interest_batch": "calculators",
+            "cached_compound_interest": "calculators",
+            "cached_simple_interest": "calculators",
+            "ProjectionResult": "results",
+            "plot_compound_interest": "plot_compound_interest",
+            "plot_compound_interest_heatmap": "plot_compound_interest",
+            "cached_plot_compound_interest": "plot_compound_interest",
+            "restyle_compound_interest": "plot_compound_interest",
+            "restyle_compound_interest_heatmap": "plot_compound_interest",
+            "plot_simple_interest": "plot_simple_interest",
+            "cached_plot_simple_interest": "plot_simple_interest",
+            "restyle_simple_interest": "plot_simple_interest",
+            "plot_retirement": "plot_retirement",
+            "plot_portfolio": "plot_portfolio",
+            "restyle_portfolio": "plot_portfolio",
+            "CompactFigure": "utils",
+            "RetainedFigure": "rendering",
+            "Prefetcher": "prefetch",
+            "neighbouring_inputs": "prefetch",
+            "yearly_schedule": "schedule",
+            "cash_flow_schedule": "schedule",
+            "schedule_interest": "schedule",
+            "schedule_interest_batch": "schedule",
+            "cached_schedule_interest": "schedule",
+            "solve_contribution": "solver",
+            "solve_years": "solver",
+            "solve_rate": "solver",
+            "cache_info": "cache",
+            "clear_caches": "cache",
+            "configure_caches": "cache",
+            "simulate_retirement": "simulation",
+            "simulate_retirement_parallel": "simulation",
+            "simulate_retirement_streaming": "simulation",
+            "safe_withdrawal_rate": "simulation",
+            "cached_simulate_retirement": "simulation",
+            "cached_simulate_retirement_parallel": "simulation",
+            "cached_simulate_retirement_streaming": "simulation",
+            "cached_safe_withdrawal_rate": "simulation",
+            "withdrawal_paths": "kernels",
+            "simulate_portfolio": "portfolio",
+            "cached_simulate_portfolio": "portfolio",
+            "Profiler": "profiling",
+            "CalculatorServer": "server",
+            "load_historical_returns": "historical",
+            "FInCalcError": "errors",
+            "NegativeReturnError": "errors"}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,480 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .results import ProjectionResult
+
+# Parameters given as percentages. They are turned into fractions in the cache keys.
+PERCENTAGE_PARAMETERS = ("annual_rate", "ter", "annual_return", "return_volatility", "inflation_rate", "inflation_volatility", "withdrawal_rate",
+                         "weights", "expected_returns", "volatilities", "threshold")
+
+# Decimal digits kept when rounding floats in the cache keys.
+KEY_DIGITS = 10
+
+# Version of the computations, part of every disk cache key. Bump it when a change alters the results of a
+# persisted function, so entries written by older code are not read back.
+ENGINE_VERSION = 1
+
+# Directory and size bound of the disk cache. An empty FINCALC_CACHE_DIR disables it.
+DISK_CACHE_DIR = os.environ.get("FINCALC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fincalc"))
+DISK_CACHE_BYTES = 1 << 30
+
+# Seconds after which the staging directory of an interrupted write is removed.
+STALE_SECONDS = 3600
+
+# Every cache created by memoize, by name, and the disk cache.
+CACHES = {}
+
+class LRUCache:
+    """
+    Size-bounded, thread-safe least recently used cache with hit and miss counters.
+    """
+    def __init__(self, maxsize = 128):
+        """
+        :param maxsize: Maximum number of entries kept. The least recently used entry is evicted first.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default = None):
+        """
+        Return the entry stored under key, counting a hit or a miss.
+
+        :param key: Hashable key.
+        :param default: Value returned on a miss.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries beyond maxsize.
+
+        :param key: Hashable key.
+        :param value: Value to store.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last = False)
+
+    def resize(self, maxsize):
+        """
+        Change the maximum number of entries, evicting the least recently used ones if needed.
+
+        :param maxsize: New maximum number of entries.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last = False)
+
+    def clear(self):
+        """
+        Drop every entry and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        :return: Dictionary with "hits", "misses", "hit_rate", "size" and "maxsize".
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize}
+
+def _save_value(directory, name, value):
+    """
+    Write one value of a result in an entry directory.
+
+    :param directory: Entry directory.
+    :param name: Prefix of the files of the value.
+    :param value: Array, DataFrame, scalar, or list or tuple of scalars.
+    :return: Description of the value in the index of the entry.
+    :raises TypeError: If the value can not be stored.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("Arrays of objects can not be stored in the disk cache.")
+        np.save(os.path.join(directory, f"{name}.npy"), value, allow_pickle = False)
+        return {"type": "ndarray", "file": f"{name}.npy", "size": int(value.size)}
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        if not value.index.equals(pd.RangeIndex(len(value))):
+            raise TypeError("Only DataFrames with a default index can be stored in the disk cache.")
+        return {"type": "DataFrame",
+                "columns": [str(column) for column in value.columns],
+                "values": [_save_value(directory, f"{name}.{i}", value[column].to_numpy()) for i, column in enumerate(value.columns)]}
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        items = [_save_value(directory, f"{name}.{i}", item) for i, item in enumerate(value)]
+        if any(item["type"] != "value" for item in items):
+            raise TypeError("Only lists and tuples of scalars can be stored in the disk cache.")
+        return {"type": type(value).__name__, "value": [item["value"] for item in items]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"type": "value", "value": value}
+    raise TypeError(f"Values of type {type(value).__name__} can not be stored in the disk cache.")
+
+def _load_value(directory, entry):
+    """
+    Read one value of a result back from an entry directory. Arrays are memory-mapped and read-only.
+
+    :param directory: Entry directory.
+    :param entry: Description of the value in the index of the entry.
+    """
+    if entry["type"] == "ndarray":
+        # Empty files can not be mapped.
+        array = np.load(os.path.join(directory, entry["file"]), mmap_mode = "r" if entry["size"] else None, allow_pickle = False)
+        return array.view(np.ndarray)
+    if entry["type"] == "DataFrame":
+        import pandas as pd
+        return pd.DataFrame({column: _load_value(directory, item) for column, item in zip(entry["columns"], entry["values"])})
+    if entry["type"] == "tuple":
+        return tuple(entry["value"])
+    return entry["value"]
+
+class DiskCache:
+    """
+    Size-bounded cache of results on disk, shared by every process and session using the same directory.
+
+    Entries are directories named after a SHA-256 digest of the normalized call and ENGINE_VERSION. Arrays, including
+    the columns of DataFrames, are .npy files loaded memory-mapped and read-only, so concurrent readers share the
+    page cache; other values are kept in the JSON index of the entry. An entry is written in a staging directory and
+    renamed into place, so readers only ever see complete entries. Reads refresh the modification time of an entry,
+    and writes evict the least recently used entries beyond max_bytes.
+    """
+    def __init__(self, directory = DISK_CACHE_DIR, max_bytes = DISK_CACHE_BYTES):
+        """
+        :param directory: Directory of the entries, created on the first write. None or "" disables the cache.
+        :param max_bytes: Maximum total size of the entries, in bytes.
+        """
+        self.directory = directory or None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr((ENGINE_VERSION, key)).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, default = None):
+        """
+        Return the result stored under key, counting a hit or a miss.
+
+        :param key: Key built by make_key.
+        :param default: Value returned on a miss.
+        """
+        if self.directory is None:
+            self._count(False)
+            return default
+
+        path = self._path(key)
+        try:
+            # Refresh the entry first, so a concurrent sweep keeps it.
+            os.utime(path)
+            with open(os.path.join(path, "index.json")) as file:
+                index = json.load(file)
+            result = {name: _load_value(path, entry) for name, entry in index.items()}
+        except (OSError, ValueError):
+            self._count(False)
+            return default
+
+        self._count(True)
+        return result
+
+    def put(self, key, result):
+        """
+        Store a result under key, then evict the least recently used entries beyond max_bytes. Failing writes (read-only
+        or full disk) leave the cache unchanged.
+
+        :param key: Key built by make_key.
+        :param result: Dictionary of name -> array, DataFrame with a default index, scalar, or list or tuple of scalars.
+        :raises TypeError: If a value can not be stored.
+        """
+        if self.directory is None:
+            return
+
+        path = self._path(key)
+        if os.path.isdir(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            staging = tempfile.mkdtemp(prefix = ".tmp-", dir = os.path.dirname(path))
+        except OSError:
+            return
+
+        try:
+            index = {name: _save_value(staging, str(i), value) for i, (name, value) in enumerate(result.items())}
+            with open(os.path.join(staging, "index.json"), "w") as file:
+                json.dump(index, file)
+            # Fails if another process stored the same entry first, whose copy is kept.
+            os.rename(staging, path)
+        except OSError:
+            return
+        finally:
+            shutil.rmtree(staging, ignore_errors = True)
+
+        self._sweep()
+
+    def _entries(self):
+        """
+        :return: List of (modification time, bytes, path) of every entry. Interrupted writes are removed on the way.
+        """
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    modified = entry.stat().st_mtime
+                    if entry.name.startswith(".tmp-"):
+                        if time.time() - modified > STALE_SECONDS:
+                            shutil.rmtree(entry.path, ignore_errors = True)
+                        continue
+                    entries.append((modified, sum(item.stat().st_size for item in os.scandir(entry.path)), entry.path))
+                except OSError:
+                    # Evicted by another process meanwhile.
+                    continue
+        return entries
+
+    def _sweep(self):
+        try:
+            entries = self._entries()
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors = True)
+            total -= size
+
+    def resize(self, max_bytes):
+        """
+        Change the maximum total size of the entries, evicting the least recently used ones if needed.
+
+        :param max_bytes: New maximum size, in bytes.
+        """
+        self.max_bytes = max_bytes
+        if self.directory is not None and os.path.isdir(self.directory):
+            self._sweep()
+
+    def clear(self):
+        """
+        Drop every entry, for every process using the directory, and reset the counters.
+        """
+        if self.directory is not None and os.path.isdir(self.directory):
+            for shard in os.scandir(self.directory):
+                if shard.is_dir():
+                    shutil.rmtree(shard.path, ignore_errors = True)
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        :return: Dictionary with "hits", "misses", "hit_rate", "size" (entries), "bytes" and "max_bytes".
+        """
+        try:
+            entries = self._entries() if self.directory is not None and os.path.isdir(self.directory) else []
+        except OSError:
+            entries = []
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes}
+
+CACHES["disk"] = DiskCache()
+
+def normalize(value, percentage = False):
+    """
+    Turn a parameter value into a hashable, normalized form for cache keys.
+
+    Numbers are rounded to KEY_DIGITS decimals (so 5 and 5.0 share a key), percentages become fractions,
+    sequences become tuples and arrays, DataFrames and ProjectionResults are replaced by a digest of their content.
+
+    :param value: Parameter value.
+    :param percentage: Whether the value is a percentage.
+    """
+    if value is None or isinstance(value, (bool, np.bool_, str)):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value) / 100 if percentage else float(value)
+        return round(value, KEY_DIGITS)
+    # A DataFrame can only be passed in once pandas has been imported.
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        digest = hashlib.sha1(pd.util.hash_pandas_object(value, index = True).values.tobytes()).hexdigest()
+        return ("DataFrame", tuple(value.columns), digest)
+    if isinstance(value, ProjectionResult):
+        return ("ProjectionResult", tuple(value.columns), normalize(value.stored()), normalize(value.constants()))
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return ("ndarray", value.shape, value.dtype.str, digest)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item, percentage) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item, percentage)) for key, item in value.items()))
+    raise TypeError(f"Can not build a cache key from a value of type {type(value).__name__}.")
+
+def bind_arguments(func, args, kwargs):
+    """
+    :return: Dictionary of parameter name -> value of a call, defaults included.
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return bound.arguments
+
+def make_key(func, args, kwargs, ignore = (), arguments = None):
+    """
+    Build the cache key of a call from its bound and normalized arguments, defaults included.
+
+    :param func: Function being called.
+    :param args: Positional arguments of the call.
+    :param kwargs: Keyword arguments of the call.
+    :param ignore: Parameters left out of the key, e.g. ones the results do not depend on.
+    :param arguments: Arguments already returned by bind_arguments for this call, to skip binding them again.
+    """
+    arguments = bind_arguments(func, args, kwargs) if arguments is None else arguments
+    return (func.__qualname__,) + tuple((name, normalize(value, name in PERCENTAGE_PARAMETERS))
+                                        for name, value in arguments.items() if name not in ignore)
+
+def _bypassed(arguments, uncached):
+    """
+    :return: Whether a call takes one of the parameter values of uncached, so its result is not cached.
+    """
+    return any(name in arguments and (arguments[name] is None if value is None else bool(arguments[name]) == value)
+               for name, value in uncached.items())
+
+def memoize(maxsize = 128, name = None, ignore = (), uncached = None):
+    """
+    Decorator caching the results of a function in an LRUCache keyed on its normalized parameters.
+
+    It does not depend on Streamlit: the cache lives in the process and is shared by every session of the app,
+    and the same functions keep working headless. Cached results are shared, so treat them as read-only.
+
+    :param maxsize: Maximum number of results kept.
+    :param name: Name of the cache in CACHES. Defaults to the name of the function.
+    :param ignore: Parameters left out of the key, e.g. ones the results do not depend on.
+    :param uncached: Dictionary of parameter -> value (True, False or None) for which calls bypass the cache,
+                     e.g. {"return_paths": True} for results too large to keep.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize = maxsize)
+        CACHES[name or func.__name__] = cache
+        missing = object()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = bind_arguments(func, args, kwargs)
+            if uncached and _bypassed(arguments, uncached):
+                return func(*args, **kwargs)
+
+            key = make_key(func, args, kwargs, ignore = ignore, arguments = arguments)
+            result = cache.get(key, missing)
+            if result is missing:
+                result = func(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+def persist(ignore = (), uncached = None):
+    """
+    Decorator storing the results of a function in the disk cache (CACHES["disk"]), keyed on its module and normalized
+    parameters, so they survive restarts and are shared by every process. Calls with a seed of None draw fresh random
+    numbers and are neither stored nor read back.
+
+    The function must return a dictionary of values DiskCache can store. Results read back hold read-only arrays.
+
+    :param ignore: Parameters left out of the key, e.g. ones the results do not depend on.
+    :param uncached: Dictionary of parameter -> value (True, False or None) for which calls bypass the cache.
+    """
+    uncached = {"seed": None, **(uncached or {})}
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = bind_arguments(func, args, kwargs)
+            if _bypassed(arguments, uncached):
+                return func(*args, **kwargs)
+
+            key = (func.__module__,) + make_key(func, args, kwargs, ignore = ignore, arguments = arguments)
+            cache = CACHES["disk"]
+            result = cache.get(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+def cache_info():
+    """
+    :return: Dictionary with the LRUCache.info() of every cache, by name.
+    """
+    return {name: cache.info() for name, cache in CACHES.items()}
+
+def clear_caches():
+    """
+    Drop every entry of every cache, the disk cache included.
+    """
+    for cache in CACHES.values():
+        cache.clear()
+
+def configure_caches(**maxsizes):
+    """
+    Change the maximum number of entries of the caches, by name. E.g. configure_caches(compound_interest = 512).
+    The bound of the disk cache is in bytes: configure_caches(disk = 2 ** 31).
+    """
+    for name, maxsize in maxsizes.items():
+        CACHES[name].resize(maxsize)
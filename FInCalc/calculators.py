@@ -1,13 +1,125 @@
-import pandas as pd
-import streamlit as st
+import functools
 
-def compound_interest(principal = 1500, 
-                      annual_rate = 5, 
-                      times_compounded = 12, 
-                      years = 35, 
-                      contribution = 100, 
-                      ter = 0, 
-                      inflation = False):
+import numpy as np
+
+from .cache import memoize
+from .errors import NegativeReturnError
+from .results import ProjectionResult
+
+# Columns of compound_interest, in order.
+COMPOUND_COLUMNS = ["Year",
+                    "Initial Investment",
+                    "Interest over Initial Investment",
+                    "Total Initial investment",
+                    "Contributions",
+                    "Interest over Contributions",
+                    "Total Contributions",
+                    "Interest",
+                    "Total Show",
+                    "Total"]
+
+# Columns of the batch calculators, with one row per scenario instead of one per year.
+BATCH_COLUMNS = COMPOUND_COLUMNS[1:-1]
+
+# Columns of the compound interest results that are derived from the stored ones.
+def _interest_over_initial_investment(result):
+    return result["Total Initial investment"] - result["Initial Investment"]
+
+def _interest_over_contributions(result):
+    return result["Total Contributions"] - result["Contributions"]
+
+def _interest(result):
+    return result["Interest over Initial Investment"] + result["Interest over Contributions"]
+
+def _total_show(result):
+    return result["Total Initial investment"] + result["Total Contributions"]
+
+COMPOUND_DERIVED = {"Interest over Initial Investment": _interest_over_initial_investment,
+                    "Interest over Contributions": _interest_over_contributions,
+                    "Interest": _interest,
+                    "Total Show": _total_show}
+
+# Parameter columns of compound_interest_grid, in the order of its axes.
+GRID_PARAMETERS = ["Annual Rate", "TER", "Contribution", "Times Compounded", "Years"]
+
+def _grid_axis(result, axis, position, shape):
+    """
+    Repeat the values of one axis of compound_interest_grid over the flattened scenarios.
+    """
+    axis_shape = [1] * len(shape)
+    axis_shape[position] = len(axis)
+    return np.broadcast_to(axis.reshape(axis_shape), shape).ravel()
+
+def _grid_contributions(result, axes, shape):
+    annual_rate, ter, contribution, times_compounded, years = np.ix_(*axes)
+    return np.broadcast_to(contribution * times_compounded * years, shape).ravel()
+
+def _grid_interest(result, principal):
+    return result["Total Show"] - principal - result["Contributions"]
+
+def _effective_return(annual_rate, ter, inflation, inflation_rate = 2):
+    """
+    Compute the effective return used by the compound interest calculators.
+
+    :param annual_rate: Annual interest rate (as a percentage). Scalars or arrays.
+    :param ter: total expense ratio to apply to the annual rate. Scalars or arrays.
+    :param inflation: apply an inflation rate to the outcome. Scalars or boolean arrays.
+    :param inflation_rate: Inflation rate applied (as a percentage). Scalars or arrays.
+    :return: Effective return as a fraction.
+    """
+    # Turn rates from percentage to fraction.
+    annual_rate = annual_rate / 100
+    ter = ter / 100
+    inflation_rate = inflation_rate / 100
+
+    # Substract TER from nominal return.
+    return_after_ter = annual_rate - ter
+
+    # Adjust annual rate for inflation: Effective return.
+    # Formula Effective return = ((1 + Return after TER) / (1 + Inflation Rate)) - 1
+    return_after_inflation = ((1 + return_after_ter) / (1 + inflation_rate)) - 1
+    if np.ndim(inflation) == 0:
+        effective_return = return_after_inflation if inflation else return_after_ter
+    else:
+        effective_return = np.where(inflation, return_after_inflation, return_after_ter)
+
+    return effective_return
+
+def _future_values(principal, effective_return, times_compounded, years, contribution):
+    """
+    Future value of the principal and of the regular contributions, for broadcastable arrays of parameters.
+
+    :param principal: Initial amount of money.
+    :param effective_return: Effective return as a fraction.
+    :param times_compounded: Number of times interest is compounded per year.
+    :param years: Number of years the money is invested.
+    :param contribution: Regular contribution added each compounding period.
+    :return: Tuple of (future value of the principal, future value of the contributions), NaN where the return is negative.
+    """
+    periods = times_compounded * years
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        # Calculate future value of the principal
+        growth = np.float_power(1 + effective_return / times_compounded, periods)
+        amount = principal * growth
+
+        # Calculate future value of regular contributions. With no interest, no future values.
+        future_value_of_contributions = np.where(effective_return == 0,
+                                                 0.0,
+                                                 contribution * (growth - 1) / (effective_return / times_compounded))
+
+    negative = effective_return < 0
+    return np.where(negative, np.nan, amount), np.where(negative, np.nan, future_value_of_contributions)
+
+def compound_interest(principal = 1500,
+                      annual_rate = 5,
+                      times_compounded = 12,
+                      years = 35,
+                      contribution = 100,
+                      ter = 0,
+                      inflation = False,
+                      inflation_rate = 2,
+                      as_frame = True):
     """
     Calculate the compound interest of an investment with regular contributions and compare it to a simple savings scenario.
 
@@ -18,90 +130,184 @@ def compound_interest(principal = 1500,
     :param contribution: Regular contribution added each compounding period.
     :param ter: total expense ratio to apply to the annual rate.
     :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult with the same columns.
     :return: DataFrame with the compound interest  of the investment, contributions, and simple savings for each year.
+    :raises NegativeReturnError: If the return after TER and inflation is negative.
     """
-    # Prepare a list to hold data for each year
-    data = []
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
 
-    # Turn rates from percentage to fraction.
-    annual_rate /= 100
-    ter /= 100
-    inflation_rate = 2 / 100 if inflation else 0
-    
-    # Substract TER from nominal return.
-    return_after_ter = annual_rate - ter
-
-    # Adjust annual rate for inflation: Effective return.
-    # Formula Effective return = ((1 + Return after TER) / (1 + Inflation Rate)) - 1
-    return_after_inflation = ((1 + return_after_ter) / (1 + inflation_rate)) - 1
-    effective_return = return_after_inflation if inflation else return_after_ter
-    
     if effective_return < 0:
-        st.error("Negative returns are not allowed in this calculator! This is due to Annual Growth Rate - TER or the fact that after applying inflation, the returns go to the negative.")
-        return pd.DataFrame()
-
-    for year in range(1, years + 1):
-        if effective_return == 0:
-            # With no interest, no future values.
-            amount = principal 
-
-            # Calculate future value of regular contributions
-            future_value_of_contributions = contribution * (1 ** (times_compounded * year) - 1)
-
-            # Total future value with compound interest
-            future_value_with_interest = amount + future_value_of_contributions
-            
-            # Calculate future value if saved (no interest)
-            future_value_savings = principal + contribution * times_compounded * year
-
-            interest_over_initial_investment = amount - principal
-            contributions = future_value_savings - principal
-            interest_over_contributions = 0
-            total_interest = interest_over_initial_investment + interest_over_contributions
-        else:
-            # Calculate future value of the principal
-            amount = principal * (1 + effective_return / times_compounded) ** (times_compounded * year)
-            
-            # Calculate future value of regular contributions
-            future_value_of_contributions = contribution * ((1 + effective_return / times_compounded) ** (times_compounded * year) - 1) / (effective_return / times_compounded)
-            
-            # Total future value with compound interest
-            future_value_with_interest = amount + future_value_of_contributions
-
-            # Calculate future value if saved (no interest)
-            future_value_savings = principal + contribution * times_compounded * year
-            
-            interest_over_initial_investment = amount - principal
-            contributions = future_value_savings - principal
-            interest_over_contributions = future_value_of_contributions - contributions
-            total_interest = interest_over_initial_investment + interest_over_contributions
-            
-
-        # Append the results to the list
-        data.append({
-            'Year': year,
-            "Initial Investment": principal,
-            "Interest over Initial Investment": interest_over_initial_investment,
-            'Total Initial investment': amount,
-            'Contributions': contributions,
-            'Interest over Contributions': interest_over_contributions,
-            'Total Contributions': future_value_of_contributions,
-            "Interest": total_interest,
-            "Total Show": future_value_with_interest,
-            'Total': 0,
-        })
-
-    # Create a DataFrame from the list
-    df = pd.DataFrame(data)
-    
-    return df
-
-
-
-def simple_interest(principal = 1500, 
-                    annual_rate = 5, 
-                    years = 35, 
-                    inflation = False):
+        raise NegativeReturnError("Negative returns are not allowed in this calculator! This is due to Annual Growth Rate - TER or the fact that after applying inflation, the returns go to the negative.")
+
+    # All years are computed at once as columns.
+    year = np.arange(1, years + 1)
+
+    if effective_return == 0:
+        # With no interest, no future values.
+        amount = np.full(year.shape, principal)
+
+        # Calculate future value of regular contributions
+        future_value_of_contributions = contribution * (1 ** (times_compounded * year) - 1)
+
+        # Calculate future value if saved (no interest)
+        future_value_savings = principal + contribution * times_compounded * year
+
+        contributions = future_value_savings - principal
+        stored = {"Interest over Contributions": np.zeros(year.shape, dtype = int)}
+    else:
+        # Growth factor of every year, computed once and reused.
+        # float_power goes through libm pow, same as the scalar ** operator.
+        growth = np.float_power(1 + effective_return / times_compounded, times_compounded * year)
+
+        # Calculate future value of the principal
+        amount = principal * growth
+
+        # Calculate future value of regular contributions
+        future_value_of_contributions = contribution * (growth - 1) / (effective_return / times_compounded)
+
+        # Calculate future value if saved (no interest)
+        future_value_savings = principal + contribution * times_compounded * year
+
+        contributions = future_value_savings - principal
+        stored = {}
+
+    # Store the independent columns only: interests and totals are derived when first read.
+    result = ProjectionResult({'Year': year,
+                               'Total Initial investment': amount,
+                               'Contributions': contributions,
+                               'Total Contributions': future_value_of_contributions,
+                               **stored},
+                              constants = {"Initial Investment": principal, 'Total': 0},
+                              derived = COMPOUND_DERIVED,
+                              order = COMPOUND_COLUMNS)
+
+    # pandas is only loaded once a frame is built.
+    return result.to_frame() if as_frame else result
+
+
+
+def compound_interest_grid(principal = 1500,
+                           annual_rate = 5,
+                           times_compounded = 12,
+                           years = 35,
+                           contribution = 100,
+                           ter = 0,
+                           inflation = False,
+                           inflation_rate = 2,
+                           tidy = False,
+                           as_frame = True):
+    """
+    Evaluate the final value of compound_interest over a grid of scenarios in a single vectorized pass.
+
+    Each of annual_rate, ter, contribution, times_compounded and years accepts a scalar, a list, a range or a
+    1D array. Every parameter becomes one axis of the grid, in the order
+    (annual_rate, ter, contribution, times_compounded, years), and all combinations are evaluated at once.
+    Scenarios with a negative effective return are reported as NaN.
+
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param times_compounded: Number of times interest is compounded per year.
+    :param years: Number of years the money is invested.
+    :param contribution: Regular contribution added each compounding period.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param tidy: Return a long DataFrame with one row per scenario instead of an array.
+    :param as_frame: With tidy, return a DataFrame. Otherwise return a ProjectionResult storing the total value only.
+    :return: Array of shape (len(annual_rate), len(ter), len(contribution), len(times_compounded), len(years)) with the total value
+             at the end of the horizon, or a DataFrame with the parameters, "Contributions", "Interest" and "Total Show".
+    """
+    # Turn every parameter into its own axis of the grid.
+    axes = [np.atleast_1d(np.asarray(value, dtype = float)) for value in (annual_rate, ter, contribution, times_compounded, years)]
+    annual_rate, ter, contribution, times_compounded, years = np.ix_(*axes)
+
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
+    amount, future_value_of_contributions = _future_values(principal = principal,
+                                                           effective_return = effective_return,
+                                                           times_compounded = times_compounded,
+                                                           years = years,
+                                                           contribution = contribution)
+
+    # Total future value with compound interest
+    future_value_with_interest = amount + future_value_of_contributions
+
+    if not tidy:
+        return future_value_with_interest
+
+    # Long format: one row per scenario. Only the totals are stored, the parameters are read back from the grid axes.
+    shape = future_value_with_interest.shape
+    derived = {name: functools.partial(_grid_axis, axis = axis, position = position, shape = shape)
+               for position, (name, axis) in enumerate(zip(GRID_PARAMETERS, axes))}
+    derived["Contributions"] = functools.partial(_grid_contributions, axes = axes, shape = shape)
+    derived["Interest"] = functools.partial(_grid_interest, principal = principal)
+    result = ProjectionResult({"Total Show": future_value_with_interest.ravel()},
+                              derived = derived,
+                              order = [*GRID_PARAMETERS, "Contributions", "Interest", "Total Show"])
+
+    return result.to_frame() if as_frame else result
+
+
+
+
+def compound_interest_batch(principal = 1500,
+                            annual_rate = 5,
+                            times_compounded = 12,
+                            years = 35,
+                            contribution = 100,
+                            ter = 0,
+                            inflation = False,
+                            inflation_rate = 2,
+                            as_frame = True):
+    """
+    Evaluate compound_interest for many scenarios at once, one scenario per element of the parameter arrays.
+
+    Parameters are broadcast element-wise (unlike compound_interest_grid, which combines them). Every scenario is
+    evaluated at the end of its own horizon, so repeating a scenario with years = 1..N gives its yearly rows.
+    Scenarios with a negative effective return are reported as NaN.
+
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param times_compounded: Number of times interest is compounded per year.
+    :param years: Number of years the money is invested.
+    :param contribution: Regular contribution added each compounding period.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult, which stores 5 of the 8 columns.
+    :return: DataFrame with the columns of compound_interest but "Year" and "Total", one row per scenario.
+    """
+    principal, annual_rate, times_compounded, years, contribution, ter, inflation, inflation_rate = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(value)) for value in (principal, annual_rate, times_compounded, years, contribution, ter, inflation, inflation_rate)])
+
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
+    amount, future_value_of_contributions = _future_values(principal = principal,
+                                                           effective_return = effective_return,
+                                                           times_compounded = times_compounded,
+                                                           years = years,
+                                                           contribution = contribution)
+
+    contributions = contribution * times_compounded * years
+    interest_over_contributions = np.where(effective_return == 0, 0.0, future_value_of_contributions - contributions)
+
+    result = ProjectionResult({"Initial Investment": principal,
+                               'Total Initial investment': amount,
+                               'Contributions': contributions,
+                               'Interest over Contributions': interest_over_contributions,
+                               'Total Contributions': future_value_of_contributions},
+                              derived = COMPOUND_DERIVED,
+                              order = BATCH_COLUMNS)
+
+    return result.to_frame() if as_frame else result
+
+
+
+def simple_interest(principal = 1500,
+                    annual_rate = 5,
+                    years = 35,
+                    inflation = False,
+                    inflation_rate = 2,
+                    as_frame = True):
     """
     Calculate the compound interest of an investment with regular contributions and compare it to a simple savings scenario.
 
@@ -109,34 +315,64 @@ def simple_interest(principal = 1500,
     :param annual_rate: Annual interest rate (as a percentage).
     :param years: Number of years the money is invested.
     :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult with the same columns.
     :return: DataFrame with the compound interest  of the investment, contributions, and simple savings for each year.
     """
-    # Prepare a list to hold data for each year
-    data = []
-
     # Turn rates from percentage to fraction.
     annual_rate /= 100
-    inflation_rate = 2 / 100
+    inflation_rate = inflation_rate / 100
 
     # Calculate the real interest rate
     real_interest_rate = ((1 + annual_rate) / (1 + inflation_rate)) - 1 if inflation else annual_rate
-    
-    for year in range(1, years + 1):
-         # With no interest, no future values.
-        amount = principal 
-            
-        # Calculate future value if saved (no interest)
-        future_value_savings = principal * real_interest_rate * year
-        
-        # Append the results to the list
-        data.append({
-            'Year': year,
-            "Initial Investment": principal,
-            "Interest": future_value_savings,
-            'Total': 0,
-        })
-
-    # Create a DataFrame from the list
-    df = pd.DataFrame(data)
-    
-    return df
\ No newline at end of file
+
+    # All years are computed at once as columns.
+    year = np.arange(1, years + 1)
+
+    # Calculate future value if saved (no interest)
+    future_value_savings = principal * real_interest_rate * year
+
+    result = ProjectionResult({'Year': year, "Interest": future_value_savings},
+                              constants = {"Initial Investment": principal, 'Total': 0},
+                              order = ['Year', "Initial Investment", "Interest", 'Total'])
+
+    # pandas is only loaded once a frame is built.
+    return result.to_frame() if as_frame else result
+
+
+
+def simple_interest_batch(principal = 1500,
+                          annual_rate = 5,
+                          years = 35,
+                          inflation = False,
+                          inflation_rate = 2,
+                          as_frame = True):
+    """
+    Evaluate simple_interest for many scenarios at once, one scenario per element of the parameter arrays.
+
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param years: Number of years the money is invested.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult with the same columns.
+    :return: DataFrame with the "Initial Investment" and "Interest" columns of simple_interest, one row per scenario.
+    """
+    principal, annual_rate, years, inflation, inflation_rate = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(value)) for value in (principal, annual_rate, years, inflation, inflation_rate)])
+
+    # Turn rates from percentage to fraction.
+    annual_rate = annual_rate / 100
+    inflation_rate = inflation_rate / 100
+
+    # Calculate the real interest rate
+    real_interest_rate = np.where(inflation, ((1 + annual_rate) / (1 + inflation_rate)) - 1, annual_rate)
+
+    result = ProjectionResult({"Initial Investment": principal,
+                               "Interest": principal * real_interest_rate * years})
+
+    return result.to_frame() if as_frame else result
+
+# Memoized calculators.
+cached_compound_interest = memoize(maxsize = 256, name = "compound_interest")(compound_interest)
+cached_simple_interest = memoize(maxsize = 256, name = "simple_interest")(simple_interest)
@@ -0,0 +1,201 @@
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .calculators import compound_interest_batch, simple_interest_batch
+
+# Scenario columns read by each calculator, with the value used when a column is missing.
+# Rates, TER and inflation are percentages; an inflation of 0 means no inflation adjustment.
+SCENARIO_COLUMNS = {"compound": {"principal": 1500,
+                                 "annual_rate": 5,
+                                 "times_compounded": 12,
+                                 "years": 35,
+                                 "contribution": 100,
+                                 "ter": 0,
+                                 "inflation": 0},
+                    "simple": {"principal": 1500,
+                               "annual_rate": 5,
+                               "years": 35,
+                               "inflation": 0}}
+
+# Extensions of the files read and written with pyarrow.
+ARROW_EXTENSIONS = (".parquet", ".arrow")
+
+def check_pyarrow(*paths):
+    """
+    Check that pyarrow is installed when one of the paths is a Parquet or Arrow file.
+
+    :param paths: Paths of the input and output files.
+    :raises ImportError: If a path needs pyarrow and it is not installed.
+    """
+    if any(path.endswith(ARROW_EXTENSIONS) for path in paths):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Parquet and Arrow files require pyarrow, install it with `pip install pyarrow`.") from None
+
+def read_scenarios(path, chunk_size):
+    """
+    Read a CSV or Parquet file of scenarios chunk by chunk.
+
+    :param path: Path to a .csv or .parquet file.
+    :param chunk_size: Number of rows per chunk.
+    :return: Iterator of DataFrames.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize = chunk_size)
+
+def evaluate_scenarios(scenarios, calculator = "compound", yearly = False):
+    """
+    Evaluate a chunk of scenarios in one vectorized batch.
+
+    :param scenarios: DataFrame with one scenario per row. Missing columns take the values in SCENARIO_COLUMNS,
+                      other columns are passed through to the output.
+    :param calculator: "compound" or "simple".
+    :param yearly: Return one row per scenario and year instead of one row per scenario. Requires whole years, so
+                   the yearly rows end on the totals of the scenario.
+    :return: DataFrame with the scenario columns followed by the calculator columns.
+    :raises ValueError: If yearly is set and a scenario has a fractional or negative number of years.
+    """
+    scenarios = scenarios.reset_index(drop = True)
+    parameters = {name: scenarios[name].to_numpy() if name in scenarios else np.full(len(scenarios), default)
+                  for name, default in SCENARIO_COLUMNS[calculator].items()}
+
+    if yearly:
+        # Repeat every scenario once per year of its horizon.
+        invalid = (parameters["years"] % 1 != 0) | (parameters["years"] < 0)
+        if invalid.any():
+            raise ValueError(f"years must be a whole, non-negative number for yearly results, got {parameters['years'][invalid][0]:g}.")
+        years = parameters["years"].astype(np.int64)
+        rows = np.repeat(np.arange(len(scenarios)), years)
+        first_rows = np.repeat(np.cumsum(years) - years, years)
+        scenarios = scenarios.iloc[rows].reset_index(drop = True)
+        scenarios["Year"] = np.arange(len(rows)) - first_rows + 1
+        parameters = {name: values[rows] for name, values in parameters.items()}
+        parameters["years"] = scenarios["Year"].to_numpy()
+
+    # Inflation is read as a rate; 0 leaves the returns untouched.
+    inflation_rate = parameters.pop("inflation")
+    batch = compound_interest_batch if calculator == "compound" else simple_interest_batch
+    results = batch(**parameters, inflation = inflation_rate != 0, inflation_rate = inflation_rate)
+
+    return pd.concat([scenarios, results], axis = 1)
+
+class ResultWriter:
+    """
+    Append DataFrames to a CSV, Parquet or Arrow IPC file, chunk by chunk. The format follows the file extension.
+    """
+    def __init__(self, path):
+        """
+        :param path: Path to a .csv, .parquet or .arrow file.
+        """
+        self.path = path
+        self._writer = None
+        self._header = True
+
+    def write(self, df):
+        """
+        Append a chunk of results.
+
+        :param df: DataFrame to append. Every chunk must have the same columns.
+        """
+        if self.path.endswith(".csv"):
+            df.to_csv(self.path, mode = "w" if self._header else "a", header = self._header, index = False)
+            self._header = False
+            return
+
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index = False)
+        if self._writer is None:
+            if self.path.endswith(".parquet"):
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                self._writer = pa.ipc.new_stream(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        """
+        Finish the file.
+        """
+        if self._writer is not None:
+            self._writer.close()
+
+def run(input_path, output_path, calculator = "compound", yearly = False, chunk_size = 100000, workers = 1):
+    """
+    Evaluate every scenario of input_path and stream the results to output_path.
+
+    Only a bounded number of chunks is held in memory at once, so files with millions of scenarios are processed
+    without loading them whole. Results keep the order of the input.
+
+    :param input_path: Path to a .csv or .parquet file of scenarios.
+    :param output_path: Path to a .csv, .parquet or .arrow file.
+    :param calculator: "compound" or "simple".
+    :param yearly: Write one row per scenario and year instead of one row per scenario.
+    :param chunk_size: Number of scenarios evaluated per batch.
+    :param workers: Number of worker processes; 1 evaluates in the current process.
+    :return: Number of scenarios evaluated.
+    :raises ImportError: If a Parquet or Arrow file is given and pyarrow is not installed.
+    :raises ValueError: If yearly is set and a scenario has a fractional or negative number of years.
+    """
+    check_pyarrow(input_path, output_path)
+    writer = ResultWriter(output_path)
+    count = 0
+
+    try:
+        if workers == 1:
+            for chunk in read_scenarios(input_path, chunk_size):
+                writer.write(evaluate_scenarios(chunk, calculator = calculator, yearly = yearly))
+                count += len(chunk)
+        else:
+            # Keep a bounded number of chunks in flight, written back in input order.
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                pending = deque()
+                for chunk in read_scenarios(input_path, chunk_size):
+                    pending.append(executor.submit(evaluate_scenarios, chunk, calculator, yearly))
+                    count += len(chunk)
+                    if len(pending) >= 2 * workers:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+
+    return count
+
+def main(argv = None):
+    """
+    Command-line entry point: python -m FInCalc scenarios.csv results.parquet
+    """
+    parser = argparse.ArgumentParser(prog = "python -m FInCalc",
+                                     description = "Evaluate a CSV or Parquet file of scenarios with the FInCalc calculators.")
+    parser.add_argument("input", help = "CSV or Parquet file with one scenario per row. Columns: " +
+                                        ", ".join(SCENARIO_COLUMNS["compound"]) + " (rates, TER and inflation as percentages).")
+    parser.add_argument("output", help = "Output file: .csv, .parquet or .arrow (Arrow IPC stream).")
+    parser.add_argument("--calculator", choices = list(SCENARIO_COLUMNS), default = "compound", help = "Calculator to evaluate.")
+    parser.add_argument("--yearly", action = "store_true", help = "Write one row per scenario and year instead of the end of the horizon only.")
+    parser.add_argument("--chunk-size", type = int, default = 100000, help = "Scenarios evaluated per batch.")
+    parser.add_argument("--workers", type = int, default = 1, help = f"Worker processes (this machine has {os.cpu_count()} CPUs).")
+    args = parser.parse_args(argv)
+
+    try:
+        count = run(input_path = args.input,
+                    output_path = args.output,
+                    calculator = args.calculator,
+                    yearly = args.yearly,
+                    chunk_size = args.chunk_size,
+                    workers = args.workers)
+    except (ImportError, ValueError) as error:
+        parser.error(str(error))
+    print(f"Evaluated {count} scenarios into {args.output}", file = sys.stderr)
+
+    return 0
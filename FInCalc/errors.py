@@ -0,0 +1,9 @@
+class FInCalcError(Exception):
+    """
+    Base class of the errors raised by the FInCalc calculators.
+    """
+
+class NegativeReturnError(FInCalcError, ValueError):
+    """
+    Raised when the effective return of a calculation is negative.
+    """
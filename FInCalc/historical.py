@@ -0,0 +1,94 @@
+import functools
+import os
+import tempfile
+
+import numpy as np
+
+# Bundled dataset: one row per year with the annual return and inflation, as percentages.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+HISTORICAL_CSV = os.path.join(DATA_DIR, "historical_returns.csv")
+
+def _binary_path(csv_path):
+    """
+    Path of the binary copy of a CSV dataset: next to it, or in the temporary directory if that is not writable.
+
+    :param csv_path: Path to the CSV file.
+    """
+    directory, name = os.path.split(os.path.splitext(csv_path)[0] + ".npy")
+    if not os.access(directory, os.W_OK):
+        directory = os.path.join(tempfile.gettempdir(), "FInCalc")
+        os.makedirs(directory, exist_ok = True)
+    return os.path.join(directory, name)
+
+def convert_historical_returns(csv_path = HISTORICAL_CSV, npy_path = None):
+    """
+    Convert the CSV dataset into a binary .npy file that can be memory mapped.
+
+    The array has shape (3, years) with the years, the returns and the inflation rates (as fractions) as contiguous rows.
+    It is written to a temporary file and renamed into place, so concurrent readers never see a partial file.
+
+    :param csv_path: Path to a CSV file with "Year", "Return" and "Inflation" columns (as percentages). Lines starting with # are ignored.
+    :param npy_path: Destination. Defaults to the .npy next to the CSV file.
+    :return: Path of the .npy file.
+    """
+    npy_path = npy_path or _binary_path(csv_path)
+
+    # Parse the CSV file once, without pandas. The first line that is not a comment holds the column names.
+    with open(csv_path) as file:
+        table = np.genfromtxt([line for line in file if not line.startswith("#")], delimiter = ",", names = True)
+    data = np.ascontiguousarray(np.stack([table["Year"], table["Return"] / 100, table["Inflation"] / 100]))
+
+    # Write atomically: a temporary file in the same directory, then a rename.
+    handle, temporary_path = tempfile.mkstemp(dir = os.path.dirname(npy_path), suffix = ".npy.tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.save(file, data)
+        os.replace(temporary_path, npy_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return npy_path
+
+@functools.lru_cache(maxsize = None)
+def load_historical_returns(csv_path = HISTORICAL_CSV):
+    """
+    Load the historical dataset as a read-only memory map, converting the CSV file first if the binary copy is
+    missing or older than it.
+
+    The data is never copied into the process: every session and worker process maps the same file, so the
+    operating system keeps a single copy in its page cache.
+
+    :param csv_path: Path to the CSV dataset.
+    :return: Read-only array of shape (3, years) with the years, returns and inflation rates (as fractions).
+    """
+    npy_path = _binary_path(csv_path)
+    if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(csv_path):
+        convert_historical_returns(csv_path, npy_path)
+
+    return np.load(npy_path, mmap_mode = "r")
+
+def block_bootstrap(rng, num_simulations, years, block_length = 5, data = None):
+    """
+    Draw annual returns and inflation rates by resampling blocks of consecutive historical years.
+
+    Each path is made of blocks of block_length consecutive years starting at random years. Blocks wrap around the end
+    of the dataset (circular block bootstrap), so every year is drawn equally often. Keeping runs of consecutive years
+    preserves booms, crashes and the link between returns and inflation, hence the sequence-of-returns risk.
+
+    :param rng: numpy.random.Generator to draw from.
+    :param num_simulations: Number of paths.
+    :param years: Number of years per path.
+    :param block_length: Number of consecutive historical years per block.
+    :param data: Array of shape (3, dataset years) as returned by load_historical_returns. Defaults to the bundled dataset.
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years), as fractions.
+    """
+    data = load_historical_returns() if data is None else data
+    dataset_years = data.shape[1]
+
+    # Random first year of every block, then the consecutive years of each block.
+    num_blocks = -(-years // block_length)
+    starts = rng.integers(0, dataset_years, size = (num_simulations, num_blocks, 1))
+    indices = ((starts + np.arange(block_length)) % dataset_years).reshape(num_simulations, -1)[:, :years]
+
+    return data[1][indices], data[2][indices]
@@ -0,0 +1,176 @@
+import numpy as np
+
+# Numba is optional: without it the kernels run as NumPy loops over the years, vectorized across paths.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+prange = numba.prange if numba is not None else range
+
+# Withdrawal rules of the retirement phase, and their parameters (as percentages) with default values.
+WITHDRAWAL_RULES = ("constant", "guardrails", "floor_ceiling")
+RULE_DEFAULTS = {"constant": {},
+                 "guardrails": {"guardrail": 20, "adjustment": 10},
+                 "floor_ceiling": {"floor": 90, "ceiling": 125}}
+
+# Engines running the kernels.
+ENGINES = ("numba", "numpy")
+
+def rule_fractions(rule, parameters = None):
+    """
+    Check the parameters of a withdrawal rule and turn them from percentage to fraction.
+
+    :param rule: One of WITHDRAWAL_RULES.
+    :param parameters: Dictionary of parameter -> value (as a percentage) overriding the defaults of RULE_DEFAULTS.
+    :return: Tuple of the two parameters of the rule as fractions, padded with zeros.
+    :raises ValueError: If the rule or a parameter is unknown, or the floor is above the ceiling.
+    """
+    if rule not in WITHDRAWAL_RULES:
+        raise ValueError(f"Unknown withdrawal rule {rule!r}, expected one of {WITHDRAWAL_RULES}.")
+
+    unknown = set(parameters or {}) - set(RULE_DEFAULTS[rule])
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)} for the {rule!r} rule, expected {list(RULE_DEFAULTS[rule])}.")
+
+    values = {**RULE_DEFAULTS[rule], **(parameters or {})}
+    if rule == "floor_ceiling" and values["floor"] > values["ceiling"]:
+        raise ValueError("The floor must not be above the ceiling.")
+
+    return (*(float(value) / 100 for value in values.values()), 0.0, 0.0)[:2]
+
+def _withdraw_loop(savings, returns, inflation, expenses, rule, first, second, portfolio, time_to_ruin):
+    """
+    Run the withdrawal phase path by path. Compiled by Numba when it is installed, with the paths spread over threads.
+
+    Same arguments as _withdraw_numpy, with the rule as its position in WITHDRAWAL_RULES, its two parameters as
+    fractions, and the output arrays, zeros and NaN, filled in place.
+    """
+    for i in prange(savings.shape[0]):
+        value = savings[i]
+        indexed = expenses[i]
+        withdrawal = expenses[i]
+        initial_rate = 0.0
+        for t in range(returns.shape[1]):
+            indexed *= 1 + inflation[i, t]
+
+            if rule == 0:
+                withdrawal = indexed
+            elif rule == 1:
+                if t == 0:
+                    withdrawal = indexed
+                    initial_rate = withdrawal / value
+                else:
+                    # No raise for inflation after a losing year while above the initial rate.
+                    if not (returns[i, t - 1] < 0 and withdrawal > initial_rate * value):
+                        withdrawal *= 1 + inflation[i, t]
+                    rate = withdrawal / value
+                    if rate > initial_rate * (1 + first):
+                        withdrawal *= 1 - second
+                    elif rate < initial_rate * (1 - first):
+                        withdrawal *= 1 + second
+            else:
+                if t == 0:
+                    initial_rate = indexed / value
+                withdrawal = min(max(initial_rate * value, first * indexed), second * indexed)
+
+            # Withdraw at the start of the year, then grow. Once depleted, the portfolio stays at zero.
+            remaining = value - withdrawal
+            if remaining <= 0:
+                time_to_ruin[i] = t + 1
+                break
+            value = remaining * (1 + returns[i, t])
+            portfolio[i, t] = value
+
+_withdraw_numba = numba.njit(parallel = True, cache = True, error_model = "numpy")(_withdraw_loop) if numba is not None else None
+
+def _withdraw_numpy(savings, returns, inflation, expenses, rule, first, second):
+    """
+    Run the withdrawal phase for all paths at once, one year at a time.
+
+    :return: Tuple of (portfolio values at the end of every year, year of ruin counted from retirement or NaN).
+    """
+    # Work year by year on contiguous rows.
+    num_simulations, years = returns.shape
+    returns, inflation = np.ascontiguousarray(returns.T), np.ascontiguousarray(inflation.T)
+    portfolio = np.zeros((years, num_simulations))
+    time_to_ruin = np.full(num_simulations, np.nan)
+    alive = np.ones(num_simulations, dtype = bool)
+    value = savings.astype(float)
+    indexed = expenses.astype(float)
+    withdrawal = indexed.copy()
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        for t in range(years):
+            indexed = indexed * (1 + inflation[t])
+
+            if rule == 0:
+                withdrawal = indexed
+            elif rule == 1:
+                if t == 0:
+                    withdrawal = indexed
+                    initial_rate = withdrawal / value
+                else:
+                    # No raise for inflation after a losing year while above the initial rate.
+                    freeze = (returns[t - 1] < 0) & (withdrawal > initial_rate * value)
+                    withdrawal = np.where(freeze, withdrawal, withdrawal * (1 + inflation[t]))
+                    rate = withdrawal / value
+                    withdrawal = np.where(rate > initial_rate * (1 + first), withdrawal * (1 - second),
+                                          np.where(rate < initial_rate * (1 - first), withdrawal * (1 + second), withdrawal))
+            else:
+                if t == 0:
+                    initial_rate = indexed / value
+                withdrawal = np.minimum(np.maximum(initial_rate * value, first * indexed), second * indexed)
+
+            # Withdraw at the start of the year, then grow. Once depleted, the portfolio stays depleted.
+            remaining = value - withdrawal
+            ruined = alive & (remaining <= 0)
+            time_to_ruin[ruined] = t + 1
+            alive &= ~ruined
+            value = np.where(alive, remaining * (1 + returns[t]), 0.0)
+            portfolio[t] = value
+
+    return portfolio.T, time_to_ruin
+
+def withdrawal_paths(savings, returns, inflation, expenses, rule = "constant", parameters = None, engine = None):
+    """
+    Run the withdrawal phase of a retirement under a path-dependent withdrawal rule.
+
+    Every year, the withdrawal is taken at the start of the year and the rest grows with the return of the year.
+    - "constant" withdraws the first-year expenses, indexed to inflation.
+    - "guardrails" (Guyton-Klinger) starts the same way, but skips the inflation raise after a losing year while the
+      withdrawal rate is above the initial one, cuts the withdrawal by "adjustment" percent when its rate rises
+      "guardrail" percent above the initial rate, and raises it by as much when it falls as far below.
+    - "floor_ceiling" withdraws the initial rate of the current portfolio value, bounded by "floor" and "ceiling"
+      percent of the constant, inflation-indexed withdrawal.
+    A path is ruined in the year its withdrawal takes the whole portfolio, which then stays at zero.
+
+    :param savings: Savings at retirement of every path, of shape (num_simulations,).
+    :param returns: Annual returns (as a fraction) of every year in retirement, of shape (num_simulations, years).
+    :param inflation: Annual inflation rates (as a fraction) of every year in retirement, of the same shape.
+    :param expenses: Expenses of every path before the inflation of the first year, of shape (num_simulations,).
+    :param rule: One of WITHDRAWAL_RULES.
+    :param parameters: Dictionary of the rule parameters (as percentages) overriding RULE_DEFAULTS.
+    :param engine: "numba" or "numpy". Defaults to Numba when it is installed.
+    :return: Tuple of (portfolio values at the end of every year, year of ruin counted from retirement or NaN).
+    """
+    first, second = rule_fractions(rule, parameters)
+    engine = engine or ("numba" if numba is not None else "numpy")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}.")
+    if engine == "numba" and numba is None:
+        raise ImportError("The numba engine requires Numba, install it with `pip install numba`.")
+
+    savings = np.broadcast_to(np.asarray(savings, dtype = float), (returns.shape[0],))
+    expenses = np.broadcast_to(np.asarray(expenses, dtype = float), (returns.shape[0],))
+
+    if engine == "numpy":
+        return _withdraw_numpy(savings, returns, inflation, expenses, WITHDRAWAL_RULES.index(rule), first, second)
+
+    portfolio = np.zeros(returns.shape)
+    time_to_ruin = np.full(returns.shape[0], np.nan)
+    _withdraw_numba(np.ascontiguousarray(savings), np.ascontiguousarray(returns, dtype = float),
+                    np.ascontiguousarray(inflation, dtype = float), np.ascontiguousarray(expenses),
+                    WITHDRAWAL_RULES.index(rule), first, second, portfolio, time_to_ruin)
+
+    return portfolio, time_to_ruin
@@ -1,53 +1,20 @@
 from .utils import *
+from .cache import memoize
 
-def plot_compound_interest(data, discrete_palette, log_y, fontsize):
+def plot_compound_interest(data, discrete_palette, log_y, fontsize, compact = False):
     """
     Plot the compound interest as a stacked bar plot using Plotly.
 
-    :param data: DataFrame containing the future value data.
+    :param data: DataFrame or ProjectionResult containing the future value data.
     :param discrete_palette: Discrete color palette to use. 
     :param log_y: Whether to log10 scale the Y axis. 
     :param fontsize: Font size to use in the plot.
+    :param compact: Send the figure data as binary typed arrays, for long horizons.
     """
 
-    # Turn wide data to long data.
-    data_long = pd.melt(data.loc[:, ["Year", "Initial Investment", "Contributions", "Interest", "Total"]],
-                        id_vars = "Year",
-                        var_name = "Type",
-                        value_name = "Amount")
-    
-    # Calculate the total amount per Year
-    totals = data_long.groupby("Year")["Amount"].sum().reset_index()
-    totals.rename(columns = {"Amount": "Total"}, inplace = True)
-    
-
-    # Merge the total amounts back into the original DataFrame
-    data_long = data_long.merge(totals, on = "Year")
-    color_map = generate_color_map(data_long["Type"], discrete_palette)
-    color_map["Total"] = "white"
-
-    p = px.bar(data_frame = data_long,
-               x = "Year",
-               y = "Amount",
-               color = "Type",
-               text_auto = False,
-               title = None,
-               color_discrete_map = color_map,
-               custom_data = ["Type", "Total"],
-               log_y = log_y) 
-    
-
-    p.update_traces(marker = dict(line = dict(color = "white", width = 1)),
-                    hovertemplate = '<b>%{customdata[0]}:</b> %{y:,.2f} €' +
-                                     '<extra></extra>')
-    
-
-    # Surgically insert things in the hover :D.
-    p.data[3].update(customdata = data_long.loc[:, ["Year", "Total"]],
-                     hovertemplate = '<b>Total:</b> %{customdata[1]:,.2f} €'+
-                                     '<extra></extra>',
-                     showlegend =  False,
-                     marker = dict(line = dict(color = "white", width = 1)))
+    # One trace per column, straight from the calculator output.
+    series = {name: np.asarray(data[name]) for name in ["Initial Investment", "Contributions", "Interest"]}
+    p = stacked_bar_plot(x = data["Year"], series = series, discrete_palette = discrete_palette, log_y = log_y, compact = compact)
 
     # Update layout
     p.update_layout(xaxis_title = 'Year',
@@ -61,9 +28,76 @@ def plot_compound_interest(data, discrete_palette, log_y, fontsize):
 
     p = update_plot_layout(fig = p, type = "bar", fontsize = fontsize)
 
-    totals = data_long[data_long["Year"] == max(data_long["Year"])].groupby("Type")["Amount"].sum().reset_index()
-    totals.rename(columns = {"Amount": "Total"}, inplace = True)
+    # Totals of the last year, in the alphabetical order of the types.
+    types = sorted(list(series) + ["Total"])
+    totals = {"Type": types,
+              "Total": [series[name][-1] if name in series else 0 for name in types]}
     p2 = donut_plot(totals, discrete_palette = discrete_palette, fontsize = fontsize)
     
 
-    return(p, p2)
\ No newline at end of file
+    return(p, p2)
+
+def restyle_compound_interest(figures, discrete_palette, log_y, fontsize):
+    """
+    Patch the figures of plot_compound_interest in place for new presentation inputs, without rebuilding them.
+
+    :param figures: Tuple of (bar, donut) figures returned by plot_compound_interest.
+    :param discrete_palette: Discrete color palette to use. 
+    :param log_y: Whether to log10 scale the Y axis. 
+    :param fontsize: Font size to use in the plot.
+    """
+    p, p2 = figures
+    restyle_stacked_bar_plot(p, discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+    restyle_donut_plot(p2, discrete_palette = discrete_palette, fontsize = fontsize)
+
+    return(p, p2)
+
+def plot_compound_interest_heatmap(data, annual_rate, contribution, continuous_palette, fontsize, compact = False):
+    """
+    Plot the total value of a grid of compound interest scenarios as a heatmap using Plotly.
+
+    :param data: 2D array of shape (len(annual_rate), len(contribution)) as returned by compound_interest_grid.
+    :param annual_rate: Annual interest rates (as a percentage) in the rows of data.
+    :param contribution: Contributions in the columns of data.
+    :param continuous_palette: Continuous color palette to use.
+    :param fontsize: Font size to use in the plot.
+    :param compact: Send the values as a binary typed array, and evenly spaced axes as a start and a step.
+    """
+    # Evenly spaced axes are sent as a start and a step.
+    x_spacing, y_spacing = (even_spacing(contribution), even_spacing(annual_rate)) if compact else (None, None)
+    axes = {**(dict(x = contribution) if x_spacing is None else dict(x0 = x_spacing[0], dx = x_spacing[1])),
+            **(dict(y = annual_rate) if y_spacing is None else dict(y0 = y_spacing[0], dy = y_spacing[1]))}
+
+    figure = CompactFigure if compact else go.Figure
+    p = figure(go.Heatmap(z = data,
+                          **axes,
+                          colorscale = continuous_palette,
+                          colorbar = dict(title = "Total (€)"),
+                          hovertemplate = '<b>Contribution:</b> %{x:,.2f} €<br>' +
+                                          '<b>Annual Growth Rate:</b> %{y:.2f} %<br>' +
+                                          '<b>Total:</b> %{z:,.2f} €' +
+                                          '<extra></extra>'))
+
+    p.update_layout(xaxis_title = 'Contribution (€)',
+                    yaxis_title = 'Annual Growth Rate (%)',
+                    hoverlabel=dict(bgcolor="white", font_size = fontsize),
+                    margin = dict(l = 0, r = 0, t = 0, b = 0))
+
+    p = update_plot_layout(fig = p, type = "heatmap", fontsize = fontsize)
+
+    return(p)
+
+def restyle_compound_interest_heatmap(p, continuous_palette, fontsize):
+    """
+    Patch a figure of plot_compound_interest_heatmap in place for new presentation inputs, without rebuilding it.
+
+    :param p: Figure returned by plot_compound_interest_heatmap.
+    :param continuous_palette: Continuous color palette to use.
+    :param fontsize: Font size to use in the plot.
+    """
+    p.data[0].colorscale = continuous_palette
+
+    return restyle_plot_layout(p, fontsize = fontsize, changes = {"hoverlabel.font.size": fontsize})
+
+# Memoized figures.
+cached_plot_compound_interest = memoize(maxsize = 64, name = "plot_compound_interest")(plot_compound_interest)
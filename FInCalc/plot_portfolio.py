@@ -0,0 +1,50 @@
+from .utils import *
+
+def plot_portfolio(data, discrete_palette, log_y, fontsize, compact = False):
+    """
+    Plot the mean value held in every asset of a portfolio as a stacked bar plot, and its final split as a donut, using Plotly.
+
+    :param data: ProjectionResult or DataFrame with the "Year" and one column per asset, as the "allocation" returned
+                 by simulate_portfolio.
+    :param discrete_palette: Discrete color palette to use.
+    :param log_y: Whether to log10 scale the Y axis.
+    :param fontsize: Font size to use in the plot.
+    :param compact: Send the figure data as binary typed arrays, for long horizons.
+    """
+    # One trace per asset, in the order of the portfolio.
+    series = {name: np.asarray(data[name]) for name in data.keys() if name != "Year"}
+    p = stacked_bar_plot(x = data["Year"], series = series, discrete_palette = discrete_palette, log_y = log_y, compact = compact)
+
+    # Update layout
+    p.update_layout(xaxis_title = 'Year',
+                    yaxis_title = 'Mean value (€)',
+                    legend_title = "",
+                    bargap = 0.2,
+                    hovermode = "x unified",
+                    hoverlabel = dict(bgcolor = "white", font_size = fontsize),
+                    margin = dict(l = 0, r = 0, t = 0, b = 0),
+                    legend = dict(x = 0.5, y = 1.1, xanchor = "center", yanchor = "top", orientation = "h"))
+
+    p = update_plot_layout(fig = p, type = "bar", fontsize = fontsize)
+
+    # Mean values of the last year, in the order of the bars so both figures share their colors.
+    totals = {"Type": list(series),
+              "Total": [values[-1] if len(values) else 0 for values in series.values()]}
+    p2 = donut_plot(totals, discrete_palette = discrete_palette, fontsize = fontsize)
+
+    return(p, p2)
+
+def restyle_portfolio(figures, discrete_palette, log_y, fontsize):
+    """
+    Patch the figures of plot_portfolio in place for new presentation inputs, without rebuilding them.
+
+    :param figures: Tuple of (bar, donut) figures returned by plot_portfolio.
+    :param discrete_palette: Discrete color palette to use.
+    :param log_y: Whether to log10 scale the Y axis.
+    :param fontsize: Font size to use in the plot.
+    """
+    p, p2 = figures
+    restyle_stacked_bar_plot(p, discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+    restyle_donut_plot(p2, discrete_palette = discrete_palette, fontsize = fontsize)
+
+    return(p, p2)
@@ -0,0 +1,75 @@
+from .utils import *
+
+def plot_retirement(percentiles, years_to_retirement, fontsize, paths = None, compact = False):
+    """
+    Plot the simulated portfolio value as a fan chart of percentile bands using Plotly.
+
+    Individual paths, if given, are drawn as a single WebGL (Scattergl) trace, with a gap between consecutive paths,
+    so the browser renders thousands of them on the GPU instead of building one SVG path per line.
+
+    :param percentiles: DataFrame with the "Year", "P5", "P25", "P50", "P75" and "P95" columns, as returned by
+                        simulate_retirement.
+    :param years_to_retirement: Year of the retirement, marked with a vertical line.
+    :param fontsize: Font size to use in the plot.
+    :param paths: Optional array of shape (paths, years) with the portfolio values of individual paths.
+    :param compact: Send the figure data as binary typed arrays, and the years as a start and a step.
+    """
+    year = np.asarray(percentiles["Year"])
+    spacing = even_spacing(year) if compact else None
+    x_axis = dict(x = year) if spacing is None else dict(x0 = spacing[0], dx = spacing[1])
+
+    traces = []
+    if paths is not None:
+        # One trace for every path: NaN breaks the line between two paths. The paths are drawn but never hovered,
+        # so single precision is enough and halves the data sent.
+        paths = np.asarray(paths, dtype = np.float32)
+        traces.append(go.Scattergl(x = np.tile(np.append(year, np.nan).astype(np.float32), len(paths)),
+                                   y = np.hstack([paths, np.full((len(paths), 1), np.nan, dtype = np.float32)]).ravel(),
+                                   mode = "lines",
+                                   name = "Paths",
+                                   line = dict(color = "rgba(0, 0, 0, 0.05)", width = 1),
+                                   hoverinfo = "skip"))
+
+    # Bands filled between their upper and lower percentiles.
+    for low, high, opacity, name in (("P5", "P95", 0.2, "5th - 95th percentile"), ("P25", "P75", 0.4, "25th - 75th percentile")):
+        traces.append(go.Scatter(**x_axis,
+                                 y = np.asarray(percentiles[high]),
+                                 mode = "lines",
+                                 line = dict(width = 0),
+                                 legendgroup = name,
+                                 showlegend = False,
+                                 hoverinfo = "skip"))
+        traces.append(go.Scatter(**x_axis,
+                                 y = np.asarray(percentiles[low]),
+                                 mode = "lines",
+                                 line = dict(width = 0),
+                                 fill = "tonexty",
+                                 fillcolor = f"rgba(128, 128, 128, {opacity})",
+                                 name = name,
+                                 legendgroup = name,
+                                 hoverinfo = "skip"))
+
+    traces.append(go.Scatter(**x_axis,
+                             y = np.asarray(percentiles["P50"]),
+                             mode = "lines",
+                             line = dict(color = "black"),
+                             name = "Median",
+                             hovertemplate = '<b>Median:</b> %{y:,.0f} €' +
+                                             '<extra></extra>'))
+
+    figure = CompactFigure if compact else go.Figure
+    p = figure(data = traces)
+    p.add_vline(x = years_to_retirement, line = dict(color = "grey", dash = "dot"), annotation_text = "Retirement")
+    p.add_hline(y = 0, line = dict(color = "red", dash = "dash"), annotation_text = "Broke line")
+
+    # Update layout
+    p.update_layout(xaxis_title = 'Year',
+                    yaxis_title = 'Portfolio Value (€)',
+                    hovermode = "x unified",
+                    hoverlabel = dict(bgcolor = "white", font_size = fontsize),
+                    margin = dict(l = 0, r = 0, t = 0, b = 0),
+                    legend = dict(x = 0.5, y = 1.1, xanchor = "center", yanchor = "top", orientation = "h"))
+
+    p = update_plot_layout(fig = p, type = "line", fontsize = fontsize)
+
+    return(p)
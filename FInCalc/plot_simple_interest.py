@@ -1,53 +1,20 @@
 from .utils import *
+from .cache import memoize
 
-def plot_simple_interest(data, discrete_palette, log_y, fontsize):
+def plot_simple_interest(data, discrete_palette, log_y, fontsize, compact = False):
     """
     Plot the simple interest as a stacked bar plot using Plotly.
 
-    :param data: DataFrame containing the future value data.
+    :param data: DataFrame or ProjectionResult containing the future value data.
     :param discrete_palette: Discrete color palette to use. 
     :param log_y: Whether to log10 scale the Y axis. 
     :param fontsize: Font size to use in the plot.
+    :param compact: Send the figure data as binary typed arrays, for long horizons.
     """
 
-    # Turn wide data to long data.
-    data_long = pd.melt(data.loc[:, ["Year", "Initial Investment", "Interest", "Total"]],
-                        id_vars = "Year",
-                        var_name = "Type",
-                        value_name = "Amount")
-    
-    # Calculate the total amount per Year
-    totals = data_long.groupby("Year")["Amount"].sum().reset_index()
-    totals.rename(columns = {"Amount": "Total"}, inplace = True)
-    
-
-    # Merge the total amounts back into the original DataFrame
-    data_long = data_long.merge(totals, on = "Year")
-    color_map = generate_color_map(data_long["Type"], discrete_palette)
-    color_map["Total"] = "white"
-
-    p = px.bar(data_frame = data_long,
-               x = "Year",
-               y = "Amount",
-               color = "Type",
-               text_auto = False,
-               title = None,
-               color_discrete_map = color_map,
-               custom_data = ["Type", "Total"],
-               log_y = log_y) 
-    
-
-    p.update_traces(marker = dict(line = dict(color = "white", width = 1)),
-                    hovertemplate = '<b>%{customdata[0]}:</b> %{y:,.2f} €' +
-                                     '<extra></extra>')
-    
-
-    # Surgically insert things in the hover :D.
-    p.data[2].update(customdata = data_long.loc[:, ["Year", "Total"]],
-                     hovertemplate = '<b>Total:</b> %{customdata[1]:,.2f} €'+
-                                     '<extra></extra>',
-                     showlegend =  False,
-                     marker = dict(line = dict(color = "white", width = 1)))
+    # One trace per column, straight from the calculator output.
+    series = {name: np.asarray(data[name]) for name in ["Initial Investment", "Interest"]}
+    p = stacked_bar_plot(x = data["Year"], series = series, discrete_palette = discrete_palette, log_y = log_y, compact = compact)
 
     # Update layout
     p.update_layout(xaxis_title = 'Year',
@@ -62,4 +29,18 @@ def plot_simple_interest(data, discrete_palette, log_y, fontsize):
     p = update_plot_layout(fig = p, type = "bar", fontsize = fontsize)
     
 
-    return(p)
\ No newline at end of file
+    return(p)
+
+def restyle_simple_interest(p, discrete_palette, log_y, fontsize):
+    """
+    Patch a figure of plot_simple_interest in place for new presentation inputs, without rebuilding it.
+
+    :param p: Figure returned by plot_simple_interest.
+    :param discrete_palette: Discrete color palette to use. 
+    :param log_y: Whether to log10 scale the Y axis. 
+    :param fontsize: Font size to use in the plot.
+    """
+    return restyle_stacked_bar_plot(p, discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+
+# Memoized figures.
+cached_plot_simple_interest = memoize(maxsize = 64, name = "plot_simple_interest")(plot_simple_interest)
@@ -0,0 +1,172 @@
+import numpy as np
+
+from .cache import memoize
+from .results import ProjectionResult
+from .simulation import PERCENTILES
+
+# Rebalancing strategies of simulate_portfolio.
+REBALANCING = ("none", "periodic", "threshold")
+
+def _cholesky(volatilities, correlation):
+    """
+    Lower triangular factor of the covariance matrix of the asset returns.
+
+    :param volatilities: Standard deviations of the annual returns (as fractions), one per asset.
+    :param correlation: Correlation matrix of the annual returns, or None for uncorrelated assets.
+    :return: Array L of shape (assets, assets) with L @ L.T equal to the covariance matrix.
+    :raises ValueError: If the correlation matrix is not symmetric with a unit diagonal, or not positive definite.
+    """
+    correlation = np.eye(len(volatilities)) if correlation is None else np.asarray(correlation, dtype = float)
+    if correlation.shape != (len(volatilities),) * 2:
+        raise ValueError(f"The correlation matrix must be of shape {(len(volatilities),) * 2}, got {correlation.shape}.")
+    if not np.allclose(correlation, correlation.T) or not np.allclose(np.diag(correlation), 1):
+        raise ValueError("The correlation matrix must be symmetric with ones on its diagonal.")
+
+    # Covariance_ij = volatility_i * volatility_j * correlation_ij. Assets with no volatility drop out of the factor.
+    covariance = np.outer(volatilities, volatilities) * correlation
+    risky = volatilities > 0
+    factor = np.zeros_like(covariance)
+    try:
+        factor[np.ix_(risky, risky)] = np.linalg.cholesky(covariance[np.ix_(risky, risky)])
+    except np.linalg.LinAlgError:
+        raise ValueError("The correlation matrix must be positive definite.") from None
+
+    return factor
+
+def _asset_parameters(assets, weights, expected_returns, volatilities, ter):
+    """
+    Check the per-asset parameters and turn them from percentage to fraction.
+
+    :return: Tuple of (weights, expected returns, volatilities, TER) arrays of one value per asset.
+    """
+    arrays = []
+    for name, values in (("weights", weights), ("expected_returns", expected_returns), ("volatilities", volatilities), ("ter", ter)):
+        values = np.asarray(values, dtype = float)
+        if values.ndim > 0 and values.shape != (len(assets),):
+            raise ValueError(f"{name} must hold one value per asset ({len(assets)}), got {values.shape}.")
+        arrays.append(np.broadcast_to(values, (len(assets),)) / 100)
+    weights = arrays[0]
+
+    if np.any(weights < 0) or not np.isclose(weights.sum(), 1):
+        raise ValueError(f"Weights must be non negative and add up to 100, got {weights.sum() * 100:g}.")
+    if np.any(arrays[2] < 0):
+        raise ValueError("Volatilities must be non negative.")
+
+    return tuple(arrays)
+
+def simulate_portfolio(assets = ("Stocks", "Bonds", "Cash"),
+                       weights = (60, 30, 10),
+                       expected_returns = (7, 3, 1.5),
+                       volatilities = (15, 6, 1),
+                       correlation = None,
+                       ter = (0.2, 0.15, 0),
+                       initial_investment = 10000,
+                       annual_contribution = 1200,
+                       years = 40,
+                       rebalancing = "periodic",
+                       rebalance_every = 1,
+                       threshold = 5,
+                       num_simulations = 10000,
+                       seed = None,
+                       return_paths = False):
+    """
+    Monte Carlo simulation of a portfolio of several assets with correlated returns and rebalancing to target weights.
+
+    The annual returns of all paths are drawn at once every year, as mean + z @ L.T with z standard normal and L the
+    Cholesky factor of the covariance matrix. Holdings are arrays of shape (assets, paths), grown, topped up and
+    rebalanced with array operations, so the only loop is over the years.
+
+    :param assets: Names of the assets.
+    :param weights: Target weights of the assets (as percentages), adding up to 100.
+    :param expected_returns: Expected annual return of every asset (as a percentage).
+    :param volatilities: Standard deviation of the annual return of every asset (as a percentage).
+    :param correlation: Correlation matrix of the annual returns of the assets. None for uncorrelated assets.
+    :param ter: Total expense ratio of every asset (as a percentage), substracted from its annual return.
+                A single value applies to every asset.
+    :param initial_investment: Amount invested at the target weights at the start of the simulation.
+    :param annual_contribution: Amount invested at the target weights at the end of every year.
+    :param years: Number of years simulated.
+    :param rebalancing: "none" lets the weights drift; "periodic" sells and buys back to the target weights every
+                        rebalance_every years; "threshold" does so in the years where a weight drifted more than
+                        threshold percentage points away from its target.
+    :param rebalance_every: Years between two rebalancings of the "periodic" strategy.
+    :param threshold: Largest drift of a weight (in percentage points) tolerated by the "threshold" strategy.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed for numpy.random.default_rng, for reproducible runs.
+    :param return_paths: Also return the simulated portfolio values of every path.
+    :return: Dictionary with "percentiles" (DataFrame with the portfolio value percentiles for each year), "mean" and
+             "std" (of the portfolio value for each year), "allocation" (ProjectionResult with the "Year" and the mean
+             value held in every asset at the end of each year), "rebalancings" (mean number of rebalancings per path),
+             "num_simulations" and optionally "paths".
+    """
+    if rebalancing not in REBALANCING:
+        raise ValueError(f"Unknown rebalancing {rebalancing!r}, expected one of {REBALANCING}.")
+
+    assets = list(assets)
+    weights, expected_returns, volatilities, ter = _asset_parameters(assets = assets,
+                                                                     weights = weights,
+                                                                     expected_returns = expected_returns,
+                                                                     volatilities = volatilities,
+                                                                     ter = ter)
+    factor = _cholesky(volatilities, correlation)
+    rng = np.random.default_rng(seed)
+
+    # Buffers of shape (assets, paths), reused every year. Each asset is a contiguous row, so the sums over the
+    # assets are a few vector additions.
+    holdings = np.repeat((initial_investment * weights)[:, None], num_simulations, axis = 1)
+    shocks = np.empty_like(holdings)
+    returns = np.empty_like(holdings)
+    totals = np.empty((years, num_simulations))
+    allocation = np.empty((years, len(assets)))
+    rebalancings = np.zeros(num_simulations, dtype = np.int32)
+
+    for year in range(years):
+        # Correlated returns of every asset and path.
+        rng.standard_normal(out = shocks)
+        np.matmul(factor, shocks, out = returns)
+        returns += expected_returns[:, None]
+
+        # Grow net of the fees, then invest the contribution at the target weights. A year can not lose more than
+        # the whole holding, fees included.
+        returns += (1 - ter)[:, None]
+        np.maximum(returns, 0.01, out = returns)
+        holdings *= returns
+        holdings += (annual_contribution * weights)[:, None]
+        total = np.add.reduce(holdings, axis = 0, out = totals[year])
+
+        # Sell and buy back to the target weights on the rebalanced paths.
+        if rebalancing == "periodic" and (year + 1) % rebalance_every == 0:
+            np.multiply(weights[:, None], total, out = holdings)
+            rebalancings += 1
+        elif rebalancing == "threshold":
+            # Drift of the weights, in the returns buffer which is free again.
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                np.divide(holdings, total, out = returns)
+            returns -= weights[:, None]
+            np.abs(returns, out = returns)
+            rebalanced = np.flatnonzero(np.max(returns, axis = 0) > threshold / 100)
+            holdings[:, rebalanced] = weights[:, None] * total[rebalanced]
+            rebalancings[rebalanced] += 1
+
+        allocation[year] = holdings.mean(axis = 1)
+
+    # Percentile bands of the portfolio value for each year. pandas is only loaded once a frame is built.
+    import pandas as pd
+    bands = np.percentile(totals, PERCENTILES, axis = 1)
+    percentiles = pd.DataFrame({"Year": np.arange(1, years + 1),
+                                **{f"P{percentile}": band for percentile, band in zip(PERCENTILES, bands)}})
+
+    result = {"percentiles": percentiles,
+              "mean": totals.mean(axis = 1),
+              "std": totals.std(axis = 1),
+              "allocation": ProjectionResult({"Year": np.arange(1, years + 1),
+                                              **{asset: allocation[:, i] for i, asset in enumerate(assets)}}),
+              "rebalancings": float(rebalancings.mean()),
+              "num_simulations": num_simulations}
+    if return_paths:
+        result["paths"] = totals.T
+
+    return result
+
+# Memoized simulation. Results only hold yearly summaries unless return_paths is set. Unseeded runs are not kept.
+cached_simulate_portfolio = memoize(maxsize = 32, name = "simulate_portfolio", uncached = {"seed": None})(simulate_portfolio)
@@ -0,0 +1,180 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import make_key
+
+# Seconds a queued call waits for a paused prefetcher to resume before it is dropped, so that the background threads
+# never block for good, e.g. when a session ends while paused.
+PAUSE_TIMEOUT = 5
+
+def _shutdown(executor, resume):
+    """
+    Release the waiting calls and stop the background threads of a prefetcher.
+    """
+    resume.set()
+    executor.shutdown(wait = False, cancel_futures = True)
+
+def neighbouring_inputs(inputs, steps, limits = None):
+    """
+    Inputs one widget step away from the current ones, one parameter at a time.
+
+    :param inputs: Dictionary of the current inputs.
+    :param steps: Dictionary of parameter -> step size of its widget, for the parameters to step.
+    :param limits: Dictionary of parameter -> (minimum, maximum) allowed values. None leaves a side open.
+    :return: List of input dictionaries, the closest candidates of the next rerun.
+    """
+    limits = limits or {}
+    neighbours = []
+    for name, step in steps.items():
+        minimum, maximum = limits.get(name, (None, None))
+        for value in (inputs[name] + step, inputs[name] - step):
+            if (minimum is None or value >= minimum) and (maximum is None or value <= maximum):
+                neighbours.append({**inputs, name: value})
+    return neighbours
+
+class Prefetcher:
+    """
+    Speculatively compute a function for the inputs expected next, in background threads.
+
+    Results are kept in a bounded cache of pending and finished calls, and are handed over once: get() removes them,
+    so the caller may modify them (e.g. restyle a figure). The background work is kept out of the way of the foreground:
+    - prefetch() cancels the calls that were queued for earlier inputs and are not expected anymore,
+    - pause() holds queued calls until the next prefetch(), e.g. while the page reruns,
+    - the workers rest between calls so that they use at most cpu_budget of a core.
+    """
+    def __init__(self, func, max_workers = 1, maxsize = 16, cpu_budget = 0.5):
+        """
+        :param func: Function to compute, called with keyword arguments. It must be thread safe.
+        :param max_workers: Number of background threads.
+        :param maxsize: Maximum number of pending and finished calls kept. The oldest are cancelled or dropped first.
+        :param cpu_budget: Fraction of a core each worker may use, between 0 (excluded) and 1.
+        """
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1].")
+
+        self.func = func
+        self.maxsize = maxsize
+        self.cpu_budget = cpu_budget
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "prefetch")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._rest_until = 0.0
+        # Stop the threads once the prefetcher is garbage collected, e.g. with the session state of a closed session.
+        self._finalizer = weakref.finalize(self, _shutdown, self._executor, self._resume)
+
+    def _run(self, kwargs, state):
+        # Wait for the foreground, giving up on calls held too long or dropped meanwhile (cancel() resumes the workers).
+        if not self._resume.wait(PAUSE_TIMEOUT) or state["dropped"]:
+            with self._lock:
+                state["dropped"] = True
+            return None
+
+        # Wait for the rest owed by the previous call, then skip the call if it was dropped in the meantime.
+        time.sleep(max(self._rest_until - time.monotonic(), 0))
+        with self._lock:
+            if state["dropped"]:
+                return None
+            state["started"] = True
+
+        start = time.monotonic()
+        try:
+            return self.func(**kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            self._rest_until = time.monotonic() + elapsed * (1 - self.cpu_budget) / self.cpu_budget
+
+    def _drop(self, entry):
+        """
+        Cancel a call that has not started. Must be called with the lock held.
+
+        :return: Whether the call was cancelled.
+        """
+        future, state = entry
+        future.cancel()
+        state["dropped"] = not state["started"]
+        return state["dropped"]
+
+    def prefetch(self, calls):
+        """
+        Queue the calls expected next and resume the background work. Queued calls that are not expected anymore are
+        cancelled; running ones finish and stay in the cache.
+
+        :param calls: List of keyword argument dictionaries for func.
+        """
+        keys = {make_key(self.func, (), kwargs): kwargs for kwargs in calls}
+        with self._lock:
+            for key in [key for key, entry in self._futures.items() if key not in keys and self._drop(entry)]:
+                del self._futures[key]
+
+            for key, kwargs in keys.items():
+                if key in self._futures:
+                    self._futures.move_to_end(key)
+                    continue
+                state = {"started": False, "dropped": False}
+                self._futures[key] = (self._executor.submit(self._run, kwargs, state), state)
+                while len(self._futures) > self.maxsize:
+                    self._drop(self._futures.popitem(last = False)[1])
+
+        self._resume.set()
+
+    def pause(self):
+        """
+        Hold the queued calls until the next prefetch(). Calls already running finish.
+        """
+        self._resume.clear()
+
+    def get(self, **kwargs):
+        """
+        Return func(**kwargs), from the background work when it is done or running, computed here otherwise.
+
+        :param kwargs: Keyword arguments of func.
+        """
+        with self._lock:
+            entry = self._futures.pop(make_key(self.func, (), kwargs), None)
+            # A queued call is computed here rather than waiting for its turn.
+            if entry is not None and self._drop(entry):
+                entry = None
+
+        if entry is not None:
+            try:
+                result = entry[0].result()
+            except Exception:
+                pass
+            else:
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        return self.func(**kwargs)
+
+    def cancel(self):
+        """
+        Cancel every queued call and drop the finished ones, e.g. when the inputs jump. Workers waiting on a pause are
+        released, and skip the dropped calls.
+        """
+        with self._lock:
+            for entry in self._futures.values():
+                self._drop(entry)
+            self._futures.clear()
+        self._resume.set()
+
+    def close(self):
+        """
+        Cancel the queued calls and stop the background threads.
+        """
+        self.cancel()
+        self._finalizer()
+
+    def info(self):
+        """
+        :return: Dictionary with the hits, misses and number of calls kept.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._futures), "maxsize": self.maxsize}
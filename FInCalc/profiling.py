@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class Profiler:
+    """
+    Collect timing spans and measurements of the phases of every page run.
+
+    Records are plain dictionaries with "run", "page", "phase", "timestamp" and the measured fields ("seconds" for
+    spans, anything else for measurements). When disabled, spans and measurements cost next to nothing.
+    """
+    def __init__(self, enabled = False, max_records = 5000, log_path = None):
+        """
+        :param enabled: Whether to record anything.
+        :param max_records: Maximum number of records kept in memory; the oldest are dropped first.
+        :param log_path: Optional file where every record is also appended as a JSON line, for aggregation across sessions.
+        """
+        self.enabled = enabled
+        self.records = deque(maxlen = max_records)
+        self.log_path = log_path
+        self.run = 0
+        self.page = None
+        self._lock = threading.Lock()
+
+    def start_run(self, page):
+        """
+        Start a new page run. Later records are tagged with its number and page.
+
+        :param page: Name of the page being run.
+        """
+        self.run += 1
+        self.page = page
+
+    @contextmanager
+    def span(self, phase, **fields):
+        """
+        Time the enclosed block as one phase of the current run.
+
+        :param phase: Name of the phase, e.g. "compute", "figure" or "render".
+        :param fields: Extra fields stored with the record.
+        :return: The dictionary of extra fields, which the enclosed block can add to.
+        """
+        if not self.enabled:
+            yield fields
+            return
+
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(phase, seconds = time.perf_counter() - start, **fields)
+
+    def record(self, phase, **fields):
+        """
+        Store a measurement of the current run.
+
+        :param phase: Name of the phase the measurement belongs to.
+        :param fields: Measured fields.
+        """
+        if not self.enabled:
+            return
+
+        record = {"run": self.run, "page": self.page, "phase": phase, "timestamp": time.time(), **fields}
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                with open(self.log_path, "a") as handle:
+                    handle.write(json.dumps(record) + "\n")
+
+    def record_figure(self, name, fig, **fields):
+        """
+        Store the size of the JSON payload sent to the browser for a Plotly figure. Serializes the figure, so only
+        does it when enabled.
+
+        :param name: Name of the figure, e.g. "bar" or "donut".
+        :param fig: Plotly figure.
+        :param fields: Extra fields stored with the record.
+        """
+        if self.enabled:
+            self.record("payload", figure = name, payload_bytes = len(fig.to_json()), **fields)
+
+    def record_caches(self, caches):
+        """
+        Store the hit rate of every cache.
+
+        :param caches: Dictionary of cache name -> LRUCache.info(), as returned by cache_info().
+        """
+        for name, info in caches.items():
+            self.record("cache", cache = name, hits = info["hits"], misses = info["misses"], hit_rate = info["hit_rate"])
+
+    def last_run(self):
+        """
+        :return: List of the records of the latest run.
+        """
+        return [record for record in self.records if record["run"] == self.run]
+
+    def clear(self):
+        """
+        Drop every record kept in memory.
+        """
+        with self._lock:
+            self.records.clear()
+
+    def to_json(self):
+        """
+        :return: Every record kept in memory, as a JSON array.
+        """
+        return json.dumps(list(self.records))
+
+    def to_csv(self):
+        """
+        :return: Every record kept in memory, as CSV. Columns are the union of the fields of all records.
+        """
+        records = list(self.records)
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames = columns)
+        writer.writeheader()
+        writer.writerows(records)
+        return buffer.getvalue()
@@ -0,0 +1,43 @@
+from .cache import normalize
+
+class RetainedFigure:
+    """
+    Figures of a page kept across reruns, split into data and presentation inputs.
+
+    The figures are built again only when a data input changes. When only presentation inputs change (log scale,
+    palette, font size), the retained figures are patched in place, which costs the same whatever the horizon.
+    The figures are mutated, so keep one RetainedFigure per session (e.g. in st.session_state), never in a shared cache.
+    """
+    def __init__(self, build, restyle):
+        """
+        :param build: Function of the data and presentation inputs, as keyword arguments, returning the figures.
+        :param restyle: Function of the figures and the presentation inputs, as keyword arguments, patching them in place.
+        """
+        self.build = build
+        self.restyle = restyle
+        self.figures = None
+        self.last_action = None
+        self._data_key = None
+        self._presentation_key = None
+
+    def render(self, data, presentation):
+        """
+        Return the figures for the given inputs, building, patching or reusing the retained ones.
+
+        :param data: Dictionary of the inputs the figures are computed from.
+        :param presentation: Dictionary of the inputs that only change their style.
+        :return: The figures, as returned by build.
+        """
+        data_key, presentation_key = normalize(data), normalize(presentation)
+
+        if self.figures is None or data_key != self._data_key:
+            self.figures = self.build(**data, **presentation)
+            self.last_action = "build"
+        elif presentation_key != self._presentation_key:
+            self.restyle(self.figures, **presentation)
+            self.last_action = "restyle"
+        else:
+            self.last_action = "reuse"
+
+        self._data_key, self._presentation_key = data_key, presentation_key
+        return self.figures
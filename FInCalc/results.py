@@ -0,0 +1,96 @@
+import numpy as np
+
+class ProjectionResult:
+    """
+    Column-oriented result of a calculator, backed by contiguous NumPy arrays.
+
+    Only the columns that can not be derived from others are stored. Constant columns are kept as a single value and
+    derived columns are functions of the result, both materialized on first access and then cached. Columns are read
+    with result[name], like a DataFrame, so the plot functions take either; to_frame() builds the DataFrame for
+    pandas consumers.
+    """
+    def __init__(self, columns, constants = None, derived = None, order = None):
+        """
+        :param columns: Dictionary of name -> array of the stored columns, all of the same length.
+        :param constants: Dictionary of name -> value of the columns holding the same value on every row.
+        :param derived: Dictionary of name -> function of the result computing the column. Stored columns take
+                        precedence over derived ones of the same name.
+        :param order: Order of the columns in to_frame(). Defaults to stored, constant, then derived columns.
+        """
+        self._columns = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+        self._constants = dict(constants or {})
+        self._derived = {name: func for name, func in (derived or {}).items() if name not in self._columns}
+        self._cache = {}
+        self.columns = list(order) if order is not None else list(dict.fromkeys([*self._columns, *self._constants, *self._derived]))
+        self._length = len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, name):
+        return name in self._columns or name in self._constants or name in self._derived
+
+    def __getitem__(self, name):
+        if name in self._columns:
+            return self._columns[name]
+        if name not in self._cache:
+            if name in self._constants:
+                self._cache[name] = np.full(self._length, self._constants[name])
+            elif name in self._derived:
+                self._cache[name] = np.ascontiguousarray(self._derived[name](self))
+            else:
+                raise KeyError(name)
+        return self._cache[name]
+
+    def __repr__(self):
+        return f"ProjectionResult({self._length} rows, columns = {self.columns})"
+
+    def keys(self):
+        return list(self.columns)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the stored columns and the columns materialized so far.
+        """
+        return sum(values.nbytes for values in self._columns.values()) + sum(values.nbytes for values in self._cache.values())
+
+    def stored(self):
+        """
+        :return: Dictionary of the stored columns.
+        """
+        return dict(self._columns)
+
+    def constants(self):
+        """
+        :return: Dictionary of the constant columns and their value.
+        """
+        return dict(self._constants)
+
+    def astype(self, dtype):
+        """
+        Cast the stored floating point columns, e.g. to numpy.float32 to halve the memory of large batches.
+        Integer columns are kept as they are.
+
+        :param dtype: Floating point dtype.
+        :return: New ProjectionResult.
+        """
+        columns = {name: values.astype(dtype) if np.issubdtype(values.dtype, np.floating) else values
+                   for name, values in self._columns.items()}
+        return ProjectionResult(columns, constants = self._constants, derived = self._derived, order = self.columns)
+
+    def drop_cache(self):
+        """
+        Release the materialized constant and derived columns.
+        """
+        self._cache.clear()
+
+    def to_frame(self, columns = None):
+        """
+        Build a DataFrame of the result. pandas is only loaded here.
+
+        :param columns: Columns to include, in order. Defaults to every column.
+        :return: pandas.DataFrame.
+        """
+        import pandas as pd
+        return pd.DataFrame({name: self[name] for name in (columns or self.columns)})
@@ -0,0 +1,184 @@
+import numpy as np
+
+from .cache import memoize
+from .calculators import BATCH_COLUMNS, COMPOUND_COLUMNS, COMPOUND_DERIVED, _effective_return
+from .results import ProjectionResult
+
+def yearly_schedule(values, times_compounded = 12):
+    """
+    Spread yearly values over the compounding periods of each year, e.g. a contribution raised every year.
+
+    :param values: One value per year, or arrays with one year per element along the last axis.
+    :param times_compounded: Number of times interest is compounded per year.
+    :return: Array with times_compounded periods per year along the last axis.
+    """
+    return np.repeat(np.asarray(values, dtype = float), times_compounded, axis = -1)
+
+def _period_values(value, periods, name):
+    """
+    Turn a scalar or a schedule into an array whose last axis runs over the periods.
+
+    :param value: Scalar, array of one value per period, or array of schedules (one per row).
+    :param periods: Number of periods of the schedule.
+    :param name: Name of the parameter, for error messages.
+    :return: Array broadcastable against (..., periods).
+    """
+    value = np.asarray(value, dtype = float)
+    if value.ndim and value.shape[-1] not in (1, periods):
+        raise ValueError(f"The {name} schedule has {value.shape[-1]} periods instead of times_compounded * years = {periods}.")
+    return value
+
+def cash_flow_schedule(principal = 1500,
+                       annual_rate = 5,
+                       times_compounded = 12,
+                       years = 35,
+                       contribution = 100,
+                       lump_sum = 0,
+                       withdrawal = 0,
+                       ter = 0,
+                       inflation_rate = 0):
+    """
+    Evaluate an investment period by period, with cash flows, rates and inflation that change over time.
+
+    Every one of annual_rate, contribution, lump_sum, withdrawal, ter and inflation_rate accepts a scalar, an array
+    with one value per period (times_compounded * years of them), or an array of such schedules, one per row, to
+    evaluate a batch of scenarios at once. principal accepts a scalar or one value per scenario.
+
+    Each period the balance earns its rate, then the contribution and lump sum are added and the withdrawal taken
+    out, as in compound_interest. The recurrence is evaluated in closed form with cumulative products and sums:
+    with G_k the growth of period 1..k, the balance is G_k * (principal + sum of flow_j / G_j for j <= k).
+    The balance is not floored at zero, so withdrawals larger than the savings show up as a negative balance.
+
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param times_compounded: Number of periods per year.
+    :param years: Number of years the money is invested.
+    :param contribution: Regular contribution added each period.
+    :param lump_sum: One-off amounts added in some periods.
+    :param withdrawal: Amounts taken out each period.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation_rate: Inflation rate (as a percentage) to discount from the returns; 0 leaves them untouched.
+    :return: Dictionary of arrays of shape (..., periods): "Growth", "Total Initial investment", "Contributions"
+             (net cash flows so far), "Total Contributions" (cash flows with their interest) and "Total Show".
+    """
+    periods = int(times_compounded * years)
+    annual_rate, ter, inflation_rate, contribution, lump_sum, withdrawal = [
+        _period_values(value, periods, name) for name, value in (("annual_rate", annual_rate),
+                                                                   ("ter", ter),
+                                                                   ("inflation_rate", inflation_rate),
+                                                                   ("contribution", contribution),
+                                                                   ("lump_sum", lump_sum),
+                                                                   ("withdrawal", withdrawal))]
+
+    # Every schedule runs over the periods along the last axis.
+    shape = np.broadcast_shapes(annual_rate.shape, ter.shape, inflation_rate.shape, (periods,))
+    flow_shape = np.broadcast_shapes(contribution.shape, lump_sum.shape, withdrawal.shape, (periods,))
+
+    # Return of every period, after TER and inflation.
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation_rate != 0, inflation_rate = inflation_rate)
+    period_return = np.broadcast_to(effective_return / times_compounded, shape)
+    if np.any(period_return <= -1):
+        raise ValueError("A period loses all of its value: the return of every period must be above -100%.")
+
+    # Growth of the money invested at the start, up to the end of every period.
+    growth = np.cumprod(1 + period_return, axis = -1)
+
+    # Net cash flow of every period.
+    flows = np.broadcast_to(contribution + lump_sum - withdrawal, flow_shape)
+
+    principal = np.asarray(principal, dtype = float)[..., np.newaxis]
+    amount = principal * growth
+    future_value_of_contributions = growth * np.cumsum(flows / growth, axis = -1)
+
+    return {"Growth": growth,
+            "Total Initial investment": amount,
+            "Contributions": np.cumsum(flows, axis = -1),
+            "Total Contributions": future_value_of_contributions,
+            "Total Show": amount + future_value_of_contributions}
+
+def schedule_interest(principal = 1500,
+                      annual_rate = 5,
+                      times_compounded = 12,
+                      years = 35,
+                      contribution = 100,
+                      lump_sum = 0,
+                      withdrawal = 0,
+                      ter = 0,
+                      inflation_rate = 0,
+                      as_frame = True):
+    """
+    Calculate the yearly rows of an investment following a cash-flow schedule, with the columns of compound_interest
+    so the same plots can be used. See cash_flow_schedule for the parameters, which take one schedule only.
+
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult with the same columns.
+    :return: DataFrame with the state of the investment at the end of each year.
+    """
+    schedule = cash_flow_schedule(principal = principal,
+                                  annual_rate = annual_rate,
+                                  times_compounded = times_compounded,
+                                  years = years,
+                                  contribution = contribution,
+                                  lump_sum = lump_sum,
+                                  withdrawal = withdrawal,
+                                  ter = ter,
+                                  inflation_rate = inflation_rate)
+
+    # Keep the last period of every year.
+    year = np.arange(1, years + 1)
+    last_periods = year * times_compounded - 1
+    amount, contributions, future_value_of_contributions = [schedule[column][..., last_periods] for column in ("Total Initial investment", "Contributions", "Total Contributions")]
+    if amount.ndim > 1:
+        raise ValueError("schedule_interest takes one schedule; use schedule_interest_batch for many.")
+
+    result = ProjectionResult({'Year': year,
+                               'Total Initial investment': amount,
+                               'Contributions': contributions,
+                               'Total Contributions': future_value_of_contributions},
+                              constants = {"Initial Investment": principal, 'Total': 0},
+                              derived = COMPOUND_DERIVED,
+                              order = COMPOUND_COLUMNS)
+
+    return result.to_frame() if as_frame else result
+
+def schedule_interest_batch(principal = 1500,
+                            annual_rate = 5,
+                            times_compounded = 12,
+                            years = 35,
+                            contribution = 100,
+                            lump_sum = 0,
+                            withdrawal = 0,
+                            ter = 0,
+                            inflation_rate = 0,
+                            as_frame = True):
+    """
+    Evaluate a batch of cash-flow schedules at once, one scenario per row of the schedules. See cash_flow_schedule
+    for the parameters; every scenario shares times_compounded and years.
+
+    :param as_frame: Return a DataFrame. Otherwise return a ProjectionResult with the same columns.
+    :return: DataFrame with the columns of compound_interest but "Year" and "Total", one row per scenario,
+             at the end of the horizon.
+    """
+    schedule = cash_flow_schedule(principal = principal,
+                                  annual_rate = annual_rate,
+                                  times_compounded = times_compounded,
+                                  years = years,
+                                  contribution = contribution,
+                                  lump_sum = lump_sum,
+                                  withdrawal = withdrawal,
+                                  ter = ter,
+                                  inflation_rate = inflation_rate)
+
+    principal, amount, contributions, future_value_of_contributions = [np.atleast_1d(value).ravel() for value in np.broadcast_arrays(
+        principal, *[schedule[column][..., -1] for column in ("Total Initial investment", "Contributions", "Total Contributions")])]
+
+    result = ProjectionResult({"Initial Investment": principal,
+                               'Total Initial investment': amount,
+                               'Contributions': contributions,
+                               'Total Contributions': future_value_of_contributions},
+                              derived = COMPOUND_DERIVED,
+                              order = BATCH_COLUMNS)
+
+    return result.to_frame() if as_frame else result
+
+# Memoized calculator.
+cached_schedule_interest = memoize(maxsize = 256, name = "schedule_interest")(schedule_interest)
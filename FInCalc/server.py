@@ -0,0 +1,501 @@
+import argparse
+import asyncio
+import inspect
+import json
+import math
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from .cli import SCENARIO_COLUMNS, evaluate_scenarios
+from .simulation import BLOCK_SIZE, cached_simulate_retirement, cached_simulate_retirement_streaming, simulate_retirement
+
+# Media type of Arrow IPC stream responses, requested with the Accept header or ?format=arrow.
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Reason phrases of the status codes sent.
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 406: "Not Acceptable",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+# Largest request body accepted, in bytes.
+MAX_BODY = 1 << 20
+
+# Longest horizon of a calculator or simulation request, and most paths of a simulation request.
+MAX_YEARS = 1000
+MAX_SIMULATIONS = 1000000
+
+# Simulations above this number of paths are folded chunk by chunk of BLOCK_SIZE paths.
+STREAMING_SIMULATIONS = 100000
+
+# Most path-years held at once by a simulation: paths (or chunk size) times years.
+MAX_PATH_YEARS = 10000000
+
+# Parameters of simulate_retirement accepted by the API. Paths are never sent back.
+RETIREMENT_PARAMETERS = [name for name in inspect.signature(simulate_retirement).parameters if name != "return_paths"]
+
+# Kind of every simulation parameter: "number", "text", "rule" (dictionary of numbers), or (minimum, maximum) for
+# whole numbers. Parameters marked optional also accept null.
+RETIREMENT_KINDS = {"initial_savings": "number",
+                    "annual_savings": "number",
+                    "annual_expenses": "number",
+                    "annual_return": "number",
+                    "return_volatility": "number",
+                    "inflation_rate": "number",
+                    "inflation_volatility": "number",
+                    "years_to_retirement": (0, MAX_YEARS),
+                    "years_in_retirement": (1, MAX_YEARS),
+                    "sampler": "text",
+                    "block_length": (1, MAX_YEARS),
+                    "withdrawal_rate": "number",
+                    "withdrawal_rule": "text",
+                    "rule_parameters": "rule",
+                    "variance_reduction": "text",
+                    "num_simulations": (1, MAX_SIMULATIONS),
+                    "seed": (0, 2 ** 64 - 1)}
+OPTIONAL_PARAMETERS = ("withdrawal_rate", "rule_parameters", "seed")
+
+class HTTPError(Exception):
+    """
+    Error sent back to the client with its status code.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _json_value(value):
+    """
+    Turn NumPy scalars and arrays into JSON values, NaN and infinities into null.
+    """
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_json_value(item) for item in (value.tolist() if isinstance(value, np.ndarray) else value)]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    return value
+
+def _columns(df):
+    """
+    :return: Dictionary of column name -> list of values of a DataFrame.
+    """
+    return {str(name): _json_value(df[name].to_numpy()) for name in df.columns}
+
+def _arrow_stream(df, metadata = None):
+    """
+    Encode a DataFrame as an Arrow IPC stream.
+
+    :param df: DataFrame to encode.
+    :param metadata: Dictionary stored as JSON in the "fincalc" key of the schema metadata.
+    :raises HTTPError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPError(406, "Arrow responses require pyarrow, install it with `pip install pyarrow`.") from None
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    if metadata is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"fincalc": json.dumps(_json_value(metadata)).encode()})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _is_number(value):
+    """
+    :return: Whether a decoded JSON value is a finite number. Booleans are not numbers.
+    """
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+def _scenarios(payload, calculator, yearly):
+    """
+    Check the scenarios of a calculator request and fill in the default values.
+
+    :param payload: Decoded JSON body: a scenario object or a list of them.
+    :param calculator: "compound" or "simple".
+    :param yearly: Whether one row per year is requested.
+    :return: List of scenario dictionaries with every column of SCENARIO_COLUMNS[calculator].
+    :raises HTTPError: On an unknown parameter or a value that is not a finite number.
+    """
+    defaults = SCENARIO_COLUMNS[calculator]
+    scenarios = payload if isinstance(payload, list) else [payload]
+    if not scenarios:
+        raise HTTPError(400, "Expected at least one scenario.")
+
+    checked = []
+    for scenario in scenarios:
+        if not isinstance(scenario, dict):
+            raise HTTPError(400, "Scenarios must be JSON objects.")
+        unknown = set(scenario) - set(defaults)
+        if unknown:
+            raise HTTPError(400, f"Unknown parameters {sorted(unknown)}, expected {list(defaults)}.")
+        scenario = {**defaults, **scenario}
+        for name, value in scenario.items():
+            if not _is_number(value):
+                raise HTTPError(400, f"{name} must be a finite number.")
+        if not 1 <= scenario["years"] <= MAX_YEARS:
+            raise HTTPError(400, f"years must be between 1 and {MAX_YEARS}.")
+        if scenario.get("times_compounded", 1) < 1:
+            raise HTTPError(400, "times_compounded must be at least 1.")
+        if yearly and scenario["years"] != int(scenario["years"]):
+            raise HTTPError(400, "years must be a whole number for yearly results.")
+        checked.append(scenario)
+
+    return checked
+
+def _retirement_parameters(payload):
+    """
+    Check the parameters of a simulation request against RETIREMENT_KINDS and the memory budget.
+
+    :param payload: Decoded JSON body.
+    :return: Dictionary of keyword arguments of simulate_retirement.
+    :raises HTTPError: On an unknown parameter, a value of the wrong kind or out of bounds, or a run too large.
+    """
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Expected a JSON object of simulate_retirement parameters.")
+    unknown = set(payload) - set(RETIREMENT_PARAMETERS)
+    if unknown:
+        raise HTTPError(400, f"Unknown parameters {sorted(unknown)}, expected {RETIREMENT_PARAMETERS}.")
+
+    for name, value in payload.items():
+        kind = RETIREMENT_KINDS[name]
+        if value is None and name in OPTIONAL_PARAMETERS:
+            continue
+        if kind == "number" and not _is_number(value):
+            raise HTTPError(400, f"{name} must be a finite number.")
+        if kind == "text" and not isinstance(value, str):
+            raise HTTPError(400, f"{name} must be a string.")
+        if kind == "rule" and not (isinstance(value, dict) and all(_is_number(item) for item in value.values())):
+            raise HTTPError(400, f"{name} must be an object of finite numbers.")
+        if isinstance(kind, tuple) and (isinstance(value, bool) or not isinstance(value, int) or not kind[0] <= value <= kind[1]):
+            raise HTTPError(400, f"{name} must be a whole number between {kind[0]} and {kind[1]}.")
+
+    # Paths are held all at once up to STREAMING_SIMULATIONS, one chunk at a time above.
+    defaults = inspect.signature(simulate_retirement).parameters
+    parameters = {name: payload.get(name, defaults[name].default) for name in ("num_simulations", "years_to_retirement", "years_in_retirement")}
+    paths = parameters["num_simulations"] if parameters["num_simulations"] <= STREAMING_SIMULATIONS else BLOCK_SIZE
+    if paths * (parameters["years_to_retirement"] + parameters["years_in_retirement"]) > MAX_PATH_YEARS:
+        raise HTTPError(400, f"Simulations are limited to {MAX_PATH_YEARS} path-years at once: lower num_simulations or the years.")
+
+    return payload
+
+def _retirement_job(parameters):
+    """
+    Run one simulation in a worker process and keep the parts sent back, so only small results are pickled.
+
+    :param parameters: Keyword arguments of simulate_retirement.
+    :return: Tuple of (DataFrame with the percentiles, mean and std of every year, dictionary of the other results).
+    """
+    # Large runs are folded chunk by chunk so memory does not grow with the number of paths. Seeded runs are read
+    # from the disk cache shared by the workers when another request already ran them.
+    if parameters.get("num_simulations", 1000) > STREAMING_SIMULATIONS:
+        if parameters.get("variance_reduction", "none") != "none":
+            raise ValueError(f"Variance reduction is only available for runs of up to {STREAMING_SIMULATIONS} simulations.")
+        result = cached_simulate_retirement_streaming(**{name: value for name, value in parameters.items() if name != "variance_reduction"})
+    else:
+        result = cached_simulate_retirement(**parameters)
+
+    yearly = result["percentiles"].assign(Mean = result["mean"], Std = result["std"])
+    summary = {name: result[name] for name in ("success_probability", "standard_error", "confidence_interval",
+                                               "effective_simulations", "time_to_ruin_counts", "num_simulations")}
+
+    return yearly, summary
+
+class RequestBatcher:
+    """
+    Coalesce the items of concurrent requests into one vectorized call.
+
+    The first item to arrive opens a window; everything submitted until it closes, or until max_batch items are
+    waiting, is evaluated together in a thread, so the event loop keeps accepting requests meanwhile.
+    """
+    def __init__(self, func, window = 0.002, max_batch = 4096):
+        """
+        :param func: Function of a list of items returning a list of results, one per item, in order.
+        :param window: Seconds to wait for more items after the first one.
+        :param max_batch: Number of waiting items that triggers an evaluation right away.
+        """
+        self.func = func
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, items):
+        """
+        Queue the items of one request and wait for their results.
+
+        :param items: List of items.
+        :return: List of results, one per item.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((items, future))
+
+        if sum(len(items) for items, _ in self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._evaluate(pending))
+
+    async def _evaluate(self, pending):
+        items = [item for request_items, _ in pending for item in request_items]
+        self.batches += 1
+        self.items += len(items)
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.func, items)
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        # Hand every request the results of its own items.
+        start = 0
+        for request_items, future in pending:
+            if not future.done():
+                future.set_result(results[start:start + len(request_items)])
+            start += len(request_items)
+
+def _calculator_batch(calculator, yearly):
+    """
+    Vectorized evaluation of a list of scenarios. Every scenario gets the batch results with the bounds of its rows,
+    so a request takes one slice of the batch instead of a copy per scenario.
+    """
+    def evaluate(scenarios):
+        results = evaluate_scenarios(pd.DataFrame(scenarios), calculator = calculator, yearly = yearly)
+
+        # Every scenario spans one row, or one row per year of its horizon.
+        bounds = np.cumsum([0] + [int(scenario["years"]) if yearly else 1 for scenario in scenarios])
+        return [(results, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    return evaluate
+
+class CalculatorServer:
+    """
+    Local HTTP server exposing the calculators as JSON endpoints, on asyncio streams with no web framework.
+
+    - POST /compound_interest and /simple_interest take a scenario object, or a list of them, with the columns of
+      cli.SCENARIO_COLUMNS. Concurrent requests are coalesced into one vectorized batch per calculator. ?yearly=1
+      returns one row per year instead of the end of the horizon.
+    - POST /simulate_retirement takes the keyword arguments of simulate_retirement and runs in a process pool.
+    - GET /health returns the batching counters.
+    Responses are columnar JSON, or Arrow IPC streams with "Accept: application/vnd.apache.arrow.stream" or ?format=arrow.
+    """
+    def __init__(self, window = 0.002, max_batch = 4096, workers = 1):
+        """
+        :param window: Seconds a calculator batch waits for more requests after the first one.
+        :param max_batch: Number of waiting scenarios that triggers a batch right away.
+        :param workers: Number of processes running the simulations.
+        """
+        self.batchers = {(calculator, yearly): RequestBatcher(_calculator_batch(calculator, yearly), window = window, max_batch = max_batch)
+                         for calculator in SCENARIO_COLUMNS for yearly in (False, True)}
+        self.pool = ProcessPoolExecutor(max_workers = workers)
+        self.requests = 0
+        self._server = None
+
+    async def _calculator(self, calculator, query, body, arrow):
+        yearly = query.get("yearly", ["0"])[-1] in ("1", "true")
+        scenarios = _scenarios(body, calculator, yearly)
+        rows = await self.batchers[calculator, yearly].submit(scenarios)
+        results = rows[0][0].iloc[rows[0][1]:rows[-1][2]].reset_index(drop = True)
+
+        if arrow:
+            return ARROW_STREAM, _arrow_stream(results)
+        return "application/json", {"rows": len(results), "columns": _columns(results)}
+
+    async def _retirement(self, body, arrow):
+        parameters = _retirement_parameters(body)
+
+        try:
+            yearly, summary = await asyncio.get_running_loop().run_in_executor(self.pool, _retirement_job, parameters)
+        except (TypeError, ValueError, ImportError) as error:
+            raise HTTPError(400, str(error)) from None
+
+        if arrow:
+            return ARROW_STREAM, _arrow_stream(yearly, metadata = summary)
+        return "application/json", {**_json_value(summary), "yearly": _columns(yearly)}
+
+    def _health(self):
+        return "application/json", {"status": "ok",
+                                    "requests": self.requests,
+                                    "batches": {f"{calculator}{'_yearly' if yearly else ''}": {"batches": batcher.batches, "scenarios": batcher.items}
+                                                for (calculator, yearly), batcher in self.batchers.items()}}
+
+    async def handle(self, method, target, headers, body):
+        """
+        Answer one request.
+
+        :param method: HTTP method.
+        :param target: Request target, path and query.
+        :param headers: Dictionary of lower case header names -> values.
+        :param body: Request body.
+        :return: Tuple of (status, content type, body bytes).
+        """
+        self.requests += 1
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        arrow = ARROW_STREAM in headers.get("accept", "") or query.get("format", [""])[-1] == "arrow"
+
+        try:
+            if url.path == "/health":
+                if method != "GET":
+                    raise HTTPError(405, "Use GET.")
+                content_type, payload = self._health()
+            elif url.path in ("/compound_interest", "/simple_interest", "/simulate_retirement"):
+                if method != "POST":
+                    raise HTTPError(405, "Use POST with a JSON body.")
+                try:
+                    parameters = json.loads(body or b"{}")
+                except ValueError:
+                    raise HTTPError(400, "The body is not valid JSON.") from None
+
+                if url.path == "/simulate_retirement":
+                    content_type, payload = await self._retirement(parameters, arrow)
+                else:
+                    content_type, payload = await self._calculator(url.path.split("_")[0].lstrip("/"), query, parameters, arrow)
+            else:
+                raise HTTPError(404, f"No endpoint {url.path}.")
+
+            if content_type == "application/json":
+                payload = json.dumps(payload, separators = (",", ":"), allow_nan = False).encode()
+        except HTTPError as error:
+            return error.status, "application/json", json.dumps({"error": str(error)}).encode()
+        except Exception as error:
+            return 500, "application/json", json.dumps({"error": f"{type(error).__name__}: {error}"}).encode()
+
+        return 200, content_type, payload
+
+    async def _connection(self, reader, writer):
+        """
+        Serve the requests of one keep-alive connection, one after the other.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Without a valid length the body can not be told apart from the next request, so the connection is closed.
+                length = headers.get("content-length", "") or "0"
+                length = int(length) if length.isascii() and length.isdigit() else None
+                if length is None:
+                    status, content_type, payload = 400, "application/json", json.dumps({"error": "Content-Length must be a non-negative whole number."}).encode()
+                    keep_alive = False
+                elif length > MAX_BODY:
+                    status, content_type, payload = 413, "application/json", json.dumps({"error": f"Bodies are limited to {MAX_BODY} bytes."}).encode()
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, content_type, payload = await self.handle(method, target, headers, body)
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                              f"Content-Type: {content_type}\r\n"
+                              f"Content-Length: {len(payload)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host = "127.0.0.1", port = 8765):
+        """
+        Start listening.
+
+        :return: Tuple of (host, port) bound, port 0 picking a free one.
+        """
+        self._server = await asyncio.start_server(self._connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        """
+        Stop listening and shut the process pool down.
+        """
+        if self._server is not None:
+            self._server.close()
+        self.pool.shutdown(wait = False, cancel_futures = True)
+
+async def serve(host = "127.0.0.1", port = 8765, window = 0.002, max_batch = 4096, workers = 1):
+    """
+    Run a CalculatorServer until cancelled or sent SIGTERM.
+
+    :param host: Address to listen on. Keep the default to only accept local clients.
+    :param port: Port to listen on, 0 for a free one.
+    :param window: Seconds a calculator batch waits for more requests after the first one.
+    :param max_batch: Number of waiting scenarios that triggers a batch right away.
+    :param workers: Number of processes running the simulations.
+    """
+    server = CalculatorServer(window = window, max_batch = max_batch, workers = workers)
+
+    # Stop on SIGTERM like on Ctrl+C, so the process pool is shut down instead of outliving the server.
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+
+    try:
+        host, port = await server.start(host, port)
+        print(f"Serving on http://{host}:{port}", file = sys.stderr, flush = True)
+        await server.serve_forever()
+    finally:
+        server.close()
+
+def main(argv = None):
+    """
+    Command-line entry point: python -m FInCalc.server [--port 8765]
+    """
+    parser = argparse.ArgumentParser(prog = "python -m FInCalc.server", description = "Serve the FInCalc calculators as a local HTTP JSON API.")
+    parser.add_argument("--host", default = "127.0.0.1", help = "Address to listen on.")
+    parser.add_argument("--port", type = int, default = 8765, help = "Port to listen on, 0 for a free one.")
+    parser.add_argument("--window-ms", type = float, default = 2, help = "Milliseconds a calculator batch waits for more requests.")
+    parser.add_argument("--max-batch", type = int, default = 4096, help = "Waiting scenarios that trigger a batch right away.")
+    parser.add_argument("--workers", type = int, default = 1, help = f"Processes running the simulations (this machine has {os.cpu_count()} CPUs).")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(host = args.host, port = args.port, window = args.window_ms / 1000, max_batch = args.max_batch, workers = args.workers))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,858 @@
+import os
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cache import memoize, persist
+from .historical import block_bootstrap
+from .kernels import rule_fractions, withdrawal_paths
+
+# Samplers of the annual returns and inflation rates.
+SAMPLERS = ("normal", "bootstrap")
+
+# Variance reduction of the "normal" sampler.
+VARIANCE_REDUCTION = ("none", "antithetic", "sobol", "control_variate")
+
+# Independently scrambled Sobol sequences of the "sobol" variance reduction. Their spread gives the standard error.
+SOBOL_REPLICATES = 8
+
+# Percentiles reported in the fan chart bands.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Paths simulated per block in parallel runs. Blocks, not workers, own the random streams,
+# so results only depend on the seed and the block size.
+BLOCK_SIZE = 10000
+
+# Quantile sketch: log10 spaced bins between 1 € and 10^SKETCH_DECADES €, plus one bin for depleted portfolios.
+SKETCH_BINS = 4000
+SKETCH_DECADES = 13
+
+# Relative margin below the maximum rate of the last path required to survive, so the rate returned by
+# safe_withdrawal_rate still meets the target once simulate_retirement rounds the portfolio year by year.
+RATE_MARGIN = 1e-9
+
+def _draw_normal(rng, num_simulations, years, annual_return, return_volatility, inflation_rate, inflation_volatility):
+    """
+    Draw normally distributed annual returns and inflation rates for every path and year.
+
+    :param rng: numpy.random.Generator to draw from.
+    :param num_simulations: Number of paths.
+    :param years: Number of years per path.
+    :param annual_return: Expected annual return (as a fraction).
+    :param return_volatility: Standard deviation of the annual return (as a fraction).
+    :param inflation_rate: Expected annual inflation (as a fraction).
+    :param inflation_volatility: Standard deviation of the annual inflation (as a fraction).
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years).
+    """
+    returns = rng.normal(annual_return, return_volatility, size = (num_simulations, years))
+    inflation = rng.normal(inflation_rate, inflation_volatility, size = (num_simulations, years))
+
+    # A year can not lose more than the whole portfolio.
+    np.maximum(returns, -0.99, out = returns)
+
+    return returns, inflation
+
+def _shocks_to_rates(shocks, years, annual_return, return_volatility, inflation_rate, inflation_volatility):
+    """
+    Turn standard normal shocks of shape (num_simulations, 2 * years) into annual returns and inflation rates.
+
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years).
+    """
+    returns = annual_return + return_volatility * shocks[:, :years]
+    inflation = inflation_rate + inflation_volatility * shocks[:, years:]
+
+    # A year can not lose more than the whole portfolio.
+    np.maximum(returns, -0.99, out = returns)
+
+    return returns, inflation
+
+def _draw_antithetic(rng, num_simulations, years, annual_return, return_volatility, inflation_rate, inflation_volatility):
+    """
+    Draw normally distributed annual returns and inflation rates in antithetic pairs: path i + half mirrors the
+    shocks of path i, so the pair averages out the odd part of the error.
+
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years).
+    """
+    shocks = rng.standard_normal(size = (-(-num_simulations // 2), 2 * years))
+    shocks = np.concatenate([shocks, -shocks])[:num_simulations]
+
+    return _shocks_to_rates(shocks, years, annual_return, return_volatility, inflation_rate, inflation_volatility)
+
+def _replicate_sizes(num_simulations, replicates = SOBOL_REPLICATES):
+    """
+    Split num_simulations paths in nearly equal, consecutive replicates.
+    """
+    return np.diff(np.linspace(0, num_simulations, replicates + 1).astype(np.int64))
+
+def _draw_sobol(rng, num_simulations, years, annual_return, return_volatility, inflation_rate, inflation_volatility):
+    """
+    Draw annual returns and inflation rates from scrambled Sobol points, mapped to normal shocks by the inverse CDF.
+    Every replicate of _replicate_sizes gets its own scrambling. Sizes that are powers of two balance best.
+
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years).
+    :raises ImportError: If SciPy is not installed.
+    """
+    try:
+        from scipy.stats import qmc
+        from scipy.special import ndtri
+    except ImportError:
+        raise ImportError("The sobol variance reduction requires SciPy, install it with `pip install scipy`.") from None
+
+    with warnings.catch_warnings():
+        # SciPy warns on sizes that are not powers of two, which are still valid points.
+        warnings.simplefilter("ignore", UserWarning)
+        points = np.concatenate([qmc.Sobol(d = 2 * years, scramble = True, seed = rng).random(size)
+                                 for size in _replicate_sizes(num_simulations)])
+
+    # Keep the points off 0 and 1, where the inverse CDF is infinite.
+    shocks = ndtri(np.clip(points, np.finfo(float).tiny, 1 - np.finfo(float).epsneg))
+
+    return _shocks_to_rates(shocks, years, annual_return, return_volatility, inflation_rate, inflation_volatility)
+
+def _accumulate(returns, initial_savings, annual_savings, years_to_retirement):
+    """
+    Run the accumulation phase: savings_t = growth_t * (savings_0 + sum(annual_savings / growth_k)).
+
+    :param returns: Annual returns (as a fraction) of shape (num_simulations, years).
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved at the end of every year until retirement.
+    :param years_to_retirement: Number of years of the accumulation phase.
+    :return: Tuple of (savings at the end of every year until retirement, savings at retirement).
+    """
+    growth = np.cumprod(1 + returns[:, :years_to_retirement], axis = 1)
+    savings = growth * (initial_savings + annual_savings * np.cumsum(1 / growth, axis = 1))
+    savings_at_retirement = savings[:, -1] if years_to_retirement > 0 else np.full(returns.shape[0], float(initial_savings))
+
+    return savings, savings_at_retirement
+
+def _withdrawal_costs(returns, inflation, years_to_retirement):
+    """
+    Cost of the withdrawal phase per unit of first-year expenses: the cumulative sum over retirement of the
+    inflation-indexed withdrawal of every year, discounted by the growth of the portfolio before it.
+
+    The portfolio of year t is growth_t * (savings at retirement - annual_expenses * cost_t), so a path survives
+    retirement exactly when annual_expenses * cost_T stays below its savings at retirement.
+
+    :param returns: Annual returns (as a fraction) of shape (num_simulations, years).
+    :param inflation: Annual inflation rates (as a fraction) of shape (num_simulations, years).
+    :param years_to_retirement: Number of years of the accumulation phase.
+    :return: Tuple of (growth of the portfolio since retirement, cost of every year) of shape (num_simulations, years in retirement).
+    """
+    # Withdraw at the start of the year, then grow.
+    indexation = np.cumprod(1 + inflation[:, years_to_retirement:], axis = 1)
+    growth = np.cumprod(1 + returns[:, years_to_retirement:], axis = 1)
+    previous_growth = np.concatenate([np.ones((growth.shape[0], 1)), growth[:, :-1]], axis = 1)
+
+    return growth, np.cumsum(indexation / previous_growth, axis = 1)
+
+def _retirement_paths(returns, inflation, initial_savings, annual_savings, annual_expenses, years_to_retirement, withdrawal_rate = None,
+                      withdrawal_rule = "constant", rule_parameters = None):
+    """
+    Run the accumulation and withdrawal phases over a matrix of annual returns and inflation rates.
+
+    Both phases are linear recurrences under the constant rule, so they are solved in closed form with cumulative
+    products: savings_t = growth_t * (savings_0 + sum(flow_k / growth_k)). The other withdrawal rules depend on the
+    path so far and run through the kernels of withdrawal_paths.
+
+    :param returns: Annual returns (as a fraction) of shape (num_simulations, years).
+    :param inflation: Annual inflation rates (as a fraction) of shape (num_simulations, years).
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved at the end of every year until retirement.
+    :param annual_expenses: Expenses in the first year of retirement, indexed to inflation afterwards.
+    :param years_to_retirement: Number of years of the accumulation phase.
+    :param withdrawal_rate: If given, the first-year expenses of every path are this fraction of its savings at
+                            retirement, instead of annual_expenses.
+    :param withdrawal_rule: One of kernels.WITHDRAWAL_RULES.
+    :param rule_parameters: Dictionary of the parameters of the withdrawal rule (as percentages).
+    :return: Tuple of (portfolio values at the end of every year, year of ruin counted from retirement or NaN).
+    """
+    # Simulate the savings accumulation phase.
+    savings, savings_at_retirement = _accumulate(returns, initial_savings, annual_savings, years_to_retirement)
+    if withdrawal_rate is not None:
+        annual_expenses = withdrawal_rate * savings_at_retirement[:, None]
+
+    if withdrawal_rule != "constant":
+        portfolio, time_to_ruin = withdrawal_paths(savings = savings_at_retirement,
+                                                   returns = returns[:, years_to_retirement:],
+                                                   inflation = inflation[:, years_to_retirement:],
+                                                   expenses = np.ravel(annual_expenses),
+                                                   rule = withdrawal_rule,
+                                                   parameters = rule_parameters)
+        return np.concatenate([savings, portfolio], axis = 1), time_to_ruin
+
+    # Simulate the retirement phase.
+    growth, costs = _withdrawal_costs(returns, inflation, years_to_retirement)
+    portfolio = growth * (savings_at_retirement[:, None] - annual_expenses * costs)
+
+    # Once the portfolio is depleted it stays depleted.
+    ruined = np.logical_or.accumulate(portfolio <= 0, axis = 1)
+    portfolio[ruined] = 0
+    time_to_ruin = np.where(ruined[:, -1], np.argmax(ruined, axis = 1) + 1, np.nan) if ruined.shape[1] > 0 else np.full(returns.shape[0], np.nan)
+
+    return np.concatenate([savings, portfolio], axis = 1), time_to_ruin
+
+def _simulate(rng, num_simulations, initial_savings, annual_savings, annual_expenses, annual_return, return_volatility,
+              inflation_rate, inflation_volatility, years_to_retirement, years_in_retirement, sampler = "normal", block_length = 5,
+              withdrawal_rate = None, withdrawal_rule = "constant", rule_parameters = None):
+    """
+    Draw and run num_simulations paths with rates given as fractions.
+
+    :return: Tuple of (portfolio values at the end of every year, year of ruin counted from retirement or NaN).
+    """
+    returns, inflation = _draw(rng = rng,
+                               num_simulations = num_simulations,
+                               years = years_to_retirement + years_in_retirement,
+                               annual_return = annual_return,
+                               return_volatility = return_volatility,
+                               inflation_rate = inflation_rate,
+                               inflation_volatility = inflation_volatility,
+                               sampler = sampler,
+                               block_length = block_length)
+
+    return _retirement_paths(returns = returns,
+                             inflation = inflation,
+                             initial_savings = initial_savings,
+                             annual_savings = annual_savings,
+                             annual_expenses = annual_expenses,
+                             years_to_retirement = years_to_retirement,
+                             withdrawal_rate = withdrawal_rate,
+                             withdrawal_rule = withdrawal_rule,
+                             rule_parameters = rule_parameters)
+
+def _draw(rng, num_simulations, years, annual_return, return_volatility, inflation_rate, inflation_volatility, sampler, block_length,
+          variance_reduction = "none"):
+    """
+    Draw annual returns and inflation rates with the chosen sampler, rates given as fractions.
+
+    :return: Tuple of (returns, inflation) arrays of shape (num_simulations, years).
+    """
+    if sampler == "bootstrap":
+        return block_bootstrap(rng = rng, num_simulations = num_simulations, years = years, block_length = block_length)
+
+    # Control variates correct the estimate afterwards, from plain draws.
+    draw = {"antithetic": _draw_antithetic, "sobol": _draw_sobol}.get(variance_reduction, _draw_normal)
+    return draw(rng = rng,
+                num_simulations = num_simulations,
+                years = years,
+                annual_return = annual_return,
+                return_volatility = return_volatility,
+                inflation_rate = inflation_rate,
+                inflation_volatility = inflation_volatility)
+
+def _expected_savings(initial_savings, annual_savings, annual_return, years_to_retirement):
+    """
+    Expected savings at retirement with independent annual returns of mean annual_return (as a fraction): the
+    compound_interest closed form with yearly compounding, E[savings_t] = savings_0 * g^t + annual_savings * (g^t - 1) / (g - 1)
+    with g = 1 + annual_return, which also holds for negative returns.
+    """
+    growth = (1 + annual_return) ** years_to_retirement
+    if annual_return == 0:
+        return initial_savings + annual_savings * years_to_retirement
+    return initial_savings * growth + annual_savings * (growth - 1) / annual_return
+
+def _success_estimate(success, variance_reduction, controls = None):
+    """
+    Estimate the probability of success and its standard error, with the estimator of the variance reduction mode.
+
+    :param success: Array with 1 for the paths that never run out of money and 0 for the others.
+    :param variance_reduction: One of VARIANCE_REDUCTION, as used to draw the paths.
+    :param controls: For "control_variate", array of shape (num_simulations, controls) of variables with a known
+                     expectation, already centered on it.
+    :return: Tuple of (probability of success, standard error).
+    """
+    num_simulations = len(success)
+    if variance_reduction == "antithetic":
+        # Pairs of mirrored paths are independent of each other. An odd last path has no pair.
+        half = -(-num_simulations // 2)
+        pairs = (success[:num_simulations - half] + success[half:]) / 2
+        return float(success.mean()), float(pairs.std(ddof = 1) / np.sqrt(len(pairs))) if len(pairs) > 1 else np.nan
+
+    if variance_reduction == "sobol":
+        # Independently scrambled replicates give independent estimates.
+        estimates = [chunk.mean() for chunk in np.split(success, np.cumsum(_replicate_sizes(num_simulations))[:-1])]
+        return float(success.mean()), float(np.std(estimates, ddof = 1) / np.sqrt(len(estimates)))
+
+    if variance_reduction == "control_variate":
+        # Regress the successes on the controls and remove the part explained by their sampling error.
+        scale = controls.std(axis = 0)
+        scaled = controls[:, scale > 0] / scale[scale > 0]
+        centered = scaled - scaled.mean(axis = 0)
+        beta = np.linalg.lstsq(centered, success - success.mean(), rcond = None)[0]
+        residuals = success - centered @ beta
+        estimate = success.mean() - scaled.mean(axis = 0) @ beta
+        return float(np.clip(estimate, 0, 1)), float(residuals.std(ddof = centered.shape[1] + 1) / np.sqrt(num_simulations))
+
+    probability = success.mean()
+    return float(probability), float(np.sqrt(probability * (1 - probability) / num_simulations))
+
+def _effective_simulations(probability, standard_error, num_simulations):
+    """
+    Number of independent paths giving the same standard error on the probability of success.
+    """
+    if not standard_error > 0:
+        return num_simulations
+    return int(round(probability * (1 - probability) / standard_error ** 2))
+
+def _ruin_counts(time_to_ruin, years_in_retirement):
+    """
+    Count the paths depleted in each year of retirement.
+
+    :param time_to_ruin: Years in retirement until the portfolio is depleted, NaN if it never is.
+    :param years_in_retirement: Years in retirement.
+    :return: Integer array where position k holds the number of paths depleted in year k of retirement (position 0 is unused).
+    """
+    ruined = time_to_ruin[~np.isnan(time_to_ruin)].astype(np.int64)
+    return np.bincount(ruined, minlength = years_in_retirement + 1)
+
+class SimulationSummary:
+    """
+    Mergeable summary of simulated paths.
+
+    Keeps the number of paths, the success count, the ruin counts per year of retirement, a histogram sketch of the
+    portfolio value of every year and its running mean and variance. Memory depends on the number of years only,
+    never on the number of paths folded in. The counts merge exactly in any order; the moments are merged with
+    Chan's pairwise update, which is deterministic as long as blocks are merged in the same order.
+    """
+    def __init__(self, years_to_retirement, years_in_retirement):
+        """
+        :param years_to_retirement: Years until retirement.
+        :param years_in_retirement: Years in retirement.
+        """
+        self.years_to_retirement = years_to_retirement
+        self.years_in_retirement = years_in_retirement
+        self.num_simulations = 0
+        self.success_count = 0
+        self.ruin_counts = np.zeros(years_in_retirement + 1, dtype = np.int64)
+        self.histogram = np.zeros((years_to_retirement + years_in_retirement, SKETCH_BINS + 1), dtype = np.int64)
+        self.mean = np.zeros(years_to_retirement + years_in_retirement)
+        self.m2 = np.zeros(years_to_retirement + years_in_retirement)
+
+    def _merge_moments(self, count, mean, m2):
+        """
+        Merge the mean and sum of squared deviations of count other paths into the running moments.
+        """
+        if self.num_simulations == 0:
+            self.mean, self.m2 = mean.copy(), m2.copy()
+            return
+
+        total = self.num_simulations + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.num_simulations * count / total)
+
+    def update(self, paths, time_to_ruin):
+        """
+        Fold a block of simulated paths into the summary.
+
+        :param paths: Portfolio values of shape (num_simulations, years).
+        :param time_to_ruin: Years in retirement until the portfolio is depleted, NaN if it never is.
+        """
+        mean = paths.mean(axis = 0)
+        self._merge_moments(paths.shape[0], mean, ((paths - mean) ** 2).sum(axis = 0))
+
+        self.num_simulations += paths.shape[0]
+        self.success_count += int(np.isnan(time_to_ruin).sum())
+        self.ruin_counts += _ruin_counts(time_to_ruin, self.years_in_retirement)
+
+        # Bin 0 holds everything below 1 €, depleted portfolios included.
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            bins = np.floor(np.log10(paths) * (SKETCH_BINS / SKETCH_DECADES)) + 1
+        bins = np.clip(np.nan_to_num(bins, nan = 0, neginf = 0), 0, SKETCH_BINS).astype(np.int64)
+
+        # One bincount over (year, bin) pairs for the whole block.
+        years = self.histogram.shape[0]
+        flat = bins + np.arange(years) * (SKETCH_BINS + 1)
+        self.histogram += np.bincount(flat.ravel(), minlength = years * (SKETCH_BINS + 1)).reshape(years, SKETCH_BINS + 1)
+
+    def merge(self, other):
+        """
+        Add the counts of another summary of the same simulation.
+
+        :param other: SimulationSummary to merge into this one.
+        """
+        if other.num_simulations == 0:
+            return
+        self._merge_moments(other.num_simulations, other.mean, other.m2)
+
+        self.num_simulations += other.num_simulations
+        self.success_count += other.success_count
+        self.ruin_counts += other.ruin_counts
+        self.histogram += other.histogram
+
+    def quantiles(self, percentiles = PERCENTILES):
+        """
+        Estimate the percentiles of the portfolio value of every year from the histogram sketch.
+
+        :param percentiles: Percentiles to estimate.
+        :return: Array of shape (len(percentiles), years).
+        """
+        cumulative = np.cumsum(self.histogram, axis = 1)
+        targets = np.asarray(percentiles, dtype = float) / 100 * self.num_simulations
+        bands = np.zeros((len(targets), self.histogram.shape[0]))
+
+        for year in range(self.histogram.shape[0]):
+            # Locate the bin holding each target rank and interpolate inside it in log space.
+            bins = np.minimum(np.searchsorted(cumulative[year], targets, side = "right"), SKETCH_BINS)
+            below = np.where(bins > 0, cumulative[year][bins - 1], 0)
+            counts = np.maximum(self.histogram[year][bins], 1)
+            fraction = np.clip((targets - below) / counts, 0, 1)
+            bands[:, year] = np.where(bins > 0, 10 ** ((bins - 1 + fraction) * SKETCH_DECADES / SKETCH_BINS), 0)
+
+        return bands
+
+    def result(self):
+        """
+        :return: Dictionary with "success_probability", "standard_error", "confidence_interval", "effective_simulations",
+                 "percentiles", "mean", "std", "time_to_ruin_counts" and "num_simulations", as in simulate_retirement.
+        """
+        import pandas as pd
+        bands = self.quantiles(PERCENTILES)
+        percentiles = pd.DataFrame({"Year": np.arange(1, self.histogram.shape[0] + 1),
+                                    **{f"P{percentile}": band for percentile, band in zip(PERCENTILES, bands)}})
+
+        # Independent paths: binomial standard error.
+        success_probability = self.success_count / self.num_simulations
+        standard_error = float(np.sqrt(success_probability * (1 - success_probability) / self.num_simulations))
+
+        return {"success_probability": success_probability,
+                "standard_error": standard_error,
+                "confidence_interval": (max(success_probability - 1.96 * standard_error, 0.0), min(success_probability + 1.96 * standard_error, 1.0)),
+                "effective_simulations": self.num_simulations,
+                "percentiles": percentiles,
+                "mean": self.mean.copy(),
+                "std": np.sqrt(self.m2 / self.num_simulations),
+                "time_to_ruin_counts": self.ruin_counts.copy(),
+                "num_simulations": self.num_simulations}
+
+def _simulate_block(seed, num_simulations, parameters):
+    """
+    Simulate one block of paths with its own random stream and summarise it. Runs inside the worker processes.
+
+    :param seed: numpy.random.SeedSequence of the block.
+    :param num_simulations: Number of paths in the block.
+    :param parameters: Keyword arguments of _simulate.
+    :return: SimulationSummary of the block.
+    """
+    paths, time_to_ruin = _simulate(rng = np.random.default_rng(seed), num_simulations = num_simulations, **parameters)
+
+    summary = SimulationSummary(parameters["years_to_retirement"], parameters["years_in_retirement"])
+    summary.update(paths, time_to_ruin)
+
+    return summary
+
+def _block_summaries(parameters, num_simulations, seed, block_size, workers):
+    """
+    Simulate num_simulations paths in blocks and yield the summary of every block, in block order.
+
+    :param parameters: Keyword arguments of _simulate.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed of the numpy.random.SeedSequence the block streams are spawned from.
+    :param block_size: Number of paths per block.
+    :param workers: Number of worker processes; 1 runs in the current process.
+    """
+    # One random stream per block.
+    num_blocks = -(-num_simulations // block_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_blocks)
+    sizes = [min(block_size, num_simulations - block * block_size) for block in range(num_blocks)]
+
+    if workers == 1:
+        for block_seed, size in zip(seeds, sizes):
+            yield _simulate_block(block_seed, size, parameters)
+        return
+
+    # Keep a bounded number of blocks in flight so finished summaries do not pile up in memory.
+    with ProcessPoolExecutor(max_workers = min(workers, num_blocks)) as executor:
+        pending = deque()
+        for block_seed, size in zip(seeds, sizes):
+            pending.append(executor.submit(_simulate_block, block_seed, size, parameters))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _parameters(initial_savings, annual_savings, annual_expenses, annual_return, return_volatility,
+                inflation_rate, inflation_volatility, years_to_retirement, years_in_retirement, sampler, block_length,
+                withdrawal_rate = None, withdrawal_rule = "constant", rule_parameters = None):
+    """
+    Collect the simulation parameters, turning rates from percentage to fraction.
+    """
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler {sampler!r}, expected one of {SAMPLERS}.")
+    # Fail before drawing anything on an unknown rule or parameter.
+    rule_fractions(withdrawal_rule, rule_parameters)
+
+    return {"initial_savings": initial_savings,
+            "annual_savings": annual_savings,
+            "annual_expenses": annual_expenses,
+            "annual_return": annual_return / 100,
+            "return_volatility": return_volatility / 100,
+            "inflation_rate": inflation_rate / 100,
+            "inflation_volatility": inflation_volatility / 100,
+            "years_to_retirement": years_to_retirement,
+            "years_in_retirement": years_in_retirement,
+            "sampler": sampler,
+            "block_length": block_length,
+            "withdrawal_rate": None if withdrawal_rate is None else withdrawal_rate / 100,
+            "withdrawal_rule": withdrawal_rule,
+            "rule_parameters": rule_parameters}
+
+def simulate_retirement(initial_savings = 100000,
+                        annual_savings = 10000,
+                        annual_expenses = 40000,
+                        annual_return = 7,
+                        return_volatility = 15,
+                        inflation_rate = 2,
+                        inflation_volatility = 1,
+                        years_to_retirement = 20,
+                        years_in_retirement = 30,
+                        sampler = "normal",
+                        block_length = 5,
+                        withdrawal_rate = None,
+                        withdrawal_rule = "constant",
+                        rule_parameters = None,
+                        variance_reduction = "none",
+                        num_simulations = 1000,
+                        seed = None,
+                        return_paths = False):
+    """
+    Monte Carlo simulation of saving for and living off a portfolio with stochastic returns and inflation.
+
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved every year until retirement.
+    :param annual_expenses: Expenses in the first year of retirement, indexed to inflation afterwards.
+    :param annual_return: Expected annual return (as a percentage).
+    :param return_volatility: Standard deviation of the annual return (as a percentage).
+    :param inflation_rate: Expected annual inflation (as a percentage).
+    :param inflation_volatility: Standard deviation of the annual inflation (as a percentage).
+    :param years_to_retirement: Years until retirement.
+    :param years_in_retirement: Years in retirement.
+    :param sampler: "normal" draws returns and inflation from normal distributions with the expected values and
+                    volatilities above; "bootstrap" resamples blocks of historical years, ignoring them.
+    :param block_length: Number of consecutive historical years per block of the "bootstrap" sampler.
+    :param withdrawal_rate: If given, the expenses in the first year of retirement are this percentage of the savings
+                            at retirement of every path, instead of annual_expenses.
+    :param withdrawal_rule: "constant" withdraws the first-year expenses indexed to inflation; "guardrails"
+                            (Guyton-Klinger) and "floor_ceiling" adjust them to the path so far, see withdrawal_paths.
+    :param rule_parameters: Dictionary of the parameters of the withdrawal rule (as percentages), overriding
+                            kernels.RULE_DEFAULTS.
+    :param variance_reduction: Sampling of the "normal" sampler, to reach a given standard error with fewer paths.
+                               "none" draws independent paths; "antithetic" draws pairs of paths with mirrored shocks;
+                               "sobol" maps scrambled Sobol points to the shocks (requires SciPy); "control_variate"
+                               corrects the success probability with the sampling error of the savings at retirement
+                               and of the returns in retirement, whose expectations are known in closed form.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed for numpy.random.default_rng, for reproducible runs.
+    :param return_paths: Also return the simulated portfolio values of every path.
+    :return: Dictionary with "success_probability", "standard_error" (of the success probability, with the estimator of
+             the variance reduction), "confidence_interval" (95% interval of the success probability),
+             "effective_simulations" (independent paths needed for the same standard error), "percentiles" (DataFrame
+             with the portfolio value percentiles for each year), "mean" and "std" (of the portfolio value for each
+             year), "time_to_ruin" (years in retirement until the portfolio is depleted, NaN if it never is),
+             "time_to_ruin_counts" (paths depleted in each year of retirement), "num_simulations" and optionally "paths".
+    """
+    if variance_reduction not in VARIANCE_REDUCTION:
+        raise ValueError(f"Unknown variance reduction {variance_reduction!r}, expected one of {VARIANCE_REDUCTION}.")
+    if variance_reduction != "none" and sampler != "normal":
+        raise ValueError("Variance reduction is only available with the normal sampler.")
+
+    parameters = _parameters(initial_savings = initial_savings,
+                             annual_savings = annual_savings,
+                             annual_expenses = annual_expenses,
+                             annual_return = annual_return,
+                             return_volatility = return_volatility,
+                             inflation_rate = inflation_rate,
+                             inflation_volatility = inflation_volatility,
+                             years_to_retirement = years_to_retirement,
+                             years_in_retirement = years_in_retirement,
+                             sampler = sampler,
+                             block_length = block_length,
+                             withdrawal_rate = withdrawal_rate,
+                             withdrawal_rule = withdrawal_rule,
+                             rule_parameters = rule_parameters)
+    years = years_to_retirement + years_in_retirement
+
+    returns, inflation = _draw(rng = np.random.default_rng(seed),
+                               num_simulations = num_simulations,
+                               years = years,
+                               annual_return = parameters["annual_return"],
+                               return_volatility = parameters["return_volatility"],
+                               inflation_rate = parameters["inflation_rate"],
+                               inflation_volatility = parameters["inflation_volatility"],
+                               sampler = sampler,
+                               block_length = block_length,
+                               variance_reduction = variance_reduction)
+    paths, time_to_ruin = _retirement_paths(returns = returns,
+                                            inflation = inflation,
+                                            initial_savings = initial_savings,
+                                            annual_savings = annual_savings,
+                                            annual_expenses = annual_expenses,
+                                            years_to_retirement = years_to_retirement,
+                                            withdrawal_rate = parameters["withdrawal_rate"],
+                                            withdrawal_rule = withdrawal_rule,
+                                            rule_parameters = rule_parameters)
+
+    # Controls of the "control_variate" mode, centered on their expectation: the savings at retirement and the
+    # returns of every year in retirement. Both drive the success of a path.
+    controls = None
+    if variance_reduction == "control_variate":
+        savings_at_retirement = paths[:, years_to_retirement - 1] if years_to_retirement > 0 else np.full(num_simulations, float(initial_savings))
+        expected_savings = _expected_savings(initial_savings, annual_savings, parameters["annual_return"], years_to_retirement)
+        controls = np.column_stack([savings_at_retirement - expected_savings, returns[:, years_to_retirement:] - parameters["annual_return"]])
+    success_probability, standard_error = _success_estimate(np.isnan(time_to_ruin).astype(float), variance_reduction, controls)
+
+    # Percentile bands of the portfolio value for each year. pandas is only loaded once a frame is built.
+    import pandas as pd
+    bands = np.percentile(paths.T, PERCENTILES, axis = 1)
+    percentiles = pd.DataFrame({"Year": np.arange(1, years + 1),
+                                **{f"P{percentile}": band for percentile, band in zip(PERCENTILES, bands)}})
+
+    result = {"success_probability": success_probability,
+              "standard_error": standard_error,
+              "confidence_interval": (max(success_probability - 1.96 * standard_error, 0.0), min(success_probability + 1.96 * standard_error, 1.0)),
+              "effective_simulations": _effective_simulations(success_probability, standard_error, num_simulations),
+              "percentiles": percentiles,
+              "mean": paths.mean(axis = 0),
+              "std": paths.std(axis = 0),
+              "time_to_ruin": time_to_ruin,
+              "time_to_ruin_counts": _ruin_counts(time_to_ruin, years_in_retirement),
+              "num_simulations": num_simulations}
+    if return_paths:
+        result["paths"] = paths
+
+    return result
+
+def simulate_retirement_parallel(initial_savings = 100000,
+                                 annual_savings = 10000,
+                                 annual_expenses = 40000,
+                                 annual_return = 7,
+                                 return_volatility = 15,
+                                 inflation_rate = 2,
+                                 inflation_volatility = 1,
+                                 years_to_retirement = 20,
+                                 years_in_retirement = 30,
+                                 sampler = "normal",
+                                 block_length = 5,
+                                 withdrawal_rate = None,
+                                 withdrawal_rule = "constant",
+                                 rule_parameters = None,
+                                 num_simulations = 1000000,
+                                 seed = None,
+                                 workers = None,
+                                 block_size = BLOCK_SIZE):
+    """
+    Run simulate_retirement over a process pool.
+
+    Paths are split in blocks of block_size, each with an independent random stream spawned from
+    numpy.random.SeedSequence(seed). Every block is summarised in its worker and the summaries are merged in the parent,
+    so for a given seed and block size the results are bit-identical whatever the number of workers.
+
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved every year until retirement.
+    :param annual_expenses: Expenses in the first year of retirement, indexed to inflation afterwards.
+    :param annual_return: Expected annual return (as a percentage).
+    :param return_volatility: Standard deviation of the annual return (as a percentage).
+    :param inflation_rate: Expected annual inflation (as a percentage).
+    :param inflation_volatility: Standard deviation of the annual inflation (as a percentage).
+    :param years_to_retirement: Years until retirement.
+    :param years_in_retirement: Years in retirement.
+    :param sampler: "normal" draws returns and inflation from normal distributions with the expected values and
+                    volatilities above; "bootstrap" resamples blocks of historical years, ignoring them.
+    :param block_length: Number of consecutive historical years per block of the "bootstrap" sampler.
+    :param withdrawal_rate: If given, the expenses in the first year of retirement are this percentage of the savings
+                            at retirement of every path, instead of annual_expenses.
+    :param withdrawal_rule: "constant" withdraws the first-year expenses indexed to inflation; "guardrails"
+                            (Guyton-Klinger) and "floor_ceiling" adjust them to the path so far, see withdrawal_paths.
+    :param rule_parameters: Dictionary of the parameters of the withdrawal rule (as percentages), overriding
+                            kernels.RULE_DEFAULTS.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed of the numpy.random.SeedSequence the block streams are spawned from.
+    :param workers: Number of worker processes. Defaults to the number of CPUs; 1 runs in the current process.
+    :param block_size: Number of paths per block.
+    :return: Dictionary with "success_probability", "standard_error", "confidence_interval", "effective_simulations",
+             "percentiles" (estimated from a histogram sketch), "mean", "std", "time_to_ruin_counts" and "num_simulations".
+    """
+    parameters = _parameters(initial_savings = initial_savings,
+                             annual_savings = annual_savings,
+                             annual_expenses = annual_expenses,
+                             annual_return = annual_return,
+                             return_volatility = return_volatility,
+                             inflation_rate = inflation_rate,
+                             inflation_volatility = inflation_volatility,
+                             years_to_retirement = years_to_retirement,
+                             years_in_retirement = years_in_retirement,
+                             sampler = sampler,
+                             block_length = block_length,
+                             withdrawal_rate = withdrawal_rate,
+                             withdrawal_rule = withdrawal_rule,
+                             rule_parameters = rule_parameters)
+
+    summary = SimulationSummary(years_to_retirement, years_in_retirement)
+    for block_summary in _block_summaries(parameters, num_simulations, seed, block_size, workers or os.cpu_count() or 1):
+        summary.merge(block_summary)
+
+    return summary.result()
+
+def simulate_retirement_streaming(initial_savings = 100000,
+                                  annual_savings = 10000,
+                                  annual_expenses = 40000,
+                                  annual_return = 7,
+                                  return_volatility = 15,
+                                  inflation_rate = 2,
+                                  inflation_volatility = 1,
+                                  years_to_retirement = 20,
+                                  years_in_retirement = 30,
+                                  sampler = "normal",
+                                  block_length = 5,
+                                  withdrawal_rate = None,
+                                  withdrawal_rule = "constant",
+                                  rule_parameters = None,
+                                  num_simulations = 1000000,
+                                  seed = None,
+                                  chunk_size = BLOCK_SIZE):
+    """
+    Run simulate_retirement in fixed-size chunks, folding every chunk into running statistics before drawing the next one.
+
+    Peak memory depends on chunk_size and the number of years, not on num_simulations. Chunks use the same random
+    streams as the blocks of simulate_retirement_parallel, so both return the same results for the same seed and size.
+
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved every year until retirement.
+    :param annual_expenses: Expenses in the first year of retirement, indexed to inflation afterwards.
+    :param annual_return: Expected annual return (as a percentage).
+    :param return_volatility: Standard deviation of the annual return (as a percentage).
+    :param inflation_rate: Expected annual inflation (as a percentage).
+    :param inflation_volatility: Standard deviation of the annual inflation (as a percentage).
+    :param years_to_retirement: Years until retirement.
+    :param years_in_retirement: Years in retirement.
+    :param sampler: "normal" draws returns and inflation from normal distributions with the expected values and
+                    volatilities above; "bootstrap" resamples blocks of historical years, ignoring them.
+    :param block_length: Number of consecutive historical years per block of the "bootstrap" sampler.
+    :param withdrawal_rate: If given, the expenses in the first year of retirement are this percentage of the savings
+                            at retirement of every path, instead of annual_expenses.
+    :param withdrawal_rule: "constant" withdraws the first-year expenses indexed to inflation; "guardrails"
+                            (Guyton-Klinger) and "floor_ceiling" adjust them to the path so far, see withdrawal_paths.
+    :param rule_parameters: Dictionary of the parameters of the withdrawal rule (as percentages), overriding
+                            kernels.RULE_DEFAULTS.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed of the numpy.random.SeedSequence the chunk streams are spawned from.
+    :param chunk_size: Number of paths simulated at once.
+    :return: Dictionary with "success_probability", "standard_error", "confidence_interval", "effective_simulations",
+             "percentiles" (estimated from a histogram sketch), "mean", "std", "time_to_ruin_counts" and "num_simulations".
+    """
+    return simulate_retirement_parallel(initial_savings = initial_savings,
+                                        annual_savings = annual_savings,
+                                        annual_expenses = annual_expenses,
+                                        annual_return = annual_return,
+                                        return_volatility = return_volatility,
+                                        inflation_rate = inflation_rate,
+                                        inflation_volatility = inflation_volatility,
+                                        years_to_retirement = years_to_retirement,
+                                        years_in_retirement = years_in_retirement,
+                                        sampler = sampler,
+                                        block_length = block_length,
+                                        withdrawal_rate = withdrawal_rate,
+                                        withdrawal_rule = withdrawal_rule,
+                                        rule_parameters = rule_parameters,
+                                        num_simulations = num_simulations,
+                                        seed = seed,
+                                        workers = 1,
+                                        block_size = chunk_size)
+
+def safe_withdrawal_rate(target_success = 95,
+                         initial_savings = 100000,
+                         annual_savings = 10000,
+                         annual_return = 7,
+                         return_volatility = 15,
+                         inflation_rate = 2,
+                         inflation_volatility = 1,
+                         years_to_retirement = 20,
+                         years_in_retirement = 30,
+                         sampler = "normal",
+                         block_length = 5,
+                         num_simulations = 10000,
+                         seed = None,
+                         rates = None):
+    """
+    Find the highest withdrawal rate, as a percentage of the savings at retirement, that succeeds in at least
+    target_success percent of the simulated paths.
+
+    The withdrawal phase is linear in the expenses: with cost_T the inflation-indexed withdrawals of a path discounted
+    by its growth, the path survives exactly when withdrawal_rate * cost_T < 1. A single set of draws thus gives the
+    maximum rate of every path at once, 1 / cost_T, and the success probability of any candidate rate is the share of
+    paths whose maximum is above it. No candidate needs its own simulation.
+
+    The paths are the ones of simulate_retirement with the same seed, so simulate_retirement(withdrawal_rate = ...)
+    reproduces the success probabilities of the curve.
+
+    :param target_success: Required probability of success (as a percentage).
+    :param initial_savings: Savings at the start of the simulation.
+    :param annual_savings: Amount saved every year until retirement.
+    :param annual_return: Expected annual return (as a percentage).
+    :param return_volatility: Standard deviation of the annual return (as a percentage).
+    :param inflation_rate: Expected annual inflation (as a percentage).
+    :param inflation_volatility: Standard deviation of the annual inflation (as a percentage).
+    :param years_to_retirement: Years until retirement.
+    :param years_in_retirement: Years in retirement.
+    :param sampler: "normal" or "bootstrap", as in simulate_retirement.
+    :param block_length: Number of consecutive historical years per block of the "bootstrap" sampler.
+    :param num_simulations: Number of simulated paths.
+    :param seed: Seed for numpy.random.default_rng, for reproducible runs.
+    :param rates: Candidate withdrawal rates (as percentages) of the success curve. Defaults to 0% to 10% by 0.05%.
+    :return: Dictionary with "withdrawal_rate" (highest rate meeting the target, as a percentage, within a relative
+             RATE_MARGIN), "annual_expenses" (first-year expenses at that rate, for the median savings at retirement),
+             "success_curve" (DataFrame with the "Withdrawal Rate" and "Success Probability" of every candidate rate)
+             and "num_simulations".
+    """
+    parameters = _parameters(initial_savings = initial_savings,
+                             annual_savings = annual_savings,
+                             annual_expenses = 0,
+                             annual_return = annual_return,
+                             return_volatility = return_volatility,
+                             inflation_rate = inflation_rate,
+                             inflation_volatility = inflation_volatility,
+                             years_to_retirement = years_to_retirement,
+                             years_in_retirement = years_in_retirement,
+                             sampler = sampler,
+                             block_length = block_length)
+
+    returns, inflation = _draw(rng = np.random.default_rng(seed),
+                               num_simulations = num_simulations,
+                               years = years_to_retirement + years_in_retirement,
+                               annual_return = parameters["annual_return"],
+                               return_volatility = parameters["return_volatility"],
+                               inflation_rate = parameters["inflation_rate"],
+                               inflation_volatility = parameters["inflation_volatility"],
+                               sampler = sampler,
+                               block_length = block_length)
+    _, savings_at_retirement = _accumulate(returns, initial_savings, annual_savings, years_to_retirement)
+    _, costs = _withdrawal_costs(returns, inflation, years_to_retirement)
+
+    # Highest rate every path survives, sorted.
+    max_rates = np.sort(1 / costs[:, -1])
+
+    # The target is met below the maximum rate of the path that has to survive last: that path fails at its maximum.
+    survivors = int(np.ceil(target_success / 100 * num_simulations))
+    withdrawal_rate = max_rates[num_simulations - survivors] * (1 - RATE_MARGIN) if survivors > 0 else np.inf
+
+    # Success probability of every candidate rate: share of paths whose maximum is above it.
+    rates = np.linspace(0, 10, 201) if rates is None else np.asarray(rates, dtype = float)
+    success = 1 - np.searchsorted(max_rates, rates / 100, side = "right") / num_simulations
+
+    import pandas as pd
+    return {"withdrawal_rate": float(withdrawal_rate * 100),
+            "annual_expenses": float(withdrawal_rate * np.median(savings_at_retirement)),
+            "success_curve": pd.DataFrame({"Withdrawal Rate": rates, "Success Probability": success}),
+            "num_simulations": num_simulations}
+
+# Memoized simulations, also stored in the disk cache so seeded runs survive restarts and are shared by every
+# session and process. Unseeded runs and runs returning every path are not kept, and the parallel runs are keyed
+# without the number of workers, which their results do not depend on.
+cached_simulate_retirement = memoize(maxsize = 8, name = "simulate_retirement", uncached = {"seed": None, "return_paths": True})(
+    persist(uncached = {"return_paths": True})(simulate_retirement))
+cached_simulate_retirement_parallel = memoize(maxsize = 8, name = "simulate_retirement_parallel", ignore = ("workers",), uncached = {"seed": None})(
+    persist(ignore = ("workers",))(simulate_retirement_parallel))
+cached_simulate_retirement_streaming = memoize(maxsize = 8, name = "simulate_retirement_streaming", uncached = {"seed": None})(
+    persist()(simulate_retirement_streaming))
+cached_safe_withdrawal_rate = memoize(maxsize = 16, name = "safe_withdrawal_rate", uncached = {"seed": None})(persist()(safe_withdrawal_rate))
@@ -0,0 +1,156 @@
+import numpy as np
+
+from .calculators import _effective_return, _future_values
+
+# Bisection steps of solve_rate. Each one halves the bracket, so 64 steps exhaust double precision.
+BISECTION_STEPS = 64
+
+# Lowest positive effective return searched by solve_rate, as a fraction. compound_interest counts no contribution at
+# a zero return, and loses them to rounding just above it, so targets that saving alone reaches are solved here.
+MIN_RETURN = 1e-6
+
+def _broadcast(*values):
+    """
+    Broadcast scalars and arrays of parameters against each other, as compound_interest_batch does.
+    """
+    return np.broadcast_arrays(*[np.atleast_1d(np.asarray(value, dtype = float)) for value in values])
+
+def solve_contribution(target,
+                       principal = 1500,
+                       annual_rate = 5,
+                       times_compounded = 12,
+                       years = 35,
+                       ter = 0,
+                       inflation = False,
+                       inflation_rate = 2):
+    """
+    Find the regular contribution that makes compound_interest reach a target total, in closed form:
+    contribution = (target - principal * g^N) * i / (g^N - 1), with i the return per period and g = 1 + i.
+
+    Every parameter accepts scalars or arrays, broadcast element-wise, so many targets or scenarios are solved at once.
+
+    :param target: Total to reach at the end of the horizon ("Total Show" of compound_interest).
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param times_compounded: Number of times interest is compounded per year.
+    :param years: Number of years the money is invested.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :return: Array of contributions per period. 0 where the principal alone reaches the target, NaN where no
+             contribution does (negative or zero effective return).
+    """
+    target, principal, annual_rate, times_compounded, years, ter, inflation, inflation_rate = _broadcast(
+        target, principal, annual_rate, times_compounded, years, ter, inflation, inflation_rate)
+
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation != 0, inflation_rate = inflation_rate)
+
+    # Future value of the principal, and of a contribution of 1 per period.
+    amount, annuity = _future_values(principal = principal,
+                                     effective_return = effective_return,
+                                     times_compounded = times_compounded,
+                                     years = years,
+                                     contribution = 1.0)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        contribution = np.maximum((target - amount) / annuity, 0)
+
+    # With no return, compound_interest counts no contribution: only the principal can reach the target.
+    return np.where((annuity > 0) | (target <= amount), contribution, np.nan)
+
+def solve_years(target,
+                principal = 1500,
+                annual_rate = 5,
+                times_compounded = 12,
+                contribution = 100,
+                ter = 0,
+                inflation = False,
+                inflation_rate = 2):
+    """
+    Find the horizon after which compound_interest reaches a target total, in closed form:
+    N = log((target + contribution / i) / (principal + contribution / i)) / log(1 + i) periods, with i the return per period.
+
+    Every parameter accepts scalars or arrays, broadcast element-wise, so many targets or scenarios are solved at once.
+
+    :param target: Total to reach ("Total Show" of compound_interest).
+    :param principal: Initial amount of money.
+    :param annual_rate: Annual interest rate (as a percentage).
+    :param times_compounded: Number of times interest is compounded per year.
+    :param contribution: Regular contribution added each compounding period.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :return: Array of years, fractional: round them up to get the first whole year at the target. 0 where the principal
+             already reaches the target, NaN where it is never reached (negative or zero effective return, nothing invested).
+    """
+    target, principal, annual_rate, times_compounded, contribution, ter, inflation, inflation_rate = _broadcast(
+        target, principal, annual_rate, times_compounded, contribution, ter, inflation, inflation_rate)
+
+    effective_return = _effective_return(annual_rate = annual_rate, ter = ter, inflation = inflation != 0, inflation_rate = inflation_rate)
+    period_return = effective_return / times_compounded
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        perpetuity = contribution / period_return
+        periods = np.log((target + perpetuity) / (principal + perpetuity)) / np.log1p(period_return)
+
+    years = np.where(target <= principal, 0.0, periods / times_compounded)
+    reachable = (target <= principal) | ((effective_return > 0) & (principal + contribution > 0))
+    return np.where(reachable, years, np.nan)
+
+def solve_rate(target,
+               principal = 1500,
+               times_compounded = 12,
+               years = 35,
+               contribution = 100,
+               ter = 0,
+               inflation = False,
+               inflation_rate = 2,
+               max_rate = 100):
+    """
+    Find the annual rate at which compound_interest reaches a target total, by bisection on the effective return.
+
+    The total grows with the return, so every scenario keeps a bracket [low, high] around its solution that is halved
+    at each step. All scenarios are bisected together, in BISECTION_STEPS vectorized steps.
+
+    :param target: Total to reach at the end of the horizon ("Total Show" of compound_interest).
+    :param principal: Initial amount of money.
+    :param times_compounded: Number of times interest is compounded per year.
+    :param years: Number of years the money is invested.
+    :param contribution: Regular contribution added each compounding period.
+    :param ter: total expense ratio to apply to the annual rate.
+    :param inflation: apply an inflation rate to the outcome.
+    :param inflation_rate: Inflation rate applied (as a percentage).
+    :param max_rate: Highest effective annual return searched (as a percentage).
+    :return: Array of annual rates (as percentages, before TER and inflation). The rate giving a zero effective return
+             where the principal alone reaches the target, MIN_RETURN where the contributions are also needed but no
+             interest, NaN where even max_rate does not reach it.
+    """
+    target, principal, times_compounded, years, contribution, ter, inflation, inflation_rate = _broadcast(
+        target, principal, times_compounded, years, contribution, ter, inflation, inflation_rate)
+
+    def total(effective_return):
+        amount, future_value_of_contributions = _future_values(principal = principal,
+                                                               effective_return = effective_return,
+                                                               times_compounded = times_compounded,
+                                                               years = years,
+                                                               contribution = contribution)
+        return amount + future_value_of_contributions
+
+    # Bisect the effective return between MIN_RETURN and max_rate. The totals are the ones compound_interest reports.
+    low = np.full(target.shape, MIN_RETURN)
+    high = np.full(target.shape, max_rate / 100)
+    for _ in range(BISECTION_STEPS):
+        middle = (low + high) / 2
+        below = total(middle) < target
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+
+    # The principal alone reaches the target (compound_interest counts no contribution at a zero return), saving
+    # reaches it with no interest, or nothing below max_rate does.
+    effective_return = np.where(total(np.full(target.shape, MIN_RETURN)) >= target, MIN_RETURN, high)
+    effective_return = np.where(principal >= target, 0.0, effective_return)
+    effective_return = np.where(total(np.full(target.shape, max_rate / 100)) < target, np.nan, effective_return)
+
+    # Undo inflation and TER: effective return = (1 + rate - TER) / (1 + inflation) - 1.
+    inflation_factor = np.where(inflation != 0, 1 + inflation_rate / 100, 1)
+    return ((1 + effective_return) * inflation_factor - 1) * 100 + ter
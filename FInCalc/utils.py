@@ -1,4 +1,5 @@
-import streamlit as st
+import base64
+import functools
 import pandas as pd
 import numpy as np
 import plotly.express as px
@@ -48,7 +49,15 @@ def update_plot_layout(fig, type = None, fontsize = None, font_color = "black"):
             
     return fig
 
+@functools.lru_cache(maxsize = None)
 def get_plotly_colors():
+    """
+    Registry of the plotly color palettes, built once per process.
+
+    The dictionaries are shared by every caller, so treat them as read-only.
+
+    :return: Tuple of dictionaries of palette name -> colors, for the qualitative, sequential and diverging palettes.
+    """
     # Create a dictionary of the colors for each color palette in plotly.
     qualitative_colors = {palette_name: getattr(px.colors.qualitative, palette_name)
                          for palette_name in dir(px.colors.qualitative)
@@ -64,10 +73,22 @@ def get_plotly_colors():
     
     return qualitative_colors, sequential_colors, diverging_colors
 
-def display_palette_as_gradient(palette, continuous = True, num_colors = 100):
+@functools.lru_cache(maxsize = 256)
+def palette_gradient_html(palette, continuous = True, num_colors = 100, add_ends = False):
+    """
+    HTML of a palette rendered as a single line of colored boxes, cached per set of arguments.
+
+    :param palette: Tuple of colors.
+    :param continuous: Whether to resample the palette as a continuous color scale.
+    :param num_colors: Number of colors sampled from the continuous color scale.
+    :param add_ends: Whether to add white and black ends to the palette.
+    """
+    if add_ends:
+        palette = ("rgb(245, 245, 245)",) + palette + ("rgb(0, 0, 0)",)
+
     # Create a continuous color scale based on the selected qualitative palette
-    color_scale = pc.make_colorscale(palette)
     if continuous:
+        color_scale = pc.make_colorscale(list(palette))
         colors_use = pc.sample_colorscale(color_scale, [i/(num_colors-1) for i in range(num_colors)], colortype='rgb')
     else:
         colors_use = palette
@@ -78,8 +99,20 @@ def display_palette_as_gradient(palette, continuous = True, num_colors = 100):
         for color in colors_use
     )
 
+    return f'<div style="display:flex; width:100%;">{color_boxes}</div>'
+
+def display_palette_as_gradient(palette, continuous = True, num_colors = 100, add_ends = False):
+    """
+    Display a palette as a single horizontal line of colors.
+
+    :param palette: Colors of the palette.
+    :param continuous: Whether to resample the palette as a continuous color scale.
+    :param num_colors: Number of colors sampled from the continuous color scale.
+    :param add_ends: Whether to add white and black ends to the palette.
+    """
     # Display the color scale as a single horizontal line
-    st.write(f'<div style="display:flex; width:100%;">{color_boxes}</div>', unsafe_allow_html=True)
+    import streamlit as st
+    st.write(palette_gradient_html(tuple(palette), continuous = continuous, num_colors = num_colors, add_ends = add_ends), unsafe_allow_html=True)
     
 def format_number(num):
     """
@@ -101,6 +134,154 @@ def format_number(num):
         return f"{num:.2f}"
     
 
+# plotly.js typed array codes of the NumPy dtypes that can be sent as binary data.
+TYPED_ARRAY_DTYPES = {"float64": "f8", "float32": "f4", "int32": "i4", "uint32": "u4", "int16": "i2", "uint16": "u2", "int8": "i1", "uint8": "u1"}
+
+# Arrays shorter than this are left as JSON lists, where the encoding would not pay off.
+TYPED_ARRAY_MIN_SIZE = 16
+
+def typed_array(values):
+    """
+    Encode a numeric array as a plotly.js typed array: its raw little-endian bytes in base64. A float64 takes 10.7
+    characters instead of up to 24 as a JSON number, and the browser reads it without parsing numbers.
+    64-bit integers are sent as int32 when they fit, as plotly.js has no 64-bit integer arrays.
+
+    :param values: Numeric array.
+    :return: Dictionary with "dtype", "bdata" and, for arrays of more than one dimension, "shape".
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "iu" and values.dtype.name not in TYPED_ARRAY_DTYPES:
+        fits = values.size == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)
+        values = values.astype(np.int32 if fits else np.float64)
+
+    values = np.ascontiguousarray(values, dtype = values.dtype.newbyteorder("<"))
+    spec = {"dtype": TYPED_ARRAY_DTYPES[values.dtype.name], "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+    if values.ndim > 1:
+        spec["shape"] = ",".join(str(size) for size in values.shape)
+    return spec
+
+def _encode_arrays(value):
+    """
+    Replace the numeric NumPy arrays of a figure dictionary by typed arrays, recursively.
+    """
+    if isinstance(value, np.ndarray):
+        return typed_array(value) if value.dtype.kind in "fiu" and value.size >= TYPED_ARRAY_MIN_SIZE else value
+    if isinstance(value, dict):
+        return {key: _encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_arrays(item) for item in value]
+    return value
+
+class CompactFigure(go.Figure):
+    """
+    Plotly figure serialized with the numeric arrays of its traces as binary typed arrays.
+
+    Plotly validates and stores the arrays as NumPy arrays; only to_dict(), which st.plotly_chart, to_json() and
+    write_html() go through, encodes them. The figure is otherwise a regular go.Figure.
+    """
+    def to_dict(self):
+        fig = super().to_dict()
+        fig["data"] = [_encode_arrays(trace) for trace in fig["data"]]
+        return fig
+
+def even_spacing(values):
+    """
+    Start and step of evenly spaced values, e.g. years or a linspace. A trace can then take x0 and dx instead of
+    sending every value.
+
+    :param values: 1D array of numbers.
+    :return: Tuple of (start, step), or None if the values are not evenly spaced.
+    """
+    values = np.asarray(values)
+    if values.ndim != 1 or len(values) < 2 or values.dtype.kind not in "fiu":
+        return None
+    step = values[1] - values[0]
+    if step == 0 or not np.allclose(np.diff(values), step, rtol = 1e-9, atol = 0):
+        return None
+    return values[0].item(), step.item()
+
+def stacked_bar_plot(x, series, discrete_palette, log_y, compact = False):
+    """
+    Build a stacked bar plot straight from column arrays, with no intermediate long DataFrame.
+
+    A hidden, zero height "Total" trace is added on top to show the total of every bar in the unified hover.
+
+    :param x: Values of the X axis.
+    :param series: Dictionary of name -> Y values, in stacking order.
+    :param discrete_palette: Discrete color palette to use.
+    :param log_y: Whether to log10 scale the Y axis.
+    :param compact: Send the arrays as binary typed arrays, and evenly spaced X values as a start and a step
+                    instead of one copy per trace.
+    """
+    x = np.asarray(x)
+    totals = np.sum([np.asarray(values, dtype = float) for values in series.values()], axis = 0)
+
+    # Every trace shares the X axis.
+    spacing = even_spacing(x) if compact else None
+    x_axis = dict(x = x) if spacing is None else dict(x0 = spacing[0], dx = spacing[1])
+
+    traces = [go.Bar(**x_axis,
+                     y = np.asarray(values),
+                     name = name,
+                     legendgroup = name,
+                     marker = dict(color = discrete_palette[i % len(discrete_palette)],
+                                   line = dict(color = "white", width = 1)),
+                     hovertemplate = f'<b>{name}:</b> %{{y:,.2f}} €' +
+                                     '<extra></extra>')
+              for i, (name, values) in enumerate(series.items())]
+
+    # Surgically insert things in the hover :D.
+    traces.append(go.Bar(**x_axis,
+                         y = np.zeros(len(x)),
+                         name = "Total",
+                         legendgroup = "Total",
+                         customdata = totals,
+                         showlegend = False,
+                         marker = dict(color = "white",
+                                       line = dict(color = "white", width = 1)),
+                         hovertemplate = '<b>Total:</b> %{customdata:,.2f} €' +
+                                         '<extra></extra>'))
+
+    p = (CompactFigure if compact else go.Figure)(data = traces)
+    p.update_layout(barmode = "relative",
+                    yaxis_type = "log" if log_y else None)
+
+    return p
+
+# Layout properties holding the font size set by update_plot_layout.
+FONT_SIZE_PATHS = ("font.size", "legend.font.size", "legend.title.font.size",
+                   "xaxis.tickfont.size", "xaxis.title.font.size", "yaxis.tickfont.size", "yaxis.title.font.size")
+
+def restyle_plot_layout(fig, fontsize, changes = None):
+    """
+    Patch the font sizes set by update_plot_layout, and other layout properties, in place and in a single relayout.
+    Only the given properties are assigned: a full update_layout walks every property of a built figure and costs
+    about as much as building it again.
+
+    :param fig: Plotly plot object, after update_plot_layout.
+    :param fontsize: Font size to apply generally.
+    :param changes: Dictionary of other layout properties to set, by path (e.g. "yaxis.type"). None removes a property.
+    """
+    fig.plotly_relayout({**{path: fontsize for path in FONT_SIZE_PATHS}, **(changes or {})})
+
+    return fig
+
+def restyle_stacked_bar_plot(fig, discrete_palette, log_y, fontsize):
+    """
+    Patch the colors, Y axis scale and font sizes of a themed stacked_bar_plot figure in place, leaving its data untouched.
+
+    :param fig: Figure returned by stacked_bar_plot, after update_plot_layout and with a hover label font size.
+    :param discrete_palette: Discrete color palette to use.
+    :param log_y: Whether to log10 scale the Y axis.
+    :param fontsize: Font size to use in the plot.
+    """
+    # Every trace but the hidden "Total" one on top takes the next color of the palette.
+    fig.plotly_restyle({"marker.color": [discrete_palette[i % len(discrete_palette)] for i in range(len(fig.data) - 1)]},
+                       trace_indexes = list(range(len(fig.data) - 1)))
+
+    return restyle_plot_layout(fig, fontsize = fontsize, changes = {"yaxis.type": "log" if log_y else None,
+                                                                    "hoverlabel.font.size": fontsize})
+
 def donut_plot(data, discrete_palette, fontsize):
 
     p = go.Pie(labels = data["Type"],
@@ -120,4 +301,16 @@ def donut_plot(data, discrete_palette, fontsize):
 
     p = update_plot_layout(fig = p, type = "pie", fontsize = fontsize)
     
-    return p
\ No newline at end of file
+    return p
+
+def restyle_donut_plot(fig, discrete_palette, fontsize):
+    """
+    Patch the colors and the font size of a donut_plot figure in place, leaving its data untouched.
+
+    :param fig: Figure returned by donut_plot.
+    :param discrete_palette: Discrete color palette to use.
+    :param fontsize: Font size to use in the plot.
+    """
+    fig.plotly_restyle({"marker.colors": [list(discrete_palette)]}, trace_indexes = [0])
+
+    return restyle_plot_layout(fig, fontsize = fontsize)
@@ -0,0 +1,155 @@
+"""
+Load test of the FInCalc HTTP API.
+
+Usage:
+    python benchmarks/load_test.py [--connections 64] [--requests 4000] [--simulations 40] [--workers 4]
+
+Starts `python -m FInCalc.server` on a free local port for every configuration, drives it with keep-alive
+connections from an asyncio client and reports throughput and latency:
+- compound_interest requests without batching (--max-batch 1) and with a short batching window;
+- simulate_retirement requests with a single worker process and with --workers processes.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def start_server(*options):
+    """
+    Start the server in a subprocess and wait until it listens. Its disk cache is disabled, so no configuration reads
+    back the results of an earlier one.
+
+    :param options: Extra command-line options of FInCalc.server.
+    :return: Tuple of (process, port).
+    """
+    process = subprocess.Popen([sys.executable, "-m", "FInCalc.server", "--port", "0", *options],
+                               cwd = ROOT, env = {**os.environ, "FINCALC_CACHE_DIR": ""}, stderr = subprocess.PIPE, text = True)
+    line = process.stderr.readline()
+    match = re.search(r":(\d+)$", line.strip())
+    if match is None:
+        process.kill()
+        raise RuntimeError(f"The server did not start: {line}{process.stderr.read()}")
+
+    return process, int(match.group(1))
+
+async def _request(reader, writer, path, body):
+    """
+    Send one POST request on a keep-alive connection and read the response.
+
+    :return: Tuple of (status, body).
+    """
+    payload = json.dumps(body).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+
+    return status, await reader.readexactly(length)
+
+async def _load(port, path, bodies, connections):
+    """
+    Send the requests from concurrent keep-alive connections, each taking the next body until none is left.
+
+    :return: Tuple of (elapsed seconds, list of latencies in seconds).
+    """
+    queue = list(reversed(bodies))
+    latencies = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        while queue:
+            body = queue.pop()
+            start = time.perf_counter()
+            status, response = await _request(reader, writer, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"{path} returned {status}: {response[:200]}")
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+
+    return time.perf_counter() - start, latencies
+
+def run(name, options, path, warmup, bodies, connections):
+    """
+    Start a server, load it, print one line of results and return them.
+
+    :param warmup: Request bodies sent before timing, distinct from bodies so none of them is served from a cache.
+    :param bodies: Request bodies timed.
+    """
+    process, port = start_server(*options)
+    try:
+        # Warm up the connection setup and the calculators before timing.
+        asyncio.run(_load(port, path, warmup, connections))
+        elapsed, latencies = asyncio.run(_load(port, path, bodies, connections))
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies.sort()
+    result = {"name": name,
+              "requests": len(bodies),
+              "requests_per_second": len(bodies) / elapsed,
+              "p50_ms": 1000 * statistics.median(latencies),
+              "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))]}
+    print(f"{name:<40} {result['requests_per_second']:>10.1f} req/s   p50 {result['p50_ms']:>8.2f} ms   p99 {result['p99_ms']:>8.2f} ms")
+
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type = int, default = 64, help = "Concurrent keep-alive connections.")
+    parser.add_argument("--requests", type = int, default = 4000, help = "compound_interest requests per configuration.")
+    parser.add_argument("--window-ms", type = float, default = 2, help = "Batching window of the batched configuration.")
+    parser.add_argument("--simulations", type = int, default = 40, help = "simulate_retirement requests per configuration.")
+    parser.add_argument("--paths", type = int, default = 20000, help = "Simulated paths of every simulate_retirement request.")
+    parser.add_argument("--workers", type = int, default = min(4, os.cpu_count() or 1), help = "Worker processes of the parallel configuration.")
+    parser.add_argument("--output", help = "Write the results as JSON to this path.")
+    args = parser.parse_args(argv)
+
+    # Every request, warm-up included, asks for a different scenario or seed across all configurations, so nothing is
+    # served from a cache.
+    requests = iter(range(2 * (args.connections + args.requests + args.workers + args.simulations)))
+
+    def scenarios(count):
+        return [{"principal": 1000 + i, "annual_rate": 1 + i % 10, "years": 10 + i % 30} for i in itertools.islice(requests, count)]
+
+    def simulations(count):
+        return [{"num_simulations": args.paths, "seed": i} for i in itertools.islice(requests, count)]
+
+    results = [run("compound_interest unbatched", ["--max-batch", "1"], "/compound_interest",
+                   scenarios(args.connections), scenarios(args.requests), args.connections),
+               run(f"compound_interest batched ({args.window_ms:g} ms)", ["--window-ms", str(args.window_ms)], "/compound_interest",
+                   scenarios(args.connections), scenarios(args.requests), args.connections),
+               run("simulate_retirement 1 worker", ["--workers", "1"], "/simulate_retirement",
+                   simulations(args.workers), simulations(args.simulations), args.workers),
+               run(f"simulate_retirement {args.workers} worker{'s' if args.workers > 1 else ''}", ["--workers", str(args.workers)], "/simulate_retirement",
+                   simulations(args.workers), simulations(args.simulations), args.workers)]
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent = 2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
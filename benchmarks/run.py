@@ -0,0 +1,355 @@
+"""
+Benchmark suite for FInCalc.
+
+Usage:
+    python benchmarks/run.py run [--output benchmarks/results/latest.json] [--filter compound] [--quick]
+    python benchmarks/run.py compare benchmarks/baseline.json benchmarks/results/latest.json [--threshold 0.2]
+
+"run" times every benchmark and writes the results as JSON. Save one run as the baseline and "compare" later runs
+against it: benchmarks slower than the baseline by more than the threshold are reported and the command exits with 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Registered benchmarks: name -> (setup returning the callable to time, repeats).
+BENCHMARKS = {}
+
+def benchmark(name, repeats = 5):
+    """
+    Register a benchmark. The decorated function does the setup and returns the callable to time.
+    The callable returns None or a dictionary of extra measurements (e.g. payload sizes) stored with the timings;
+    a "seconds" entry replaces the measured time of that call.
+
+    :param name: Name of the benchmark.
+    :param repeats: Number of timed calls.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, repeats)
+        return setup
+    return decorator
+
+def _palette():
+    return ["#5F4690", "#1D6996", "#38A6A5", "#0F8554", "#73AF48", "#EDAD08", "#E17C05", "#CC503E"]
+
+# Calculators across horizons and compounding frequencies.
+for years in (35, 100, 1000):
+    for times_compounded in (1, 12, 365):
+        @benchmark(f"compound_interest[years={years},n={times_compounded}]", repeats = 20)
+        def _compound(years = years, times_compounded = times_compounded):
+            from FInCalc import compound_interest
+            def run():
+                compound_interest(years = years, times_compounded = times_compounded)
+            return run
+
+    @benchmark(f"simple_interest[years={years}]", repeats = 20)
+    def _simple(years = years):
+        from FInCalc import simple_interest
+        def run():
+            simple_interest(years = years)
+        return run
+
+# Monthly cash-flow schedules over 60 years, alone and in batches.
+for scenarios in (1, 1000, 10000):
+    @benchmark(f"schedule_interest[periods=720,scenarios={scenarios}]", repeats = 10)
+    def _schedule(scenarios = scenarios):
+        import numpy as np
+        from FInCalc import schedule_interest, schedule_interest_batch, yearly_schedule
+        contributions = yearly_schedule(100 * 1.03 ** np.arange(60), 12)
+        if scenarios == 1:
+            def run():
+                schedule_interest(years = 60, contribution = contributions)
+        else:
+            annual_rate = np.linspace(0, 10, scenarios)[:, np.newaxis]
+            def run():
+                schedule_interest_batch(annual_rate = annual_rate, years = 60, contribution = contributions)
+        return run
+
+# Batches of a million scenarios, with the memory held by the result.
+for as_frame in (True, False):
+    @benchmark(f"compound_interest_batch[scenarios=1000000,as_frame={as_frame}]", repeats = 5)
+    def _batch(as_frame = as_frame):
+        import numpy as np
+        from FInCalc import compound_interest_batch
+        annual_rate = np.linspace(0, 10, 1_000_000)
+        def run():
+            result = compound_interest_batch(annual_rate = annual_rate, as_frame = as_frame)
+            return {"result_bytes": int(result.memory_usage(deep = True).sum() if as_frame else result.nbytes)}
+        return run
+
+# Figure construction and payload size.
+for years in (35, 1000):
+    for compact in (False, True):
+        @benchmark(f"plot_compound_interest[years={years}{',compact=True' if compact else ''}]")
+        def _plot_compound(years = years, compact = compact):
+            from FInCalc import compound_interest, plot_compound_interest
+            data = compound_interest(years = years)
+            def run():
+                p, p2 = plot_compound_interest(data = data, discrete_palette = _palette(), log_y = False, fontsize = 14, compact = compact)
+                return {"bar_json_bytes": len(p.to_json()), "donut_json_bytes": len(p2.to_json())}
+            return run
+
+    @benchmark(f"restyle_compound_interest[years={years}]", repeats = 20)
+    def _restyle_compound(years = years):
+        from FInCalc import compound_interest, plot_compound_interest, restyle_compound_interest
+        figures = plot_compound_interest(data = compound_interest(years = years), discrete_palette = _palette(), log_y = False, fontsize = 14)
+        toggles = iter(range(1_000_000))
+        def run():
+            log_y = next(toggles) % 2 == 0
+            restyle_compound_interest(figures, discrete_palette = _palette()[::-1 if log_y else 1], log_y = log_y, fontsize = 12 if log_y else 14)
+        return run
+
+    @benchmark(f"prefetched_compound_interest[years={years}]", repeats = 20)
+    def _prefetched_compound(years = years):
+        import time
+        from FInCalc import Prefetcher, cached_compound_interest, neighbouring_inputs, plot_compound_interest
+        prefetcher = Prefetcher(plot_compound_interest, cpu_budget = 1)
+        presentation = dict(discrete_palette = _palette(), log_y = False, fontsize = 14)
+        state = {"parameters": dict(annual_rate = 5.0, years = years, contribution = 100)}
+        def run():
+            # Step the growth rate, with the neighbours of the previous step prefetched and given time to finish.
+            parameters = state["parameters"] = {**state["parameters"], "annual_rate": state["parameters"]["annual_rate"] + 0.01}
+            start = time.perf_counter()
+            prefetcher.get(data = cached_compound_interest(**parameters, as_frame = False), **presentation)
+            seconds = time.perf_counter() - start
+            prefetcher.prefetch([dict(data = cached_compound_interest(**neighbour, as_frame = False), **presentation)
+                                 for neighbour in neighbouring_inputs(parameters, steps = {"annual_rate": 0.01})])
+            time.sleep(0.2)
+            return {"seconds": seconds}
+        return run
+
+    @benchmark(f"plot_simple_interest[years={years}]")
+    def _plot_simple(years = years):
+        from FInCalc import simple_interest, plot_simple_interest
+        data = simple_interest(years = years)
+        def run():
+            p = plot_simple_interest(data = data, discrete_palette = _palette(), log_y = False, fontsize = 14)
+            return {"json_bytes": len(p.to_json())}
+        return run
+
+# Compact payloads: binary typed arrays and start/step axes.
+for compact in (False, True):
+    @benchmark(f"plot_compound_interest_heatmap[200x200,compact={compact}]")
+    def _heatmap(compact = compact):
+        import numpy as np
+        from FInCalc import compound_interest_grid, plot_compound_interest_heatmap
+        rates, contributions = np.linspace(0, 10, 200), np.linspace(0, 1000, 200)
+        grid = compound_interest_grid(annual_rate = rates, contribution = contributions)[:, 0, :, 0, 0]
+        def run():
+            p = plot_compound_interest_heatmap(data = grid, annual_rate = rates, contribution = contributions,
+                                               continuous_palette = ["white", "black"], fontsize = 14, compact = compact)
+            return {"json_bytes": len(p.to_json())}
+        return run
+
+    @benchmark(f"plot_retirement[paths=1000,compact={compact}]")
+    def _retirement(compact = compact):
+        from FInCalc import simulate_retirement, plot_retirement
+        results = simulate_retirement(num_simulations = 1000, seed = 0, return_paths = True)
+        def run():
+            p = plot_retirement(percentiles = results["percentiles"], years_to_retirement = 20, fontsize = 14,
+                                paths = results["paths"], compact = compact)
+            return {"json_bytes": len(p.to_json())}
+        return run
+
+@benchmark("donut_plot")
+def _donut():
+    from FInCalc.utils import donut_plot
+    totals = {"Type": ["Contributions", "Initial Investment", "Interest", "Total"], "Total": [42000, 1500, 78709.82, 0]}
+    def run():
+        p = donut_plot(totals, discrete_palette = _palette(), fontsize = 14)
+        return {"json_bytes": len(p.to_json())}
+    return run
+
+# Retirement simulation across path counts.
+for num_simulations in (1000, 10000, 100000):
+    @benchmark(f"simulate_retirement[paths={num_simulations}]", repeats = 3)
+    def _simulate(num_simulations = num_simulations):
+        from FInCalc import simulate_retirement
+        def run():
+            simulate_retirement(num_simulations = num_simulations, seed = 0)
+        return run
+
+    @benchmark(f"simulate_retirement[bootstrap,paths={num_simulations}]", repeats = 3)
+    def _bootstrap(num_simulations = num_simulations):
+        from FInCalc import simulate_retirement
+        def run():
+            simulate_retirement(num_simulations = num_simulations, seed = 0, sampler = "bootstrap")
+        return run
+
+# Variance reduction: standard error of the success probability at a fixed number of paths.
+for variance_reduction in ("none", "antithetic", "sobol", "control_variate"):
+    @benchmark(f"simulate_retirement[paths=10000,variance_reduction={variance_reduction}]", repeats = 3)
+    def _variance_reduction(variance_reduction = variance_reduction):
+        from FInCalc import simulate_retirement
+        def run():
+            result = simulate_retirement(num_simulations = 10000, seed = 0, variance_reduction = variance_reduction)
+            return {"standard_error": result["standard_error"], "effective_simulations": result["effective_simulations"]}
+        return run
+
+# Path-dependent withdrawal rules, through the Numba kernel when it is installed and the NumPy loop otherwise.
+for rule in ("guardrails", "floor_ceiling"):
+    @benchmark(f"simulate_retirement[rule={rule},paths=100000]", repeats = 3)
+    def _rule(rule = rule):
+        from FInCalc import simulate_retirement
+        def run():
+            simulate_retirement(num_simulations = 100000, seed = 0, withdrawal_rule = rule)
+        return run
+
+    @benchmark(f"withdrawal_paths[rule={rule},paths=100000,engine=numpy]", repeats = 3)
+    def _kernel(rule = rule):
+        import numpy as np
+        from FInCalc import withdrawal_paths
+        rng = np.random.default_rng(0)
+        returns, inflation = rng.normal(0.07, 0.15, (100000, 30)), rng.normal(0.02, 0.01, (100000, 30))
+        def run():
+            withdrawal_paths(savings = 1e6, returns = returns, inflation = inflation, expenses = 40000, rule = rule, engine = "numpy")
+        return run
+
+# Result read back from the disk cache, as after a restart or in another process: memory-mapped arrays, no simulation.
+@benchmark("cached_simulate_retirement[disk,paths=100000]", repeats = 10)
+def _disk_cache():
+    import tempfile
+    from FInCalc import cached_simulate_retirement
+    from FInCalc.cache import CACHES, DiskCache
+    CACHES["disk"] = DiskCache(directory = tempfile.mkdtemp(prefix = "fincalc-benchmark-"))
+    cached_simulate_retirement(num_simulations = 100000, seed = 0)
+    def run():
+        cached_simulate_retirement.cache.clear()
+        cached_simulate_retirement(num_simulations = 100000, seed = 0)
+    return run
+
+# Multi-asset portfolio at the interactive target size: 50000 paths x 5 assets x 40 years.
+for rebalancing in ("none", "periodic", "threshold"):
+    @benchmark(f"simulate_portfolio[paths=50000,assets=5,years=40,rebalancing={rebalancing}]", repeats = 3)
+    def _portfolio(rebalancing = rebalancing):
+        import numpy as np
+        from FInCalc import simulate_portfolio
+        correlation = np.full((5, 5), 0.3)
+        np.fill_diagonal(correlation, 1)
+        def run():
+            result = simulate_portfolio(assets = ["Stocks", "Small caps", "Bonds", "Gold", "Cash"],
+                                        weights = [40, 15, 30, 10, 5],
+                                        expected_returns = [7, 8, 3, 4, 1.5],
+                                        volatilities = [15, 22, 6, 14, 1],
+                                        correlation = correlation,
+                                        ter = 0.2,
+                                        years = 40,
+                                        rebalancing = rebalancing,
+                                        num_simulations = 50000,
+                                        seed = 0)
+            return {"rebalancings": result["rebalancings"]}
+        return run
+
+# Cold imports, each in a fresh interpreter.
+for module in ("FInCalc", "FInCalc.calculators", "FInCalc.simulation"):
+    @benchmark(f"import[{module}]", repeats = 5)
+    def _import(module = module):
+        command = [sys.executable, "-c", f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"]
+        def run():
+            return {"seconds": float(subprocess.run(command, cwd = ROOT, capture_output = True, text = True, check = True).stdout)}
+        return run
+
+def run_benchmarks(pattern = None, quick = False):
+    """
+    Run the registered benchmarks.
+
+    :param pattern: Only run benchmarks whose name contains this string.
+    :param quick: Time every benchmark once.
+    :return: Dictionary with the run metadata and the results by benchmark name.
+    """
+    results = {}
+    for name, (setup, repeats) in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+
+        func = setup()
+        func()  # Warm-up.
+        timings, extra = [], {}
+        for _ in range(1 if quick else repeats):
+            start = time.perf_counter()
+            extra = func() or {}
+            elapsed = time.perf_counter() - start
+            # Benchmarks timing a subprocess report the time measured inside it.
+            timings.append(extra.pop("seconds", elapsed))
+
+        results[name] = {"min": min(timings), "median": statistics.median(timings), "repeats": len(timings), **extra}
+        print(f"{name:<45} {results[name]['median'] * 1000:>10.3f} ms", file = sys.stderr)
+
+    return {"metadata": _metadata(), "results": results}
+
+def _metadata():
+    import numpy
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = ROOT, capture_output = True, text = True).stdout.strip()
+    return {"python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(baseline, current, threshold = 0.2):
+    """
+    Compare two benchmark runs.
+
+    :param baseline: Results of the reference run.
+    :param current: Results of the new run.
+    :param threshold: Relative slowdown of the median above which a benchmark is flagged (0.2 = 20 %).
+    :return: List of (name, baseline median, current median, ratio, regressed) for the benchmarks in both runs.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["median"], result["median"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "FInCalc benchmark suite.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    run_parser = commands.add_parser("run", help = "Run the benchmarks and write the results as JSON.")
+    run_parser.add_argument("--output", default = os.path.join(ROOT, "benchmarks", "results", "latest.json"), help = "JSON file to write.")
+    run_parser.add_argument("--filter", default = None, help = "Only run benchmarks whose name contains this string.")
+    run_parser.add_argument("--quick", action = "store_true", help = "Time every benchmark once.")
+
+    compare_parser = commands.add_parser("compare", help = "Flag regressions of a run against a baseline.")
+    compare_parser.add_argument("baseline", help = "JSON results of the reference run.")
+    compare_parser.add_argument("current", help = "JSON results of the new run.")
+    compare_parser.add_argument("--threshold", type = float, default = 0.2, help = "Relative slowdown flagged as a regression.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(pattern = args.filter, quick = args.quick)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent = 2)
+        print(f"Results written to {args.output}", file = sys.stderr)
+        return 0
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.current) as handle:
+        current = json.load(handle)
+
+    rows = compare(baseline, current, threshold = args.threshold)
+    for name, before, after, ratio, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<45} {before * 1000:>10.3f} ms -> {after * 1000:>10.3f} ms  x{ratio:5.2f}  {flag}")
+
+    regressions = sum(regressed for *_, regressed in rows)
+    print(f"{regressions} regression(s) above {args.threshold:.0%} out of {len(rows)} benchmarks.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import plotly.express as px
 from FInCalc import *
@@ -10,6 +11,7 @@ def main():
     p1 = st.Page(page="./page_directory/01_compound_interest.py", title="Compound interest", icon=":material/query_stats:")
     p2 = st.Page(page="./page_directory/02_simple_interest.py", title="Simple interest", icon=":material/query_stats:")
     p3 = st.Page(page ="./page_directory/03_FIRE.py", title = "Finantial independence", icon = ":material/query_stats:")
+    p4 = st.Page(page = "./page_directory/04_portfolio.py", title = "Portfolio", icon = ":material/query_stats:")
 
     # Generate a header toolkit
     with st.expander("**Theme options**"):
@@ -40,7 +42,7 @@ def main():
                         continuous_colors = st.selectbox("**Sequential**", list(plotly_sequential.keys()), key="sequential_colors", index = list(plotly_sequential.keys()).index("YlGnBu"), help = "Sequential color palette used when plotting continuous data.")
 
                     with col4:
-                        display_palette_as_gradient(plotly_sequential[continuous_colors])
+                        display_palette_as_gradient(plotly_sequential[continuous_colors], add_ends = add_palette_ends)
 
                     col5, col6 = st.columns([2, 8], gap="small", vertical_alignment = "center")
                     with col5:
@@ -48,6 +50,17 @@ def main():
 
                     with col6:
                         display_palette_as_gradient(plotly_divergent[divergent_colors])
+
+    # Keep one profiler per session. Setting FINCALC_PROFILE_LOG also appends every record to that file.
+    if "profiler" not in st.session_state:
+        st.session_state.profiler = Profiler(log_path = os.environ.get("FINCALC_PROFILE_LOG"))
+    profiler = st.session_state.profiler
+
+    # Generate a debug panel, filled once the page has run
+    with st.expander("**Performance**"):
+        profiler.enabled = st.toggle("Record timings", key = "profiler_toggle", help = "Times the input, compute, figure, metrics and render phases of every page run and measures the size of the figures sent to the browser.")
+        st.toggle("Prefetch next steps", key = "prefetch_toggle", help = "Builds the results and figures of the next step of the main inputs in the background, so that stepping through them renders from memory.")
+        performance_panel = st.empty()
     
     # Define color palettes in session state if not already set
     st.session_state.discrete_palette = plotly_qualitative[discrete_colors]
@@ -58,8 +71,23 @@ def main():
     st.session_state.fontsize = fontsize_value
 
     # Install multipage navigation
-    pg = st.navigation(dict(Calculators=[p1, p2, p3]))
-    pg.run()
+    pg = st.navigation(dict(Calculators=[p1, p2, p3, p4]))
+    profiler.start_run(pg.title)
+    with profiler.span("page"):
+        pg.run()
+    profiler.record_caches(cache_info())
+
+    if profiler.enabled:
+        with performance_panel.container():
+            st.dataframe(profiler.last_run(), hide_index = True, use_container_width = True)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.download_button("Export JSON", profiler.to_json(), file_name = "fincalc_profile.json", mime = "application/json", help = "Every record of this session.")
+            with col2:
+                st.download_button("Export CSV", profiler.to_csv(), file_name = "fincalc_profile.csv", mime = "text/csv", help = "Every record of this session.")
+            with col3:
+                if st.button("Clear records"):
+                    profiler.clear()
 
 if __name__ == "__main__":
     main()
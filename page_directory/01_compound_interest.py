@@ -3,6 +3,7 @@ import streamlit as st
 import plotly.express as px
 from streamlit_extras.metric_cards import style_metric_cards
 import pandas as pd
+import numpy as np
 
 def main():
     # Inject CSS
@@ -33,49 +34,192 @@ def main():
 
     discrete_palette = st.session_state.discrete_palette
     fontsize = st.session_state.fontsize
-    with st.expander("**Calculator inputs**", expanded = True):
+    profiler = st.session_state.profiler
+
+    # Keep the figures of the session, patched in place when only the log scale, palettes or font size change.
+    # New figures are taken from the prefetcher, which builds the ones of the next input steps in the background.
+    if "compound_interest_figures" not in st.session_state:
+        st.session_state.compound_interest_prefetcher = Prefetcher(plot_compound_interest)
+        st.session_state.compound_interest_figures = RetainedFigure(build = st.session_state.compound_interest_prefetcher.get, restyle = restyle_compound_interest)
+        st.session_state.compound_interest_heatmap = RetainedFigure(build = plot_compound_interest_heatmap, restyle = restyle_compound_interest_heatmap)
+    prefetcher = st.session_state.compound_interest_prefetcher
+    prefetcher.pause()
+    with profiler.span("inputs"), st.expander("**Calculator inputs**", expanded = True):
+        col1, col2, col3 = st.columns([2, 1, 1], vertical_alignment = "center")
+        with col1:
+            goal_seek = st.toggle("Goal seek", help = "Find the contribution, years or growth rate needed to reach a target, instead of entering it.")
+        with col2:
+            solved = st.selectbox("Solve for", ["Contribution", "Years", "Annual Growth Rate"], disabled = not goal_seek)
+        with col3:
+            target = st.number_input("Target (€)", min_value = 1, value = None, step = 1000, placeholder = "250000", disabled = not goal_seek, help = "Total to reach at the end of the horizon")
+        solved = solved if goal_seek else None
+
         col1, col2, col3, col4 = st.columns(4, vertical_alignment = "center")
         with col1: 
             principal = st.number_input("Initial investment (€)", min_value = 0, value = None, step = 50, placeholder = "1500", help = "Amount in Euros")
-            contribution = st.number_input("Contribution (€)", min_value = 0, value = None, step = 50, placeholder = "100", help = "Recurrent contribution")
+            contribution = st.number_input("Contribution (€)", min_value = 0, value = None, step = 50, placeholder = "100", disabled = solved == "Contribution", help = "Recurrent contribution")
         with col2: 
             times_compounded = st.number_input("Times compounded", min_value = 1, value = None, placeholder = "12", help = "How many times the interest compounds")
-            years = st.number_input("Years", min_value = 1, value = None, placeholder = "35", help = "Time horizon")
+            years = st.number_input("Years", min_value = 1, value = None, placeholder = "35", disabled = solved == "Years", help = "Time horizon")
         with col3:
-            annual_rate = st.number_input("Annual Growth Rate (%)", min_value = 0.00, value = None, step = 0.01, placeholder = "5.0", help = "Expected annual growth rate")
+            annual_rate = st.number_input("Annual Growth Rate (%)", min_value = 0.00, value = None, step = 0.01, placeholder = "5.0", disabled = solved == "Annual Growth Rate", help = "Expected annual growth rate")
             ter = st.number_input("TER (%)", min_value = 0.00, value = 0.00, step = 0.01, placeholder = "0.22", help = "Total Expense Ratio, from a given ETF. Use 0 otherwise.")
         with col4:
 
-            inflation = st.toggle("Account for inflation?", help = "This substracts an average 2% inflation to the annual rate provided.")
+            inflation = st.toggle("Account for inflation?", help = "This substracts the inflation rate below from the annual rate provided.")
+            inflation_rate = st.number_input("Inflation (%)", min_value = 0.00, value = 2.00, step = 0.10, disabled = not inflation, help = "Average annual inflation")
             
             log_y = st.toggle("Log scale?", help = "Log 10 scale the Y axis.")
             
-        variables_check = [principal, contribution, times_compounded, years, annual_rate, ter]
+        variables_check = [principal, times_compounded, ter]
+        variables_check += [value for name, value in (("Contribution", contribution), ("Years", years), ("Annual Growth Rate", annual_rate)) if name != solved]
+        variables_check += [target] if goal_seek else []
         
     if all(x is not None for x in variables_check):
-        amount = compound_interest(principal = principal, 
-                                   annual_rate = annual_rate, 
-                                   times_compounded = times_compounded, 
-                                   years = years, 
-                                   contribution = contribution,
-                                   ter = ter, 
-                                   inflation = inflation)        
+        if goal_seek:
+            # Solve the target and a range of targets around it in one vectorized call.
+            targets = np.append(target, np.linspace(target / 4, target * 4, 200))
+            with profiler.span("compute", section = "goal seek"):
+                if solved == "Contribution":
+                    solutions = solve_contribution(targets, principal = principal, annual_rate = annual_rate, times_compounded = times_compounded, years = years, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
+                elif solved == "Years":
+                    solutions = solve_years(targets, principal = principal, annual_rate = annual_rate, times_compounded = times_compounded, contribution = contribution, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
+                else:
+                    solutions = solve_rate(targets, principal = principal, times_compounded = times_compounded, years = years, contribution = contribution, ter = ter, inflation = inflation, inflation_rate = inflation_rate)
+
+            if np.isnan(solutions[0]):
+                st.warning(f"A total of {format_number(target)} € can not be reached by changing the {solved.lower()} alone.", icon = "⚠️")
+                return
+
+            # Project the solution: the years are rounded up to the first whole year at the target.
+            if solved == "Contribution":
+                contribution = float(solutions[0])
+                st.success(f"A contribution of **{format_number(contribution)} €** per period reaches {format_number(target)} € in {years} years.")
+            elif solved == "Years":
+                years = max(int(np.ceil(solutions[0] - 1e-9)), 1)
+                st.success(f"The total reaches {format_number(target)} € after **{solutions[0]:.1f} years**.")
+            else:
+                annual_rate = float(solutions[0])
+                st.success(f"An annual growth rate of **{annual_rate:.2f}%** reaches {format_number(target)} € in {years} years.")
+
+            with st.expander("**Goal curve**"):
+                st.line_chart(pd.DataFrame({"Target (€)": targets[1:], solved: solutions[1:]}), x = "Target (€)", y = solved)
+
+        with profiler.span("inputs", section = "schedule"), st.expander("**Contribution schedule**"):
+            col1, col2, col3 = st.columns(3, vertical_alignment = "center")
+            with col1:
+                contribution_raise = st.number_input("Yearly raise (%)", value = 0.00, step = 0.50, help = "Increase of the contribution every year, e.g. following your salary")
+            with col2:
+                pause = st.slider("Contribution pause (years)", min_value = 0, max_value = years, value = (0, 0), help = "Contributions stop between these two points in time, e.g. (10, 11) for a sabbatical during the 11th year")
+            with col3:
+                lump_sum = st.number_input("Lump sum (€)", min_value = 0, value = 0, step = 500, help = "One-off amount added to the investment")
+                lump_sum_year = st.number_input("Lump sum year", min_value = 1, max_value = years, value = 1, help = "Year at the end of which the lump sum is added")
+
+        parameters = dict(principal = principal,
+                          annual_rate = annual_rate,
+                          times_compounded = times_compounded,
+                          years = years,
+                          contribution = contribution,
+                          ter = ter,
+                          inflation = inflation,
+                          inflation_rate = inflation_rate)
+        presentation = dict(discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+        constant_contributions = contribution_raise == 0 and pause[0] == pause[1] and lump_sum == 0
+
+        try:
+            with profiler.span("compute"):
+                if constant_contributions:
+                    amount = cached_compound_interest(**parameters, as_frame = False)
+                else:
+                    # Evaluate the investment period by period.
+                    contributions = yearly_schedule(contribution * (1 + contribution_raise / 100) ** np.arange(years), times_compounded)
+                    contributions[pause[0] * times_compounded:pause[1] * times_compounded] = 0
+                    lump_sums = np.zeros(times_compounded * years)
+                    lump_sums[lump_sum_year * times_compounded - 1] = lump_sum
+                    amount = cached_schedule_interest(principal = principal,
+                                                      annual_rate = annual_rate,
+                                                      times_compounded = times_compounded,
+                                                      years = years,
+                                                      contribution = contributions,
+                                                      lump_sum = lump_sums,
+                                                      ter = ter,
+                                                      inflation_rate = inflation_rate if inflation else 0,
+                                                      as_frame = False)
+        except NegativeReturnError as error:
+            st.error(str(error))
+            return
         
-        p, p2 = plot_compound_interest(data = amount, discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+        with profiler.span("figure") as fields:
+            figures = st.session_state.compound_interest_figures
+            hits = prefetcher.hits
+            p, p2 = figures.render(data = dict(data = amount, compact = True), presentation = presentation)
+            fields["action"] = "prefetched" if prefetcher.hits > hits else figures.last_action
+        profiler.record_figure("bar", p)
+        profiler.record_figure("donut", p2)
         
         with st.container():
             col1, col2, col3 = st.columns([1, 1, 1], vertical_alignment = "center")
-            with col1: 
-                st.metric("Initial Investment", f"{format_number(principal)} €")
-                st.metric("Periodical contributions", f"{format_number(contribution * times_compounded * years)} €")
-            with col2: 
-                st.metric("Interest earned", f"{format_number(amount['Interest'].values.tolist()[-1])} €")
-                st.metric("Total earned", f"{format_number(amount['Total Show'].values.tolist()[-1])} €")
-            style_metric_cards(border_left_color = "black", box_shadow = False)
-
-            with col3: 
-                st.plotly_chart(p2, use_container_width=True)
-            st.plotly_chart(p, use_container_width=True)
+            with profiler.span("metrics"):
+                with col1: 
+                    st.metric("Initial Investment", f"{format_number(principal)} €")
+                    st.metric("Periodical contributions", f"{format_number(amount['Contributions'][-1])} €")
+                with col2: 
+                    st.metric("Interest earned", f"{format_number(amount['Interest'][-1])} €")
+                    st.metric("Total earned", f"{format_number(amount['Total Show'][-1])} €")
+                style_metric_cards(border_left_color = "black", box_shadow = False)
+
+            with profiler.span("render"):
+                with col3:
+                    st.plotly_chart(p2, use_container_width=True)
+                st.plotly_chart(p, use_container_width=True)
+
+        # Build the figures of the next step of the growth rate, years and contribution in the background.
+        # Their results are computed here: they take well under a millisecond each and land in the calculator cache.
+        if st.session_state.get("prefetch_toggle", False) and constant_contributions and not goal_seek:
+            with profiler.span("prefetch") as fields:
+                calls = []
+                for neighbour in neighbouring_inputs(parameters,
+                                                     steps = {"annual_rate": 0.01, "years": 1, "contribution": 50},
+                                                     limits = {"annual_rate": (0, None), "years": (1, None), "contribution": (0, None)}):
+                    try:
+                        calls.append(dict(data = cached_compound_interest(**neighbour, as_frame = False), compact = True, **presentation))
+                    except NegativeReturnError:
+                        continue
+                prefetcher.prefetch(calls)
+                fields.update(prefetcher.info())
+        else:
+            prefetcher.cancel()
+
+        with st.expander("**Sensitivity analysis**"):
+            col1, col2, col3 = st.columns(3, vertical_alignment = "center")
+            with col1:
+                rate_range = st.slider("Annual Growth Rate range (%)", min_value = 0.0, max_value = 20.0, value = (0.0, 10.0), step = 0.1, help = "Range of annual growth rates to compare")
+            with col2:
+                contribution_range = st.slider("Contribution range (€)", min_value = 0, max_value = 5000, value = (0, 1000), step = 50, help = "Range of recurrent contributions to compare")
+            with col3:
+                resolution = st.slider("Resolution", min_value = 10, max_value = 500, value = 200, step = 10, help = "Number of values evaluated along each axis")
+
+            rates = np.linspace(rate_range[0], rate_range[1], resolution)
+            contributions = np.linspace(contribution_range[0], contribution_range[1], resolution)
+            with profiler.span("compute", section = "sensitivity"):
+                grid = compound_interest_grid(principal = principal,
+                                              annual_rate = rates,
+                                              times_compounded = times_compounded,
+                                              years = years,
+                                              contribution = contributions,
+                                              ter = ter,
+                                              inflation = inflation,
+                                              inflation_rate = inflation_rate)
+
+            with profiler.span("figure", section = "sensitivity") as fields:
+                heatmap = st.session_state.compound_interest_heatmap
+                p3 = heatmap.render(data = dict(data = grid[:, 0, :, 0, 0], annual_rate = rates, contribution = contributions, compact = True),
+                                    presentation = dict(continuous_palette = st.session_state.continuous_palette, fontsize = fontsize))
+                fields["action"] = heatmap.last_action
+            profiler.record_figure("heatmap", p3, section = "sensitivity")
+
+            with profiler.span("render", section = "sensitivity"):
+                st.plotly_chart(p3, use_container_width=True)
 
 
     else:
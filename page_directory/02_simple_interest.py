@@ -4,7 +4,12 @@ import streamlit as st
 def main():
     discrete_palette = st.session_state.discrete_palette
     fontsize = st.session_state.fontsize
-    with st.expander("**Calculator inputs**", expanded = True):
+    profiler = st.session_state.profiler
+
+    # Keep the figure of the session, patched in place when only the log scale, palette or font size change.
+    if "simple_interest_figure" not in st.session_state:
+        st.session_state.simple_interest_figure = RetainedFigure(build = plot_simple_interest, restyle = restyle_simple_interest)
+    with profiler.span("inputs"), st.expander("**Calculator inputs**", expanded = True):
         col1, col2, col3, col4 = st.columns(4, vertical_alignment = "center")
         with col1: 
             principal = st.number_input("Initial investment (€)", min_value = 0, value = None, step = 50, placeholder = "1500", help = "Amount in Euros")
@@ -14,21 +19,31 @@ def main():
             annual_rate = st.number_input("Annual Growth Rate (%)", min_value = 0.00, value = None, step = 0.01, placeholder = "5.0", help = "Expected annual growth rate")
         with col4:
 
-            inflation = st.toggle("Account for inflation?", help = "This substracts an average 2% inflation to the annual rate provided.")
+            inflation = st.toggle("Account for inflation?", help = "This substracts the inflation rate below from the annual rate provided.")
+            inflation_rate = st.number_input("Inflation (%)", min_value = 0.00, value = 2.00, step = 0.10, disabled = not inflation, help = "Average annual inflation")
             
             log_y = st.toggle("Log scale?", help = "Log 10 scale the Y axis.")
             
         variables_check = [principal, years, annual_rate]
         
     if all(x is not None for x in variables_check):
-        amount = simple_interest(principal = principal, 
-                                 annual_rate = annual_rate, 
-                                 years = years, 
-                                 inflation = inflation)
+        with profiler.span("compute"):
+            amount = cached_simple_interest(principal = principal, 
+                                            annual_rate = annual_rate, 
+                                            years = years, 
+                                            inflation = inflation,
+                                            inflation_rate = inflation_rate,
+                                            as_frame = False)
         
-        p = plot_simple_interest(data = amount, discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize)
+        with profiler.span("figure") as fields:
+            figure = st.session_state.simple_interest_figure
+            p = figure.render(data = dict(data = amount, compact = True),
+                              presentation = dict(discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize))
+            fields["action"] = figure.last_action
+        profiler.record_figure("bar", p)
         
-        st.plotly_chart(p, use_container_width=True)
+        with profiler.span("render"):
+            st.plotly_chart(p, use_container_width=True)
     else:
         st.info('Please fill the **empty input fields**. Once done, the plot will **update automatically** every time you **modify** a value.', icon="🔜")
 
@@ -2,66 +2,133 @@ from FInCalc import *
 import streamlit as st
 import plotly.express as px
 import numpy as np
-import matplotlib.pyplot as plt
+import os
+from functools import partial
+from importlib.util import find_spec
 
-def main():
-    
+# Variance reduction of the normal sampler, by label.
+VARIANCE_REDUCTION = {"None": "none", "Antithetic": "antithetic", "Sobol": "sobol", "Control variates": "control_variate"}
 
-    # Simulation parameters
-    initial_savings = 100000  # Initial savings in dollars
-    annual_savings = 10000  # Annual savings in dollars
-    annual_expenses = 40000  # Annual expenses in retirement
-    annual_return = 0.07  # Expected annual return on investment
-    inflation_rate = 0.02  # Expected annual inflation rate
-    years_to_retirement = 20  # Years until retirement
-    years_in_retirement = 30  # Years in retirement
-    withdrawal_rate = 0.04  # Withdrawal rate in retirement
-    num_simulations = 1000  # Number of simulation runs
+# Sobol sampling needs SciPy, which is optional: the option is only offered when it is installed.
+SAMPLING_OPTIONS = [label for label, mode in VARIANCE_REDUCTION.items() if mode != "sobol" or find_spec("scipy") is not None]
 
-    # Function to simulate one scenario
-    def simulate_retirement():
-        # Simulate the savings accumulation phase
-        savings = initial_savings
-        for _ in range(years_to_retirement):
-            savings *= (1 + annual_return)
-            savings += annual_savings
+# Withdrawal rules of the retirement phase, by label.
+WITHDRAWAL_RULES = {"Constant": "constant", "Guardrails": "guardrails", "Floor and ceiling": "floor_ceiling"}
 
-        # Simulate the retirement phase
-        portfolio_values = []
-        for _ in range(years_in_retirement):
-            withdrawal = annual_expenses
-            withdrawal *= (1 + inflation_rate)  # Adjust for inflation
-            savings -= withdrawal
-            savings *= (1 + annual_return)
-            portfolio_values.append(savings)
+def main():
+    profiler = st.session_state.profiler
+    with profiler.span("inputs"), st.expander("**Simulation inputs**", expanded = True):
+        sampler = st.radio("Returns", ["Normal", "Historical"], horizontal = True, help = "Normal draws every year from the expected values and volatilities below. Historical resamples blocks of consecutive years of US stock returns and inflation since 1928, which captures crashes and runs of bad years.")
+        historical = sampler == "Historical"
+        col1, col2, col3, col4 = st.columns(4, vertical_alignment = "center")
+        with col1:
+            initial_savings = st.number_input("Initial savings (€)", min_value = 0, value = 100000, step = 1000, help = "Savings at the start of the simulation")
+            annual_savings = st.number_input("Annual savings (€)", min_value = 0, value = 10000, step = 500, help = "Amount saved every year until retirement")
+            annual_expenses = st.number_input("Annual expenses (€)", min_value = 0, value = 40000, step = 500, help = "Expenses in the first year of retirement, adjusted for inflation afterwards")
+            withdrawal_rate = st.number_input("Withdrawal rate (%)", min_value = 0.00, value = None, step = 0.10, placeholder = "4.0", help = "Share of the savings at retirement withdrawn in the first year, adjusted for inflation afterwards. Replaces the annual expenses when set.")
+            withdrawal_rule = WITHDRAWAL_RULES[st.selectbox("Withdrawal rule", list(WITHDRAWAL_RULES), help = "Constant keeps the first-year expenses, adjusted for inflation. Guardrails skips the inflation raise after a losing year, and cuts or raises the withdrawal when its share of the portfolio drifts too far from the initial one. Floor and ceiling withdraws the initial share of the current portfolio, bounded around the constant withdrawal.")]
+        with col2:
+            annual_return = st.number_input("Annual return (%)", min_value = -20.00, value = 7.00, step = 0.10, disabled = historical, help = "Expected annual return on investment")
+            return_volatility = st.number_input("Return volatility (%)", min_value = 0.00, value = 15.00, step = 0.50, disabled = historical, help = "Standard deviation of the annual return")
+            block_length = st.number_input("Block length (years)", min_value = 1, max_value = 30, value = 5, disabled = not historical, help = "Consecutive historical years drawn together")
+        with col3:
+            inflation_rate = st.number_input("Inflation (%)", min_value = -5.00, value = 2.00, step = 0.10, disabled = historical, help = "Expected annual inflation")
+            inflation_volatility = st.number_input("Inflation volatility (%)", min_value = 0.00, value = 1.00, step = 0.10, disabled = historical, help = "Standard deviation of the annual inflation")
+            if withdrawal_rule == "guardrails":
+                rule_parameters = {"guardrail": st.number_input("Guardrail (%)", min_value = 0.0, max_value = 100.0, value = 20.0, step = 5.0, help = "Drift of the withdrawal rate away from the initial one, relative to it, that triggers a cut or a raise"),
+                                   "adjustment": st.number_input("Adjustment (%)", min_value = 0.0, max_value = 100.0, value = 10.0, step = 1.0, help = "Size of the cuts and raises of the withdrawal")}
+            elif withdrawal_rule == "floor_ceiling":
+                floor = st.number_input("Floor (%)", min_value = 0.0, max_value = 100.0, value = 90.0, step = 5.0, help = "Lowest withdrawal, relative to the constant one")
+                rule_parameters = {"floor": floor,
+                                   "ceiling": st.number_input("Ceiling (%)", min_value = floor, value = max(125.0, floor), step = 5.0, help = "Highest withdrawal, relative to the constant one")}
+            else:
+                rule_parameters = None
+        with col4:
+            years_to_retirement = st.number_input("Years to retirement", min_value = 0, value = 20, help = "Years of the accumulation phase")
+            years_in_retirement = st.number_input("Years in retirement", min_value = 1, value = 30, help = "Years of the withdrawal phase")
+            num_simulations = st.number_input("Simulations", min_value = 100, max_value = 1000000, value = 10000, step = 1000, help = "Number of simulated paths")
+            seed = st.number_input("Seed", min_value = 0, value = 42, help = "Seed of the random number generator, for reproducible runs")
+            workers = st.number_input("Workers", min_value = 1, max_value = os.cpu_count() or 1, value = 1, help = "Processes used to run the simulations. Results do not depend on this value, except that paths shown and variance reduction need a single process.")
+            variance_reduction = VARIANCE_REDUCTION[st.selectbox("Sampling", SAMPLING_OPTIONS, disabled = historical or workers > 1 or num_simulations > 100000, help = "Variance reduction of the normal draws, for a tighter estimate of the probability of success with the same number of paths. Antithetic mirrors every path, Sobol spreads the draws evenly, control variates correct for the luck of the draws. Only available for single process runs of up to 100000 simulations.")]
+            show_paths = st.number_input("Paths shown", min_value = 0, max_value = 5000, value = 0, step = 100, disabled = workers > 1 or num_simulations > 100000, help = "Individual simulated paths drawn behind the percentile bands. Only available for single process runs of up to 100000 simulations.")
 
-        return portfolio_values
+    # Run simulations. Paths and variance reduction need every path in one process; other runs go through the
+    # block-seeded engine, whose results do not depend on the number of workers and whose memory does not grow
+    # with the number of paths.
+    variance_reduction = "none" if historical else variance_reduction
+    if workers == 1 and num_simulations <= 100000 and (show_paths > 0 or variance_reduction != "none"):
+        simulate = partial(cached_simulate_retirement, return_paths = show_paths > 0, variance_reduction = variance_reduction)
+    else:
+        simulate = partial(cached_simulate_retirement_parallel, workers = workers)
+    try:
+        with profiler.span("compute", simulations = num_simulations, workers = workers):
+            results = simulate(initial_savings = initial_savings,
+                               annual_savings = annual_savings,
+                               annual_expenses = annual_expenses,
+                               annual_return = annual_return,
+                               return_volatility = return_volatility,
+                               inflation_rate = inflation_rate,
+                               inflation_volatility = inflation_volatility,
+                               years_to_retirement = years_to_retirement,
+                               years_in_retirement = years_in_retirement,
+                               sampler = "bootstrap" if historical else "normal",
+                               block_length = block_length,
+                               withdrawal_rate = withdrawal_rate,
+                               withdrawal_rule = withdrawal_rule,
+                               rule_parameters = rule_parameters,
+                               num_simulations = num_simulations,
+                               seed = seed)
+    except ImportError as error:
+        st.error(str(error))
+        return
 
-    # Run simulations
-    all_simulations = []
-    for _ in range(num_simulations):
-        simulation_result = simulate_retirement()
-        all_simulations.append(simulation_result)
+    # Median over the failed paths only.
+    ruin_counts = np.cumsum(results["time_to_ruin_counts"])
 
-    # Calculate probabilities
-    success_count = sum(1 for simulation in all_simulations if simulation[-1] > 0)
-    success_probability = success_count / num_simulations
+    with profiler.span("metrics"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Probability of financial success", f"{results['success_probability']:.2%} ± {1.96 * results['standard_error']:.2%}", help = f"95% confidence interval, worth {results['effective_simulations']:,} independent paths.")
+        with col2:
+            st.metric("Median years until broke (failed paths)", f"{np.searchsorted(ruin_counts, ruin_counts[-1] / 2)}" if ruin_counts[-1] > 0 else "-")
 
     # Plot the results
-    plt.figure(figsize=(12, 6))
-    for simulation in all_simulations:
-        plt.plot(simulation, color='grey', alpha=0.1)
+    with profiler.span("figure"):
+        p = plot_retirement(percentiles = results["percentiles"],
+                            years_to_retirement = years_to_retirement,
+                            fontsize = st.session_state.fontsize,
+                            paths = results["paths"][:show_paths] if "paths" in results else None,
+                            compact = True)
+    profiler.record_figure("fan", p)
+
+    with profiler.span("render"):
+        st.plotly_chart(p, use_container_width=True)
+
+    with st.expander("**Safe withdrawal rate**"):
+        target_success = st.slider("Target probability of success (%)", min_value = 50, max_value = 99, value = 95, help = "Highest withdrawal rate that succeeds in at least this share of the simulations")
 
-    plt.axhline(0, color='red', linestyle='--', label='Broke Line')
-    plt.title('Monte Carlo Simulation of Retirement Portfolio')
-    plt.xlabel('Years in Retirement')
-    plt.ylabel('Portfolio Value ($)')
-    plt.legend()
-    plt.grid(True)
-    st.pyplot(plt)
+        # Every candidate rate is evaluated on the same paths, under the constant withdrawal rule. All paths are held in memory, so large runs are capped.
+        with profiler.span("compute", section = "safe withdrawal rate"):
+            search = cached_safe_withdrawal_rate(target_success = target_success,
+                                          initial_savings = initial_savings,
+                                          annual_savings = annual_savings,
+                                          annual_return = annual_return,
+                                          return_volatility = return_volatility,
+                                          inflation_rate = inflation_rate,
+                                          inflation_volatility = inflation_volatility,
+                                          years_to_retirement = years_to_retirement,
+                                          years_in_retirement = years_in_retirement,
+                                          sampler = "bootstrap" if historical else "normal",
+                                          block_length = block_length,
+                                          num_simulations = min(num_simulations, 100000),
+                                          seed = seed)
 
-    print(f"Probability of financial success: {success_probability:.2%}")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Safe withdrawal rate", f"{search['withdrawal_rate']:.2f}%")
+        with col2:
+            st.metric("First-year expenses (median savings)", f"{format_number(search['annual_expenses'])} €")
+        st.line_chart(search["success_curve"], x = "Withdrawal Rate", y = "Success Probability")
 
 if __name__ == "__page__":
     main()
-            
\ No newline at end of file
@@ -0,0 +1,99 @@
+from FInCalc import *
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+# Assets of a new session.
+DEFAULT_ASSETS = pd.DataFrame({"Asset": ["Stocks", "Bonds", "Cash"],
+                               "Weight (%)": [60.0, 30.0, 10.0],
+                               "Return (%)": [7.0, 3.0, 1.5],
+                               "Volatility (%)": [15.0, 6.0, 1.0],
+                               "TER (%)": [0.20, 0.15, 0.00]})
+DEFAULT_CORRELATION = [[1.0, 0.2, 0.0],
+                       [0.2, 1.0, 0.1],
+                       [0.0, 0.1, 1.0]]
+
+def main():
+    discrete_palette = st.session_state.discrete_palette
+    fontsize = st.session_state.fontsize
+    profiler = st.session_state.profiler
+
+    # Keep the figures of the session, patched in place when only the log scale, palette or font size change.
+    if "portfolio_figures" not in st.session_state:
+        st.session_state.portfolio_figures = RetainedFigure(build = plot_portfolio, restyle = restyle_portfolio)
+
+    with profiler.span("inputs"), st.expander("**Portfolio inputs**", expanded = True):
+        assets = st.data_editor(DEFAULT_ASSETS, num_rows = "dynamic", hide_index = True, use_container_width = True, key = "portfolio_assets")
+        assets = assets.dropna()
+        names = [str(name) for name in assets["Asset"]]
+
+        # Correlations default to the ones of the starting assets, and to none for added ones.
+        correlation = np.eye(len(names))
+        size = min(len(names), len(DEFAULT_CORRELATION))
+        correlation[:size, :size] = np.asarray(DEFAULT_CORRELATION)[:size, :size]
+        st.caption("Correlation of the annual returns")
+        correlation = st.data_editor(pd.DataFrame(correlation, index = names, columns = names), use_container_width = True,
+                                     key = f"portfolio_correlation_{'|'.join(names)}")
+
+        col1, col2, col3, col4 = st.columns(4, vertical_alignment = "center")
+        with col1:
+            initial_investment = st.number_input("Initial investment (€)", min_value = 0, value = 10000, step = 500, help = "Amount invested at the target weights at the start")
+            annual_contribution = st.number_input("Annual contribution (€)", min_value = 0, value = 1200, step = 100, help = "Amount invested at the target weights at the end of every year")
+        with col2:
+            years = st.number_input("Years", min_value = 1, max_value = 100, value = 40, help = "Time horizon")
+            log_y = st.toggle("Log scale?", help = "Log 10 scale the Y axis.")
+        with col3:
+            rebalancing = st.radio("Rebalancing", ["Periodic", "Threshold", "None"], horizontal = True, help = "Periodic sells and buys back to the target weights every few years. Threshold does so when a weight drifts too far from its target. None lets the weights drift.")
+            rebalance_every = st.number_input("Rebalance every (years)", min_value = 1, value = 1, disabled = rebalancing != "Periodic")
+            threshold = st.number_input("Threshold (pp)", min_value = 0.0, value = 5.0, step = 0.5, disabled = rebalancing != "Threshold", help = "Largest drift of a weight from its target, in percentage points")
+        with col4:
+            num_simulations = st.number_input("Simulations", min_value = 100, max_value = 200000, value = 50000, step = 1000, help = "Number of simulated paths")
+            seed = st.number_input("Seed", min_value = 0, value = 42, help = "Seed of the random number generator, for reproducible runs")
+
+    try:
+        with profiler.span("compute", simulations = num_simulations, assets = len(names)):
+            results = cached_simulate_portfolio(assets = names,
+                                                weights = assets["Weight (%)"].tolist(),
+                                                expected_returns = assets["Return (%)"].tolist(),
+                                                volatilities = assets["Volatility (%)"].tolist(),
+                                                correlation = correlation.to_numpy(),
+                                                ter = assets["TER (%)"].tolist(),
+                                                initial_investment = initial_investment,
+                                                annual_contribution = annual_contribution,
+                                                years = years,
+                                                rebalancing = rebalancing.lower(),
+                                                rebalance_every = rebalance_every,
+                                                threshold = threshold,
+                                                num_simulations = num_simulations,
+                                                seed = seed)
+    except ValueError as error:
+        st.error(str(error))
+        return
+
+    with profiler.span("metrics"):
+        final = results["percentiles"].iloc[-1]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Median final value", f"{format_number(final['P50'])} €")
+        with col2:
+            st.metric("5th - 95th percentile", f"{format_number(final['P5'])} - {format_number(final['P95'])} €")
+        with col3:
+            st.metric("Rebalancings per path", f"{results['rebalancings']:.1f}")
+
+    with profiler.span("figure") as fields:
+        figures = st.session_state.portfolio_figures
+        p, p2 = figures.render(data = dict(data = results["allocation"], compact = True),
+                               presentation = dict(discrete_palette = discrete_palette, log_y = log_y, fontsize = fontsize))
+        fields["action"] = figures.last_action
+    profiler.record_figure("bar", p)
+    profiler.record_figure("donut", p2)
+
+    with profiler.span("render"):
+        col1, col2 = st.columns([7, 3], vertical_alignment = "center")
+        with col1:
+            st.plotly_chart(p, use_container_width = True)
+        with col2:
+            st.plotly_chart(p2, use_container_width = True)
+
+if __name__ == "__page__":
+    main()